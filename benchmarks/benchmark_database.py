@@ -0,0 +1,72 @@
+"""
+Banco de dados descartável dos benchmarks.
+
+Os benchmarks criam tabelas e inserem milhares de linhas, por isso nunca usam
+DATABASE_URL, a configuração da pasta instance nem o arquivo .env. Por padrão
+rodam em SQLite em memória; para medir outro banco, informe explicitamente
+BENCHMARK_DATABASE_URL no ambiente:
+
+    BENCHMARK_DATABASE_URL=postgresql://localhost/benchmark python benchmarks/...
+
+No PostgreSQL as tabelas são criadas em um schema próprio, removido ao final.
+Em SQLite o arquivo informado não pode existir e é apagado ao final.
+
+Importe este módulo antes do pacote gerenciador_psicologia.
+"""
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+# Lido antes de importar a aplicação, cujo load_dotenv carrega o .env
+BENCHMARK_DATABASE_URL = os.environ.get('BENCHMARK_DATABASE_URL')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@contextmanager
+def benchmark_app():
+    """
+    Cria a aplicação sobre o banco do benchmark, com as tabelas do modelo, e
+    descarta as tabelas (ou o arquivo) ao sair. Entrega a aplicação com o
+    contexto ativo.
+    """
+    from gerenciador_psicologia.app import create_app
+    from gerenciador_psicologia.extensions import db
+
+    url = sa.engine.make_url(BENCHMARK_DATABASE_URL or 'sqlite:///:memory:')
+    backend = url.get_backend_name()
+    # O cache do dashboard fica desligado: o benchmark não invalida o da instância
+    config = {'SQLALCHEMY_DATABASE_URI': url.render_as_string(hide_password=False), 'DASHBOARD_CACHE_PATH': ''}
+    schema = None
+    database_file = None
+    if backend == 'postgresql':
+        # public continua no search_path para as extensões (pg_trgm, unaccent)
+        schema = f'benchmark_{uuid.uuid4().hex[:12]}'
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'options': f'-csearch_path={schema},public'}}
+    elif backend == 'sqlite':
+        if url.database not in (None, '', ':memory:'):
+            database_file = url.database
+            if os.path.exists(database_file):
+                sys.exit(f'O arquivo {database_file} já existe; o benchmark só roda em um banco novo.')
+    else:
+        sys.exit(f'BENCHMARK_DATABASE_URL deve apontar para PostgreSQL ou SQLite, não para {backend}.')
+
+    app = create_app(config)
+    with app.app_context():
+        if schema:
+            with db.engine.begin() as connection:
+                connection.execute(sa.schema.CreateSchema(schema))
+        try:
+            db.create_all()
+            yield app
+        finally:
+            db.session.remove()
+            if schema:
+                with db.engine.begin() as connection:
+                    connection.execute(sa.schema.DropSchema(schema, cascade=True))
+            db.engine.dispose()
+            if database_file and os.path.exists(database_file):
+                os.remove(database_file)
@@ -0,0 +1,71 @@
+"""
+Benchmark da busca de pacientes.
+
+Insere pacientes sintéticos e mede a busca por trecho do nome, e-mail ou
+telefone normalizados (índices pg_trgm no PostgreSQL, tabela FTS5 de
+trigramas no SQLite).
+Roda em um banco descartável: SQLite em memória ou o banco informado em
+BENCHMARK_DATABASE_URL (ver benchmark_database.py); DATABASE_URL e o .env
+são ignorados.
+
+Uso:
+    python benchmarks/patient_search.py [numero_de_pacientes]
+"""
+import sys
+import time
+from datetime import date
+
+from benchmark_database import benchmark_app
+
+import sqlalchemy as sa
+
+from gerenciador_psicologia.extensions import db
+from gerenciador_psicologia.models import Patient
+from gerenciador_psicologia.normalization import normalize_phone, normalize_text
+from gerenciador_psicologia.services import patient_service
+
+FIRST_NAMES = ('Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Fábio', 'Gabriela', 'Heitor', 'Isabela', 'João')
+LAST_NAMES = ('Silva', 'Souza', 'Oliveira', 'Santos', 'Pereira', 'Lima', 'Carvalho', 'Ribeiro', 'Almeida', 'Costa')
+TERMS = ('Gabriela', 'fabio', 'lima.123', 'Benchmark 4242', '9123-45', 'xyz')
+
+
+def measure(term, repeat=20):
+    """Retorna o número de resultados e a duração média, em ms, de uma busca."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        count = len(patient_service.search_patients(Patient.query, term).limit(50).all())
+    return count, (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with benchmark_app():
+        rows = []
+        for index in range(patients):
+            first = FIRST_NAMES[index % len(FIRST_NAMES)]
+            last = LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]
+            name = f'{first} {last} Benchmark {index}'
+            email = f'{last.lower()}.{index}@example.com'
+            phone = f'(11) 9{index:04d}-{index % 10000:04d}'
+            # Inserção em lote não dispara os eventos do modelo: normaliza aqui
+            rows.append({
+                'name': name,
+                'email': email,
+                'phone': phone,
+                'name_normalized': normalize_text(name),
+                'email_normalized': normalize_text(email),
+                'phone_normalized': normalize_phone(phone),
+                'birth_date': date(1990, 1, 1),
+                'is_active': True
+            })
+        db.session.execute(sa.insert(Patient.__table__), rows)
+        db.session.commit()
+
+        print(f'{db.engine.dialect.name}: {patients} pacientes')
+        for term in TERMS:
+            count, elapsed = measure(term)
+            print(f'  {term!r:18} {elapsed:8.2f} ms ({count} resultados)')
+
+
+if __name__ == '__main__':
+    main()
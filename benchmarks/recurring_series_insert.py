@@ -0,0 +1,94 @@
+"""
+Benchmark da criação de séries recorrentes materializadas.
+
+Compara o caminho antigo (um db.session.add por ocorrência) com a inserção
+em lote usada por appointment_service, medindo a latência por série de 52
+ocorrências. Roda em um banco descartável: SQLite em memória ou o banco
+informado em BENCHMARK_DATABASE_URL, em um schema próprio removido ao final
+(ver benchmark_database.py); DATABASE_URL e o .env são ignorados.
+
+Uso:
+    python benchmarks/recurring_series_insert.py [numero_de_series]
+"""
+import sys
+import time
+from datetime import date, datetime
+
+from benchmark_database import benchmark_app
+
+from gerenciador_psicologia.extensions import db
+from gerenciador_psicologia.models import Appointment, Patient
+from gerenciador_psicologia.services import appointment_service, recurrence
+
+OCCURRENCES = 52
+
+
+def create_series_row_by_row(patient_id, appointment_date):
+    """Caminho anterior: flush da consulta principal e um add por ocorrência."""
+    parent = Appointment(
+        patient_id=patient_id,
+        date=appointment_date,
+        value=150,
+        notes='',
+        status='Agendada',
+        is_recurring=True,
+        recurrence_frequency='weekly',
+        recurrence_day=appointment_date.weekday(),
+    )
+    db.session.add(parent)
+    db.session.flush()
+    for next_date in recurrence.iter_occurrences(appointment_date, 'weekly', limit=OCCURRENCES):
+        db.session.add(Appointment(
+            patient_id=patient_id,
+            date=next_date,
+            value=150,
+            notes='',
+            status='Agendada',
+            parent_appointment_id=parent.id,
+        ))
+    db.session.commit()
+
+
+def create_series_bulk(patient_id, appointment_date):
+    """Caminho atual: consulta principal e uma única inserção em lote."""
+    appointment_service._create_recurring_appointments(
+        patient_id=patient_id,
+        appointment_date=appointment_date,
+        value=150,
+        notes='',
+        is_recurring=True,
+        recurrence_frequency='weekly',
+        recurrence_until=None,
+    )
+    db.session.commit()
+
+
+def measure(create_series, patient_id, runs):
+    """Retorna a latência média, em milissegundos, por série criada."""
+    elapsed = 0.0
+    for run in range(runs):
+        appointment_date = datetime(2025, 1, 6, 8 + run % 10, 0)
+        started = time.perf_counter()
+        create_series(patient_id, appointment_date)
+        elapsed += time.perf_counter() - started
+    return elapsed / runs * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with benchmark_app():
+        patient = Patient(name='Benchmark', email='benchmark@example.com',
+                          phone='0', birth_date=date(1990, 1, 1))
+        db.session.add(patient)
+        db.session.commit()
+
+        row_by_row = measure(create_series_row_by_row, patient.id, runs)
+        bulk = measure(create_series_bulk, patient.id, runs)
+
+        print(f'{db.engine.dialect.name}: {runs} séries de {OCCURRENCES + 1} consultas')
+        print(f'  um add por ocorrência: {row_by_row:8.2f} ms/série')
+        print(f'  inserção em lote:      {bulk:8.2f} ms/série')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark da importação de extratos bancários.
+
+Gera um extrato CSV sintético e mede a pré-visualização e a importação em
+lote (COPY no PostgreSQL, executemany nos demais bancos), além da
+reimportação do mesmo arquivo, em que todas as linhas são duplicadas.
+Roda em um banco descartável: SQLite em memória ou o banco informado em
+BENCHMARK_DATABASE_URL (ver benchmark_database.py); DATABASE_URL e o .env
+são ignorados.
+
+Uso:
+    python benchmarks/statement_import.py [numero_de_linhas]
+"""
+import io
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmark_database import benchmark_app
+
+from gerenciador_psicologia.extensions import db
+from gerenciador_psicologia.services import statement_import
+
+
+def build_statement(lines):
+    """Gera um extrato CSV com créditos e débitos alternados."""
+    rows = ['Data;Descrição;Valor']
+    for index in range(lines):
+        day = date(2024, 1, 1) + timedelta(days=index % 365)
+        sign = '-' if index % 3 else ''
+        rows.append(f'{day:%d/%m/%Y};Lançamento benchmark {index};{sign}{index % 500 + 1},25')
+    return ('\n'.join(rows) + '\n').encode('utf-8')
+
+
+def measure(statement, dry_run):
+    """Retorna o resumo e a duração, em segundos, de uma importação."""
+    started = time.perf_counter()
+    summary = statement_import.import_statement(io.BytesIO(statement), 'csv', dry_run=dry_run)
+    return summary, time.perf_counter() - started
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with benchmark_app():
+        statement = build_statement(lines)
+        _, preview = measure(statement, dry_run=True)
+        summary, first = measure(statement, dry_run=False)
+        again, second = measure(statement, dry_run=False)
+
+        print(f'{db.engine.dialect.name}: extrato de {lines} linhas')
+        print(f'  pré-visualização: {preview:8.2f} s')
+        print(f'  importação:       {first:8.2f} s ({summary["new"]} novas)')
+        print(f'  reimportação:     {second:8.2f} s ({again["duplicates"]} duplicadas)')
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,28 @@ def create_app(test_config=None):
         SECRET_KEY=os.environ.get("SESSION_SECRET", "dev_secret_key"),
         SQLALCHEMY_DATABASE_URI=os.environ.get("DATABASE_URL"),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # 'materialized' grava cada ocorrência das séries; 'rule' grava apenas a regra e as exceções
+        APPOINTMENT_RECURRENCE_MODE=os.environ.get("APPOINTMENT_RECURRENCE_MODE", "materialized"),
+        # Intervalos do calendário acima deste número de dias são enviados em streaming
+        CALENDAR_STREAM_MIN_DAYS=int(os.environ.get("CALENDAR_STREAM_MIN_DAYS", 62)),
+        # Tempo máximo, em segundos, que uma resposta do feed do calendário fica em memória
+        CALENDAR_CACHE_SECONDS=int(os.environ.get("CALENDAR_CACHE_SECONDS", 60)),
+        # Expediente usado na busca de horários livres (dias: 0 = segunda ... 6 = domingo)
+        WORKING_HOURS_START=os.environ.get("WORKING_HOURS_START", "08:00"),
+        WORKING_HOURS_END=os.environ.get("WORKING_HOURS_END", "19:00"),
+        WORKING_DAYS=tuple(int(day) for day in os.environ.get("WORKING_DAYS", "0,1,2,3,4").split(",")),
+        AVAILABILITY_SLOT_MINUTES=int(os.environ.get("AVAILABILITY_SLOT_MINUTES", 30)),
+        # Tempo máximo, em segundos, que a ocupação de um dia fica em memória
+        AVAILABILITY_CACHE_SECONDS=int(os.environ.get("AVAILABILITY_CACHE_SECONDS", 60)),
+        # Número de sugestões do autocompletar de pacientes e tempo máximo, em segundos, que ficam em memória
+        PATIENT_AUTOCOMPLETE_LIMIT=int(os.environ.get("PATIENT_AUTOCOMPLETE_LIMIT", 10)),
+        PATIENT_AUTOCOMPLETE_CACHE_SECONDS=int(os.environ.get("PATIENT_AUTOCOMPLETE_CACHE_SECONDS", 60)),
+        # Meses projetados pela previsão de receita das séries recorrentes no dashboard (3 a 24)
+        FORECAST_MONTHS=int(os.environ.get("FORECAST_MONTHS", 6)),
+        # Arquivo SQLite do cache do dashboard compartilhado entre os workers (padrão: pasta instance)
+        DASHBOARD_CACHE_PATH=os.environ.get("DASHBOARD_CACHE_PATH"),
+        # Nos testes, falha qualquer requisição que execute mais instruções SQL que este limite
+        SQL_STATEMENT_LIMIT=None,
     )
 
     if test_config is None:
@@ -32,6 +54,29 @@ def create_app(test_config=None):
     db.init_app(app)
     Migrate(app, db)
 
+    from .statement_guard import init_statement_guard
+    init_statement_guard(app)
+
+    # Cache das respostas do feed do calendário, invalidado pelas escritas em consultas
+    from .services.calendar_cache import CalendarCache
+    app.extensions['calendar_cache'] = CalendarCache(max_age=app.config['CALENDAR_CACHE_SECONDS'])
+
+    # Ocupação por dia usada na busca de horários livres, invalidada pelas mesmas escritas
+    from .services.availability import OccupancyIndex
+    app.extensions['occupancy_index'] = OccupancyIndex(max_age=app.config['AVAILABILITY_CACHE_SECONDS'])
+
+    # Sugestões do autocompletar de pacientes, invalidadas pelas escritas em pacientes
+    from .services.autocomplete_cache import AutocompleteCache
+    app.extensions['autocomplete_cache'] = AutocompleteCache(max_age=app.config['PATIENT_AUTOCOMPLETE_CACHE_SECONDS'])
+
+    # Contexto do dashboard por mês, compartilhado entre os workers e invalidado pela versão dos dados financeiros.
+    # Nos testes só é usado quando DASHBOARD_CACHE_PATH é informado; o arquivo é criado no primeiro acesso ao dashboard.
+    from .services.dashboard_cache import DashboardCache
+    dashboard_cache_path = app.config['DASHBOARD_CACHE_PATH']
+    if dashboard_cache_path is None and not app.testing:
+        dashboard_cache_path = os.path.join(app.instance_path, 'dashboard_cache.sqlite3')
+    app.extensions['dashboard_cache'] = DashboardCache(dashboard_cache_path)
+
     # Importa e registra os Blueprints
     from .routes import patients, appointments, financial, dashboard
     from . import main
@@ -44,5 +89,10 @@ def create_app(test_config=None):
 
     # Importa os modelos para que o Flask-Migrate os reconheça
     from . import models
+    # Registra os eventos que mantêm o resumo financeiro mensal
+    from .services import financial_rollup
+
+    from .commands import register_commands
+    register_commands(app)
 
     return app
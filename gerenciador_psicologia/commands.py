@@ -0,0 +1,64 @@
+"""
+Comandos de manutenção disponíveis no Flask CLI.
+"""
+import click
+from flask.cli import with_appcontext
+
+@click.command('rebuild-financial-rollup')
+@with_appcontext
+def rebuild_financial_rollup_command():
+    """Recalcula a tabela monthly_financial_rollup a partir dos pagamentos."""
+    from .services import financial_rollup
+    from .services.dashboard_cache import bump_financial_version
+    rows = financial_rollup.rebuild_rollup()
+    bump_financial_version()
+    click.echo(f'Resumo financeiro mensal reconstruído: {rows} linha(s).')
+
+@click.command('rebuild-patient-search')
+@with_appcontext
+def rebuild_patient_search_command():
+    """Reconstrói o índice de busca de pacientes (tabela FTS5 no SQLite)."""
+    from .services import patient_service
+    patient_service.rebuild_search_index()
+    click.echo('Índice de busca de pacientes reconstruído.')
+
+@click.command('rebuild-patient-summary')
+@with_appcontext
+def rebuild_patient_summary_command():
+    """Recalcula a tabela patient_summary a partir das consultas e pagamentos."""
+    from .services import patient_summary
+    rows = patient_summary.rebuild_summaries()
+    click.echo(f'Resumo dos pacientes reconstruído: {rows} linha(s).')
+
+@click.command('refresh-patient-summary')
+@with_appcontext
+def refresh_patient_summary_command():
+    """Atualiza os resumos de pacientes cuja próxima sessão já começou ou cujo mês terminou (agendar no cron)."""
+    from .services import patient_summary
+    rows = patient_summary.refresh_stale_summaries()
+    click.echo(f'Resumo dos pacientes atualizado: {rows} paciente(s).')
+
+@click.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Apenas mostra o que seria importado.')
+@with_appcontext
+def import_statement_command(path, dry_run):
+    """Importa um extrato bancário (CSV ou OFX) como registros financeiros."""
+    from .services import statement_import
+    with open(path, 'rb') as stream:
+        summary = statement_import.import_statement(stream, statement_import.detect_format(path), dry_run=dry_run)
+    prefix = 'Pré-visualização' if dry_run else 'Extrato importado'
+    click.echo(
+        f"{prefix}: {summary['lines']} linha(s), {summary['new']} nova(s), "
+        f"{summary['duplicates']} já importada(s)."
+    )
+
+def register_commands(app):
+    """
+    Registra os comandos de manutenção na aplicação.
+    """
+    app.cli.add_command(rebuild_financial_rollup_command)
+    app.cli.add_command(import_statement_command)
+    app.cli.add_command(rebuild_patient_search_command)
+    app.cli.add_command(rebuild_patient_summary_command)
+    app.cli.add_command(refresh_patient_summary_command)
@@ -0,0 +1,36 @@
+from sqlalchemy.orm import joinedload
+from .models import Appointment, Patient, Payment
+
+def _payment_with_patient():
+    return (joinedload(Payment.patient).load_only(Patient.name),)
+
+def _appointment_with_patient():
+    return (joinedload(Appointment.patient).load_only(Patient.name),)
+
+# Named loading profiles: the loader options each page needs to render
+# without lazy loads. Built on demand because the backrefs used here only
+# exist once the mappers are configured. List pages and exports select plain
+# rows with the patient name joined in the same statement, so they need none.
+LOADING_PROFILES = {
+    'payment_detail': _payment_with_patient,
+    'appointment_detail': _appointment_with_patient,
+}
+
+def loading_options(profile):
+    """
+    Returns the loader options of a named profile (none for None).
+    Raises ValueError for unknown profiles.
+    """
+    if profile is None:
+        return ()
+    try:
+        return LOADING_PROFILES[profile]()
+    except KeyError:
+        raise ValueError(f'Perfil de carregamento desconhecido: {profile}') from None
+
+def apply_profile(query, profile):
+    """
+    Applies the loader options of a named profile to an ORM query or select.
+    """
+    options = loading_options(profile)
+    return query.options(*options) if options else query
@@ -1,35 +1,29 @@
-from flask import Blueprint, render_template, request
-from .models import Patient
+from flask import Blueprint, abort, render_template, request
+from .services import patient_service
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
 def index():
     """
-    Rota principal que lista pacientes.
+    Rota principal que lista pacientes, paginada por nome.
     Por padrão, exibe apenas pacientes ativos.
     Permite busca e visualização de inativos.
     """
-    search = request.args.get('search', '').lower()
+    search = request.args.get('search', '').strip()
     show_inactive = request.args.get('show_inactive', 'false').lower() == 'true'
+    active_filter = 'inactive' if show_inactive else 'active'
 
-    query = Patient.query
-
-    if show_inactive:
-        query = query.filter(Patient.is_active == False)
-        active_filter = 'inactive'
-    else:
-        query = query.filter(Patient.is_active == True)
-        active_filter = 'active'
-
-    if search:
-        query = query.filter(
-            (Patient.name.ilike(f'%{search}%')) |
-            (Patient.email.ilike(f'%{search}%'))
+    # Apenas as colunas exibidas, uma página por vez (cursor em nome e id);
+    # na busca, os resultados mais relevantes
+    try:
+        page = patient_service.get_patients_page(
+            active=not show_inactive,
+            search=search,
+            after=request.args.get('after'),
+            before=request.args.get('before')
         )
+    except ValueError:
+        abort(400)
 
-    # Otimização: Usar 'joinedload' para evitar o problema N+1
-    # Esta será implementada na refatoração do modelo.
-    patients = query.order_by(Patient.name).all()
-    
-    return render_template('patients/list.html', patients=patients, active_filter=active_filter)
+    return render_template('patients/list.html', patients=page['items'], page=page, active_filter=active_filter)
@@ -1,8 +1,12 @@
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import sqlalchemy as sa
 from .extensions import db
+from .normalization import normalize_phone, normalize_text
 import enum
 
+# Duração padrão de uma consulta, em minutos
+DEFAULT_APPOINTMENT_DURATION = 60
+
 class Patient(db.Model):
     """
     Modelo representando um paciente no sistema.
@@ -14,6 +18,9 @@ class Patient(db.Model):
         phone: Número de telefone do paciente
         birth_date: Data de nascimento
         notes: Observações gerais sobre o paciente
+        name_normalized: Nome sem acentos e em minúsculas, usado na busca
+        email_normalized: Email sem acentos e em minúsculas, usado na busca
+        phone_normalized: Apenas os dígitos do telefone, usado na busca
         created_at: Data de criação do registro
         updated_at: Data da última atualização
     """
@@ -24,15 +31,68 @@ class Patient(db.Model):
     birth_date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    name_normalized = db.Column(db.String(100), nullable=False)
+    email_normalized = db.Column(db.String(120), nullable=False)
+    phone_normalized = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, server_default=sa.func.now())
     updated_at = db.Column(db.DateTime, server_default=sa.func.now(), onupdate=sa.func.now())
 
     appointments = db.relationship('Appointment', backref='patient', lazy='dynamic', cascade="all, delete-orphan")
     payments = db.relationship('Payment', backref='patient', lazy='dynamic', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Busca por trecho do nome, email ou telefone normalizados: trigramas
+        # (pg_trgm) no Postgres, tabela FTS5 patient_search (abaixo) no SQLite
+        db.Index('ix_patient_name_normalized_trgm', 'name_normalized', postgresql_using='gin',
+                 postgresql_ops={'name_normalized': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_patient_email_normalized_trgm', 'email_normalized', postgresql_using='gin',
+                 postgresql_ops={'email_normalized': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_patient_phone_normalized_trgm', 'phone_normalized', postgresql_using='gin',
+                 postgresql_ops={'phone_normalized': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        # Busca por prefixo do nome normalizado
+        db.Index('ix_patient_name_normalized', 'name_normalized',
+                 postgresql_ops={'name_normalized': 'varchar_pattern_ops'}),
+        # Listagem paginada por (nome, id) dos pacientes ativos ou inativos
+        db.Index('ix_patient_is_active_name_id', 'is_active', 'name', 'id'),
+    )
+
     def __repr__(self):
         return f'<Patient {self.name}>'
 
+@sa.event.listens_for(Patient, 'before_insert')
+@sa.event.listens_for(Patient, 'before_update')
+def _set_patient_normalized_fields(mapper, connection, target):
+    """Mantém as colunas normalizadas de busca sincronizadas com nome, email e telefone."""
+    target.name_normalized = normalize_text(target.name)
+    target.email_normalized = normalize_text(target.email)
+    target.phone_normalized = normalize_phone(target.phone)
+
+# Tabela FTS5 com tokenizador de trigramas sobre as colunas normalizadas,
+# sincronizada com patient por triggers (SQLite)
+PATIENT_SEARCH_COLUMNS = 'name_normalized, email_normalized, phone_normalized'
+PATIENT_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5("
+    f"{PATIENT_SEARCH_COLUMNS}, content='patient', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS patient_search_insert AFTER INSERT ON patient BEGIN "
+    f"INSERT INTO patient_search (rowid, {PATIENT_SEARCH_COLUMNS}) "
+    "VALUES (new.id, new.name_normalized, new.email_normalized, new.phone_normalized); END",
+    "CREATE TRIGGER IF NOT EXISTS patient_search_delete AFTER DELETE ON patient BEGIN "
+    f"INSERT INTO patient_search (patient_search, rowid, {PATIENT_SEARCH_COLUMNS}) "
+    "VALUES ('delete', old.id, old.name_normalized, old.email_normalized, old.phone_normalized); END",
+    f"CREATE TRIGGER IF NOT EXISTS patient_search_update AFTER UPDATE OF {PATIENT_SEARCH_COLUMNS} ON patient BEGIN "
+    f"INSERT INTO patient_search (patient_search, rowid, {PATIENT_SEARCH_COLUMNS}) "
+    "VALUES ('delete', old.id, old.name_normalized, old.email_normalized, old.phone_normalized); "
+    f"INSERT INTO patient_search (rowid, {PATIENT_SEARCH_COLUMNS}) "
+    "VALUES (new.id, new.name_normalized, new.email_normalized, new.phone_normalized); END",
+)
+
+sa.event.listen(Patient.__table__, 'before_create',
+                sa.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+for _statement in PATIENT_SEARCH_DDL:
+    sa.event.listen(Patient.__table__, 'after_create', sa.DDL(_statement).execute_if(dialect='sqlite'))
+sa.event.listen(Patient.__table__, 'before_drop',
+                sa.DDL('DROP TABLE IF EXISTS patient_search').execute_if(dialect='sqlite'))
+
 class Appointment(db.Model):
     """
     Modelo representando uma consulta no sistema.
@@ -41,6 +101,9 @@ class Appointment(db.Model):
         id: Identificador único da consulta
         patient_id: ID do paciente relacionado
         date: Data e hora da consulta
+        duration: Duração da consulta em minutos
+        end_date: Data e hora de término (date + duration), usada na detecção de conflitos
+        month_bucket: Primeiro dia do mês da consulta, usado nos agrupamentos mensais
         status: Status atual (scheduled, completed, cancelled)
         value: Valor da consulta
         notes: Observações sobre a consulta
@@ -48,11 +111,17 @@ class Appointment(db.Model):
         recurrence_frequency: Frequência da recorrência (weekly, biweekly, monthly)
         recurrence_day: Dia da semana para recorrência (0-6)
         recurrence_until: Data final da recorrência
+        recurrence_mode: 'rule' quando as ocorrências da série são expandidas a partir da regra
         parent_appointment_id: ID da consulta pai (para séries recorrentes)
+        original_date: Data original da ocorrência substituída (linhas de exceção)
+        is_cancelled: Indica uma ocorrência cancelada de uma série baseada em regra
     """
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False, index=True)
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_APPOINTMENT_DURATION, server_default=str(DEFAULT_APPOINTMENT_DURATION))
+    end_date = db.Column(db.DateTime, nullable=False)
+    month_bucket = db.Column(db.Date, nullable=False)
     status = db.Column(db.Enum('Agendada', 'Realizada', 'Paga', name='appointment_status_v2'), nullable=False, default='Agendada')
     value = db.Column(db.Numeric(10, 2), nullable=False)
     notes = db.Column(db.Text)
@@ -63,7 +132,10 @@ class Appointment(db.Model):
     recurrence_frequency = db.Column(db.String(20))
     recurrence_day = db.Column(db.Integer)
     recurrence_until = db.Column(db.Date)
+    recurrence_mode = db.Column(db.String(20))
     parent_appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=True)
+    original_date = db.Column(db.DateTime)
+    is_cancelled = db.Column(db.Boolean, default=False, server_default=sa.false(), nullable=False)
 
     recurring_appointments = db.relationship(
         'Appointment',
@@ -71,9 +143,35 @@ class Appointment(db.Model):
         lazy=True
     )
 
+    __table_args__ = (
+        db.Index('ix_appointment_parent_original_date', 'parent_appointment_id', 'original_date', unique=True),
+        # Consultas de intervalo: GiST sobre tsrange no Postgres, índice composto nos demais bancos
+        db.Index('ix_appointment_date_end_date', 'date', 'end_date'),
+        # Filtros da agenda por paciente e por status dentro de um intervalo de datas
+        db.Index('ix_appointment_patient_id_date', 'patient_id', 'date'),
+        db.Index('ix_appointment_status_date', 'status', 'date'),
+        # Agrupamentos mensais dos gráficos
+        db.Index('ix_appointment_status_month_bucket', 'status', 'month_bucket'),
+        db.Index(
+            'ix_appointment_period',
+            sa.func.tsrange(sa.column('date'), sa.column('end_date')),
+            postgresql_using='gist',
+            postgresql_where=sa.text('is_cancelled = false')
+        ).ddl_if(dialect='postgresql'),
+    )
+
     def __repr__(self):
         return f'<Appointment {self.date} - Patient {self.patient_id}>'
 
+@sa.event.listens_for(Appointment, 'before_insert')
+@sa.event.listens_for(Appointment, 'before_update')
+def _set_appointment_end_date(mapper, connection, target):
+    """Mantém end_date e month_bucket sincronizados com date e duration."""
+    if target.duration is None:
+        target.duration = DEFAULT_APPOINTMENT_DURATION
+    target.end_date = target.date + timedelta(minutes=target.duration)
+    target.month_bucket = target.date.date().replace(day=1)
+
 class Payment(db.Model):
     """
     Modelo representando um pagamento no sistema.
@@ -84,16 +182,85 @@ class Payment(db.Model):
         date: Data e hora do pagamento
         value: Valor do pagamento
         notes: Observações sobre o pagamento
+        month_bucket: Primeiro dia do mês do pagamento, usado nos agrupamentos mensais
+        import_fingerprint: Impressão digital da linha do extrato bancário importado (evita duplicatas)
         created_at: Data de criação do registro
     """
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=True, index=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=True, index=True)
-    date = db.Column(db.Date, nullable=False, server_default=sa.func.current_date())
-    value = db.Column(db.Numeric(10, 2), nullable=False)
+    # active_history carrega o valor anterior ao alterar o atributo, usado no resumo mensal
+    date = db.column_property(db.Column(db.Date, nullable=False, server_default=sa.func.current_date()), active_history=True)
+    value = db.column_property(db.Column(db.Numeric(10, 2), nullable=False), active_history=True)
     notes = db.Column(db.Text())
-    payment_type = db.Column(db.String(20), nullable=False, default='income')  # 'income' or 'expense'
+    payment_type = db.column_property(db.Column(db.String(20), nullable=False, default='income'), active_history=True)  # 'income' or 'expense'
+    month_bucket = db.Column(db.Date, nullable=False)
+    import_fingerprint = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, server_default=sa.func.now())
 
+    __table_args__ = (
+        db.Index('ix_payment_month_bucket_payment_type', 'month_bucket', 'payment_type'),
+        db.Index('ix_payment_date_id', 'date', 'id'),
+        db.UniqueConstraint('import_fingerprint', name='uq_payment_import_fingerprint'),
+    )
+
     def __repr__(self):
         return f'<Payment {self.date} - {self.value}>'
+
+@sa.event.listens_for(Payment, 'before_insert')
+@sa.event.listens_for(Payment, 'before_update')
+def _set_payment_month_bucket(mapper, connection, target):
+    """Mantém month_bucket sincronizado com date."""
+    if target.date is None:
+        target.date = date.today()
+    elif isinstance(target.date, datetime):
+        target.date = target.date.date()
+    target.month_bucket = target.date.replace(day=1)
+
+class MonthlyFinancialRollup(db.Model):
+    """
+    Totais mensais de pagamentos por tipo, mantidos incrementalmente a cada
+    escrita em Payment (ver services/financial_rollup.py).
+
+    Attributes:
+        month: Primeiro dia do mês
+        payment_type: Tipo dos pagamentos ('income' ou 'expense')
+        total: Soma dos valores dos pagamentos do mês
+        payment_count: Quantidade de pagamentos do mês
+    """
+    __tablename__ = 'monthly_financial_rollup'
+
+    month = db.Column(db.Date, primary_key=True)
+    payment_type = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+    payment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<MonthlyFinancialRollup {self.month} {self.payment_type} - {self.total}>'
+
+class PatientSummary(db.Model):
+    """
+    Resumo de cada paciente exibido na listagem, recalculado pelos serviços
+    que escrevem em Appointment e Payment (ver services/patient_summary.py).
+    A próxima sessão e as sessões do mês envelhecem com o tempo e são
+    recalculadas pelo comando agendado `flask refresh-patient-summary`.
+
+    Attributes:
+        patient_id: ID do paciente
+        last_session: Data da última sessão realizada ou paga
+        next_session: Data da próxima sessão no momento do cálculo
+        month: Mês a que se refere sessions_this_month
+        sessions_this_month: Quantidade de sessões do mês
+        open_balance: Soma das sessões realizadas sem pagamento vinculado
+    """
+    __tablename__ = 'patient_summary'
+
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'), primary_key=True)
+    last_session = db.Column(db.DateTime, nullable=True)
+    next_session = db.Column(db.DateTime, nullable=True, index=True)
+    month = db.Column(db.Date, nullable=False, index=True)
+    sessions_this_month = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    open_balance = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<PatientSummary {self.patient_id}>'
@@ -0,0 +1,22 @@
+import re
+import unicodedata
+
+NON_DIGITS = re.compile(r'\D')
+
+def normalize_text(text):
+    """
+    Returns the search form of a text: accents removed, lowercased and
+    with runs of whitespace collapsed ('  João  Conceição' -> 'joao conceicao').
+    """
+    if text is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+def normalize_phone(phone):
+    """
+    Returns the digits of a phone number ('(11) 98765-4321' -> '11987654321').
+    """
+    if phone is None:
+        return None
+    return NON_DIGITS.sub('', phone)
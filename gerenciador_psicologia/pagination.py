@@ -0,0 +1,59 @@
+from .extensions import db
+
+def encode_cursor(value, row_id):
+    """
+    Encodes the (value, id) sort key of a row as an opaque page cursor.
+    """
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return f'{value}_{row_id}'
+
+def parse_cursor(cursor, parse_value):
+    """
+    Parses a page cursor back into a (value, id) pair, converting the value
+    with `parse_value`. Raises ValueError for malformed cursors.
+    """
+    value, _, row_id = cursor.rpartition('_')
+    if not value:
+        raise ValueError('Cursor de paginação inválido.')
+    return parse_value(value), int(row_id)
+
+def fetch_keyset_page(query, value_column, id_column, parse_value, after=None, before=None,
+                      limit=50, descending=False):
+    """
+    Runs one page of a query ordered by (value_column, id_column).
+
+    Pages are addressed with keyset cursors instead of offsets, so every page
+    reads at most `limit + 1` rows from the index on the sort key no matter
+    how many rows precede it. `after` returns the page following a cursor and
+    `before` the page preceding it. Returns a dict with the rows ('items')
+    and the cursors of the neighbouring pages ('previous' and 'next', None
+    when there is no such page).
+    """
+    key = db.tuple_(value_column, id_column)
+    forward = [value_column.desc(), id_column.desc()] if descending else [value_column, id_column]
+    backward = [value_column, id_column] if descending else [value_column.desc(), id_column.desc()]
+
+    if before:
+        bound = db.tuple_(*parse_cursor(before, parse_value))
+        query = query.where(key > bound if descending else key < bound).order_by(*backward)
+    else:
+        if after:
+            bound = db.tuple_(*parse_cursor(after, parse_value))
+            query = query.where(key < bound if descending else key > bound)
+        query = query.order_by(*forward)
+
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor(getattr(row, value_column.key), getattr(row, id_column.key))
+
+    return {
+        'items': rows,
+        'previous': cursor(rows[0]) if rows and (has_more if before else after) else None,
+        'next': cursor(rows[-1]) if rows and (before or has_more) else None
+    }
@@ -1,29 +1,93 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from ..services import appointment_service, patient_service
-from ..models import Appointment, Patient
-from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, abort
+from ..services import appointment_service, patient_service, recurrence, availability
+from ..services.calendar_cache import get_calendar_cache
+from ..services.dashboard_cache import get_dashboard_cache
+from ..streaming import check_dates, json_stream_response, export_response, EXPORT_FORMATS, wants_stream
+from ..models import DEFAULT_APPOINTMENT_DURATION
+from datetime import datetime, date, timedelta
 import logging
 
 bp = Blueprint('appointments', __name__, url_prefix='/appointments')
 
+# Maior intervalo aceito pela busca de horários livres, em dias
+MAX_FREE_SLOT_SEARCH_DAYS = 92
+
+# Colunas das exportações: (cabeçalho, chave do registro)
+APPOINTMENT_EXPORT_COLUMNS = (
+    ('ID', 'id'),
+    ('Data', 'date'),
+    ('Duração (min)', 'duration'),
+    ('Paciente', 'patientName'),
+    ('Status', 'status'),
+    ('Valor', 'value'),
+    ('Observações', 'notes'),
+)
+
 @bp.route('/')
 def list_appointments():
     """
-    Lista todas as consultas com filtros opcionais de data.
+    Lista as consultas de um período, paginadas por cursor (data, id).
+    Sem filtros, mostra uma janela em torno de hoje.
+    Com ?format=json, os dados são enviados em streaming como um array JSON.
     """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    # This logic could also be moved to the service layer for consistency
-    query = Appointment.query.join(Patient)
-    if start_date:
-        query = query.filter(Appointment.date >= datetime.strptime(start_date, '%Y-%m-%d'))
-    if end_date:
-        query = query.filter(Appointment.date <= datetime.strptime(end_date, '%Y-%m-%d'))
-    
-    appointments = query.order_by(Appointment.date.desc()).all()
-    patients = patient_service.get_all_patients()
-    return render_template('appointments/list.html', appointments=appointments, patients=patients)
+    if request.args.get('format') == 'json':
+        try:
+            check_dates(start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+        return json_stream_response(appointment_service.iter_appointments(start_date, end_date))
+
+    default_start, default_end = appointment_service.get_default_list_window()
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else default_start
+        end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else default_end
+        page = appointment_service.get_appointments_page(
+            start, end,
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+    except ValueError:
+        abort(400)
+
+    total = appointment_service.count_appointments(start, end)
+    return render_template(
+        'appointments/list.html',
+        appointments=page['items'],
+        page=page,
+        total=total,
+        start_date=start,
+        end_date=end
+    )
+
+@bp.route('/export')
+def export_appointments():
+    """
+    Exporta as consultas em CSV (padrão) ou XLSX (?format=xlsx), com filtros
+    opcionais de data (start_date, end_date) e status.
+    O CSV é enviado em streaming, linha a linha, a partir de um cursor no servidor.
+    """
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+    status = request.args.get('status') or None
+    export_format = request.args.get('format', 'csv')
+    try:
+        check_dates(start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+    if status is not None and status not in appointment_service.APPOINTMENT_STATUSES:
+        return jsonify({'error': f'Status inválido: {status}'}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Formato inválido: {export_format}'}), 400
+
+    rows = appointment_service.iter_appointments(start_date, end_date, status)
+    filename = f"consultas_{start_date or 'inicio'}_{end_date or 'hoje'}"
+    try:
+        return export_response(export_format, rows, APPOINTMENT_EXPORT_COLUMNS, filename)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
 
 @bp.route('/new', methods=['GET', 'POST'])
 def create_appointment():
@@ -42,19 +106,47 @@ def create_appointment():
             flash(f'Erro ao agendar consulta: {str(e)}', 'danger')
             logging.error(f'Erro ao agendar consulta: {str(e)}')
 
-    patients = patient_service.get_all_patients()
-    return render_template('appointments/form.html', patients=patients, appointment=None)
+    return render_template('appointments/form.html', appointment=None, patient=None)
 
 @bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 def edit_appointment(id):
     """
-    Edita uma consulta existente.
+    Edita uma consulta existente. Para consultas de uma série, o campo 'scope'
+    define se a alteração vale para esta consulta, esta e as seguintes ou a série toda.
     """
     appointment = appointment_service.get_appointment_by_id(id)
 
     if request.method == 'POST':
         try:
-            appointment_service.update_appointment(appointment, request.form)
+            appointment_service.update_appointment_scope(appointment, request.form, request.form.get('scope'))
+            flash('Consulta atualizada com sucesso!', 'success')
+            return redirect(url_for('appointments.list_appointments'))
+        except ValueError as e:
+            flash(str(e), 'danger')
+        except Exception as e:
+            flash(f'Erro ao atualizar consulta: {str(e)}', 'danger')
+            logging.error(f'Erro ao atualizar consulta: {str(e)}')
+
+    patient = patient_service.get_patient_row(appointment.patient_id)
+    return render_template('appointments/form.html', appointment=appointment, patient=patient)
+
+@bp.route('/<int:id>/occurrences/<occurrence>/edit', methods=['GET', 'POST'])
+def edit_occurrence(id, occurrence):
+    """
+    Edita uma ocorrência de uma série baseada em regra.
+    A ocorrência é gravada como exceção da série apenas ao salvar uma alteração
+    isolada; nos demais escopos a própria regra da série é alterada.
+    """
+    series = appointment_service.get_series_by_id(id)
+    try:
+        occurrence_date = recurrence.parse_occurrence_date(occurrence)
+        appointment = appointment_service.build_occurrence(series, occurrence_date)
+    except ValueError:
+        abort(404)
+
+    if request.method == 'POST':
+        try:
+            appointment_service.update_appointment_scope(appointment, request.form, request.form.get('scope'))
             flash('Consulta atualizada com sucesso!', 'success')
             return redirect(url_for('appointments.list_appointments'))
         except ValueError as e:
@@ -63,15 +155,15 @@ def edit_appointment(id):
             flash(f'Erro ao atualizar consulta: {str(e)}', 'danger')
             logging.error(f'Erro ao atualizar consulta: {str(e)}')
 
-    patients = patient_service.get_all_patients()
-    return render_template('appointments/form.html', appointment=appointment, patients=patients)
+    patient = patient_service.get_patient_row(appointment.patient_id)
+    return render_template('appointments/form.html', appointment=appointment, patient=patient)
 
 @bp.route('/<int:id>')
 def view_appointment(id):
     """
     Exibe os detalhes de uma consulta específica.
     """
-    appointment = appointment_service.get_appointment_by_id(id)
+    appointment = appointment_service.get_appointment_by_id(id, profile='appointment_detail')
     return render_template('appointments/detail.html', appointment=appointment)
 
 @bp.route('/<int:id>/cancel', methods=['POST'])
@@ -96,11 +188,75 @@ def cancel_appointment(id):
 def get_appointments_api():
     """
     API endpoint para retornar todas as consultas em formato compatível com FullCalendar.
+    As respostas ficam em cache por intervalo e suportam GET condicional (ETag).
+    Intervalos amplos (ou ?stream=true) são enviados em streaming, sem cache.
+    Aceita os filtros ?patientId= e ?status= (Agendada, Realizada ou Paga).
     """
     start = request.args.get('start')
     end = request.args.get('end')
-    events = appointment_service.get_appointments_for_calendar(start, end)
-    return jsonify(events)
+    patient_id = request.args.get('patientId', type=int)
+    status = request.args.get('status') or None
+    if status is not None and status not in appointment_service.APPOINTMENT_STATUSES:
+        abort(400)
+    try:
+        wide_range = _is_wide_range(start, end)
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato ISO 8601.'}), 400
+
+    if wants_stream(request) or wide_range:
+        return json_stream_response(
+            appointment_service.iter_appointments_for_calendar(start, end, patient_id, status)
+        )
+    cache = get_calendar_cache()
+    cache_key = tuple(sorted(request.args.items(multi=True)))
+    # Versão compartilhada entre os workers: uma escrita em qualquer um deles invalida o cache de todos
+    version = get_dashboard_cache().version()
+
+    cached = cache.get(cache_key, version)
+    if cached is None:
+        events = appointment_service.get_appointments_for_calendar(start, end, patient_id, status)
+        response = jsonify(events)
+        response.add_etag()
+        cache.store(cache_key, start, end, response.get_data(), response.get_etag()[0], version)
+    else:
+        data, etag = cached
+        response = current_app.response_class(data, mimetype='application/json')
+        response.set_etag(etag)
+
+    # Força o navegador a revalidar com If-None-Match a cada navegação
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _is_wide_range(start, end):
+    """
+    Verifica se o intervalo pedido excede CALENDAR_STREAM_MIN_DAYS (ou é aberto).
+    As datas são comparadas sem fuso, como na consulta ao banco; levanta ValueError
+    se alguma delas não estiver no formato ISO 8601.
+    """
+    start = datetime.fromisoformat(start).replace(tzinfo=None) if start else None
+    end = datetime.fromisoformat(end).replace(tzinfo=None) if end else None
+    if start is None or end is None:
+        return True
+    days = (end - start).days
+    return days > current_app.config['CALENDAR_STREAM_MIN_DAYS']
+
+@bp.route('/api/free-slots')
+def get_free_slots_api():
+    """
+    API endpoint para buscar horários livres no expediente.
+    Parâmetros: from e to (YYYY-MM-DD, padrão: os próximos 30 dias) e duration (minutos).
+    """
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else date.today()
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=30)
+        duration = int(request.args.get('duration') or DEFAULT_APPOINTMENT_DURATION)
+        if (end - start).days > MAX_FREE_SLOT_SEARCH_DAYS:
+            raise ValueError(f'O intervalo de busca deve ter no máximo {MAX_FREE_SLOT_SEARCH_DAYS} dias.')
+        slots = availability.find_free_slots(start, end, duration)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify([{'start': slot_start.isoformat(), 'end': slot_end.isoformat()} for slot_start, slot_end in slots])
 
 @bp.route('/api', methods=['POST'])
 def create_appointment_api():
@@ -113,6 +269,7 @@ def create_appointment_api():
         form_data = {
             'patient_id': data['patientId'],
             'date': data['date'].replace('Z', ''),
+            'duration': data.get('duration'),
             'value': data['value'],
             'notes': data.get('notes'),
             'is_recurring': 'is_recurring' in data,
@@ -131,14 +288,13 @@ def create_appointment_api():
 def update_appointment_api(id):
     """
     API endpoint para atualizar uma consulta existente.
+    O escopo ('single', 'following' ou 'series') vem de ?scope= ou do corpo JSON.
     """
-    # Note: The service layer doesn't support partial updates yet.
-    # This API endpoint would need to be updated to handle that.
     try:
         appointment = appointment_service.get_appointment_by_id(id)
         data = request.get_json()
-        # This is a simplified update, a more robust solution is needed
-        appointment_service.update_appointment(appointment, data)
+        scope = request.args.get('scope') or data.get('scope')
+        appointment_service.update_appointment_scope(appointment, data, scope)
         return jsonify({'success': True})
     except ValueError as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -149,13 +305,53 @@ def update_appointment_api(id):
 @bp.route('/api/<int:id>', methods=['DELETE'])
 def delete_appointment_api(id):
     """
-    API endpoint para excluir uma consulta.
+    API endpoint para excluir uma consulta, esta e as seguintes (?scope=following)
+    ou a série toda (?scope=series).
     """
-    # Note: The service layer doesn't support deleting series yet.
     try:
         appointment = appointment_service.get_appointment_by_id(id)
-        appointment_service.delete_appointment(appointment) # This function needs to be created
+        appointment_service.delete_appointment_scope(appointment, request.args.get('scope'))
         return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     except Exception as e:
         logging.error(f'Erro ao excluir consulta via API: {str(e)}')
         return jsonify({'success': False, 'message': f'Erro ao excluir consulta: {str(e)}'})
+
+@bp.route('/api/<int:id>/occurrences/<occurrence>', methods=['PUT'])
+def update_occurrence_api(id, occurrence):
+    """
+    API endpoint para atualizar uma ocorrência de uma série baseada em regra,
+    com os mesmos escopos de update_appointment_api.
+    """
+    series = appointment_service.get_series_by_id(id)
+    try:
+        occurrence_date = recurrence.parse_occurrence_date(occurrence)
+        appointment = appointment_service.build_occurrence(series, occurrence_date)
+        data = request.get_json()
+        scope = request.args.get('scope') or data.get('scope')
+        appointment_service.update_appointment_scope(appointment, data, scope)
+        return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        logging.error(f'Erro ao atualizar ocorrência via API: {str(e)}')
+        return jsonify({'success': False, 'message': f'Erro ao atualizar ocorrência: {str(e)}'})
+
+@bp.route('/api/<int:id>/occurrences/<occurrence>', methods=['DELETE'])
+def cancel_occurrence_api(id, occurrence):
+    """
+    API endpoint para cancelar uma única ocorrência de uma série baseada em regra.
+    Com ?scope=following ou ?scope=series, exclui também as seguintes ou a série toda.
+    """
+    series = appointment_service.get_series_by_id(id)
+    try:
+        occurrence_date = recurrence.parse_occurrence_date(occurrence)
+        appointment = appointment_service.build_occurrence(series, occurrence_date)
+        appointment_service.delete_appointment_scope(appointment, request.args.get('scope'))
+        return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        logging.error(f'Erro ao cancelar ocorrência via API: {str(e)}')
+        return jsonify({'success': False, 'message': f'Erro ao cancelar ocorrência: {str(e)}'})
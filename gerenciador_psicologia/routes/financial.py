@@ -1,23 +1,81 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from ..services import financial_service, patient_service
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, jsonify
+from ..services import financial_service, statement_import
+from ..streaming import check_dates, json_stream_response, export_response, EXPORT_FORMATS
+from datetime import datetime
 import logging
 
 bp = Blueprint('financial', __name__, url_prefix='/financial')
 
+# Colunas das exportações: (cabeçalho, chave do registro)
+PAYMENT_EXPORT_COLUMNS = (
+    ('ID', 'id'),
+    ('Data', 'date'),
+    ('Tipo', 'paymentType'),
+    ('Valor', 'value'),
+    ('Paciente', 'patientName'),
+    ('Consulta', 'appointmentId'),
+    ('Observações', 'notes'),
+)
+
 @bp.route('/payments')
 def list_payments():
     """
-    Lista todos os pagamentos com filtros opcionais de data.
+    Lista os pagamentos com filtros opcionais de data, paginados por cursor
+    (data, id), com o total do período e o saldo acumulado calculados no banco.
+    Com ?format=json, os dados são enviados em streaming como um array JSON.
     """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    payments = financial_service.get_payments(start_date, end_date)
-    total_value = financial_service.get_total_value(payments)
+    if request.args.get('format') == 'json':
+        try:
+            check_dates(start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+        return json_stream_response(financial_service.iter_payments(start_date, end_date))
+
+    try:
+        page = financial_service.get_payments_page(
+            start_date, end_date,
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+        totals = financial_service.get_period_totals(start_date, end_date)
+    except ValueError:
+        abort(400)
 
     return render_template('financial/payments_list.html',
-                           payments=payments,
-                           total_value=total_value)
+                           payments=page['items'],
+                           page=page,
+                           totals=totals,
+                           total_value=totals['total'])
+
+@bp.route('/payments/export')
+def export_payments():
+    """
+    Exporta os pagamentos em CSV (padrão) ou XLSX (?format=xlsx), com filtros
+    opcionais de data (start_date, end_date) e tipo (payment_type).
+    O CSV é enviado em streaming, linha a linha, a partir de um cursor no servidor.
+    """
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+    payment_type = request.args.get('payment_type') or None
+    export_format = request.args.get('format', 'csv')
+    try:
+        check_dates(start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+    if payment_type is not None and payment_type not in financial_service.PAYMENT_TYPES:
+        return jsonify({'error': f'Tipo inválido: {payment_type}'}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Formato inválido: {export_format}'}), 400
+
+    rows = financial_service.iter_payments(start_date, end_date, payment_type, oldest_first=True)
+    filename = f"pagamentos_{start_date or 'inicio'}_{end_date or 'hoje'}"
+    try:
+        return export_response(export_format, rows, PAYMENT_EXPORT_COLUMNS, filename)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
 
 @bp.route('/payments/new', methods=['GET', 'POST'])
 def register_payment():
@@ -33,15 +91,65 @@ def register_payment():
             flash(f'Erro ao registrar registro financeiro: {str(e)}', 'danger')
             logging.error(f'Erro ao registrar registro financeiro: {str(e)}')
 
-    patients = patient_service.get_all_patients()
-    return render_template('financial/payment_form.html', patients=patients)
+    return render_template('financial/payment_form.html')
+
+@bp.route('/receivables')
+def receivables():
+    """
+    Relatório de valores a receber: consultas realizadas sem pagamento
+    vinculado, por paciente e por faixa de atraso.
+    """
+    as_of_str = request.args.get('as_of')
+    try:
+        as_of = datetime.strptime(as_of_str, '%Y-%m-%d').date() if as_of_str else None
+    except ValueError:
+        abort(400)
+
+    report = financial_service.get_receivables(as_of)
+    return render_template('financial/receivables.html',
+                           patients=report['patients'],
+                           totals=report['totals'],
+                           as_of=as_of)
+
+@bp.route('/payments/import', methods=['GET', 'POST'])
+def import_statement():
+    """
+    Importa um extrato bancário (CSV ou OFX) como registros financeiros.
+    Créditos viram receitas e débitos, despesas; linhas já importadas são
+    ignoradas. Com action=preview, apenas mostra o que seria importado.
+    """
+    summary = None
+    if request.method == 'POST':
+        statement = request.files.get('statement')
+        dry_run = request.form.get('action') == 'preview'
+        if not statement or not statement.filename:
+            flash('Selecione um arquivo de extrato.', 'danger')
+        else:
+            try:
+                summary = statement_import.import_statement(
+                    statement.stream,
+                    statement_import.detect_format(statement.filename),
+                    dry_run=dry_run
+                )
+                if not dry_run:
+                    flash(
+                        f"Extrato importado: {summary['new']} registro(s) novo(s), "
+                        f"{summary['duplicates']} já importado(s).",
+                        'success'
+                    )
+                    return redirect(url_for('financial.list_payments'))
+            except ValueError as e:
+                flash(f'Erro ao importar extrato: {str(e)}', 'danger')
+                logging.error(f'Erro ao importar extrato: {str(e)}')
+
+    return render_template('financial/import_statement.html', summary=summary)
 
 @bp.route('/payments/<int:id>')
 def view_payment(id):
     """
     Exibe os detalhes de um pagamento específico.
     """
-    payment = financial_service.get_payment_by_id(id)
+    payment = financial_service.get_payment_by_id(id, profile='payment_detail')
     return render_template('financial/payment_detail.html', payment=payment)
 
 @bp.route('/payments/delete/<int:payment_id>', methods=['POST'])
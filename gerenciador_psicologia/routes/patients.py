@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from ..services import patient_service
 import logging
 
@@ -80,3 +80,14 @@ def activate_patient(id):
         flash(f'Erro ao ativar paciente: {str(e)}', 'danger')
         logging.error(f'Erro ao ativar paciente: {str(e)}')
     return redirect(url_for('main.index', show_inactive='true'))
+
+@bp.route('/autocomplete')
+def autocomplete():
+    """
+    Sugestões de pacientes ativos para os campos de seleção de paciente.
+    Recebe o termo digitado em ?q= e, opcionalmente, o número de sugestões em ?limit=.
+    """
+    return jsonify(patient_service.autocomplete_patients(
+        request.args.get('q', ''),
+        request.args.get('limit', type=int)
+    ))
@@ -1,7 +1,27 @@
 from ..app import db
-from ..models import Appointment, Payment
-from datetime import datetime, date
-from dateutil.relativedelta import relativedelta
+from flask import current_app
+from ..models import Appointment, Patient, Payment, DEFAULT_APPOINTMENT_DURATION
+from . import conflict_service, patient_summary, recurrence
+from .calendar_cache import get_calendar_cache
+from .availability import get_occupancy_index
+from .dashboard_cache import bump_financial_version
+from ..sql_functions import shift_datetime, month_start
+from ..pagination import fetch_keyset_page
+from ..loading import apply_profile
+from datetime import datetime, date, timedelta
+
+# Rows fetched per round trip when streaming large result sets
+STREAM_BATCH_SIZE = 500
+
+# Statuses accepted by the calendar filter
+APPOINTMENT_STATUSES = ('Agendada', 'Realizada', 'Paga')
+
+# Rows per page of the appointment list and default window around today, in days
+APPOINTMENT_PAGE_SIZE = 50
+APPOINTMENT_LIST_WINDOW_DAYS = 30
+
+# Scopes accepted when editing or deleting an appointment that belongs to a series
+SERIES_SCOPES = ('single', 'following', 'series')
 
 def create_appointment(appointment_data):
     """
@@ -19,13 +39,20 @@ def create_appointment(appointment_data):
         if recurrence_until <= appointment_date.date():
             raise ValueError('A data final da recorrência deve ser posterior à data inicial.')
 
-    existing_appointment = Appointment.query.filter(
-        Appointment.date == appointment_date,
-        Appointment.status == 'scheduled'
-    ).first()
+    duration = _parse_duration(appointment_data.get('duration'))
 
-    if existing_appointment:
-        raise ValueError('Já existe uma consulta agendada para este horário.')
+    # The whole series is checked against existing bookings in one query
+    series_dates = [appointment_date]
+    if is_recurring and recurrence_frequency:
+        series_dates.extend(recurrence.iter_occurrences(
+            appointment_date,
+            recurrence_frequency,
+            until=recurrence_until,
+            limit=recurrence.MAX_MATERIALIZED_RECURRENCES
+        ))
+    conflict_service.check_conflicts(
+        [(start, start + timedelta(minutes=duration)) for start in series_dates]
+    )
 
     _create_recurring_appointments(
         patient_id=appointment_data['patient_id'],
@@ -34,60 +61,143 @@ def create_appointment(appointment_data):
         notes=appointment_data.get('notes', ''),
         is_recurring=is_recurring,
         recurrence_frequency=recurrence_frequency,
-        recurrence_until=recurrence_until
+        recurrence_until=recurrence_until,
+        duration=duration
     )
+    patient_summary.refresh([appointment_data['patient_id']])
     db.session.commit()
 
-def _create_recurring_appointments(patient_id, appointment_date, value, notes, is_recurring, recurrence_frequency, recurrence_until):
+    if is_recurring:
+        _invalidate_calendar(appointment_date, recurrence_until)
+    else:
+        _invalidate_calendar(appointment_date, appointment_date)
+
+def _parse_duration(value):
+    """
+    Parses an appointment duration in minutes, defaulting to one hour.
+    """
+    if not value:
+        return DEFAULT_APPOINTMENT_DURATION
+    duration = int(value)
+    if not 0 < duration <= conflict_service.MAX_DURATION_MINUTES:
+        raise ValueError(f'A duração deve estar entre 1 e {conflict_service.MAX_DURATION_MINUTES} minutos.')
+    return duration
+
+def _create_recurring_appointments(patient_id, appointment_date, value, notes, is_recurring, recurrence_frequency, recurrence_until, duration=DEFAULT_APPOINTMENT_DURATION):
     """
     Creates a main appointment and its recurrences, if applicable.
+
+    In rule mode only the main appointment is stored, carrying the recurrence
+    rule; its occurrences are expanded on read. Otherwise every occurrence is
+    stored as a child row, up to MAX_MATERIALIZED_RECURRENCES, with one bulk
+    INSERT in the current transaction.
     """
+    is_rule_based = bool(is_recurring and recurrence_frequency) and \
+        current_app.config['APPOINTMENT_RECURRENCE_MODE'] == recurrence.RULE_MODE
+
     new_appointment = Appointment(
         patient_id=patient_id,
         date=appointment_date,
         value=value,
         notes=notes,
-        status='scheduled',
+        status='Agendada',
+        duration=duration,
         is_recurring=is_recurring,
         recurrence_frequency=recurrence_frequency if is_recurring else None,
         recurrence_day=appointment_date.weekday() if is_recurring else None,
-        recurrence_until=recurrence_until
+        recurrence_until=recurrence_until,
+        recurrence_mode=recurrence.RULE_MODE if is_rule_based else None
     )
     db.session.add(new_appointment)
     db.session.flush()
 
-    if is_recurring and recurrence_frequency:
-        next_date = appointment_date
-        count = 0
-        max_recurrences = 52
-
-        while count < max_recurrences:
-            if recurrence_frequency == 'weekly':
-                next_date = next_date + relativedelta(weeks=1)
-            elif recurrence_frequency == 'biweekly':
-                next_date = next_date + relativedelta(weeks=2)
-            else:  # monthly
-                next_date = next_date + relativedelta(months=1)
-
-            if recurrence_until and next_date.date() > recurrence_until:
-                break
-
-            recurring_appointment = Appointment(
-                patient_id=patient_id,
-                date=next_date,
-                value=value,
-                notes=notes,
-                status='scheduled',
-                parent_appointment_id=new_appointment.id
-            )
-            db.session.add(recurring_appointment)
-            count += 1
+    if is_recurring and recurrence_frequency and not is_rule_based:
+        occurrences = recurrence.iter_occurrences(
+            appointment_date,
+            recurrence_frequency,
+            until=recurrence_until,
+            limit=recurrence.MAX_MATERIALIZED_RECURRENCES
+        )
+        rows = [
+            {
+                'patient_id': patient_id,
+                'date': next_date,
+                'duration': duration,
+                'end_date': next_date + timedelta(minutes=duration),
+                'month_bucket': next_date.date().replace(day=1),
+                'value': value,
+                'notes': notes,
+                'status': 'Agendada',
+                'parent_appointment_id': new_appointment.id
+            }
+            for next_date in occurrences
+        ]
+        if rows:
+            # A single executemany/multi-row INSERT instead of one unit-of-work entry per occurrence
+            db.session.execute(db.insert(Appointment), rows)
+
+def get_appointment_by_id(appointment_id, profile=None):
+    """
+    Retrieves an appointment by its ID, applying an optional loading profile.
+    """
+    return apply_profile(Appointment.query, profile).get_or_404(appointment_id)
 
-def get_appointment_by_id(appointment_id):
+def get_series_by_id(appointment_id):
+    """
+    Retrieves the parent appointment of a rule-based series by its ID.
     """
-    Retrieves an appointment by its ID.
+    return Appointment.query.filter_by(id=appointment_id, recurrence_mode=recurrence.RULE_MODE).first_or_404()
+
+def build_occurrence(series, occurrence_date):
     """
-    return Appointment.query.get_or_404(appointment_id)
+    Returns the stored exception row for an occurrence of a rule-based series
+    or, when there is none, a transient appointment describing it.
+    Raises ValueError when the date is not an occurrence of the series.
+    """
+    exception = Appointment.query.filter_by(
+        parent_appointment_id=series.id,
+        original_date=occurrence_date
+    ).first()
+    if exception:
+        return exception
+
+    if not recurrence.is_occurrence(series, occurrence_date):
+        raise ValueError('A data informada não corresponde a uma ocorrência da série.')
+
+    return Appointment(
+        patient_id=series.patient_id,
+        date=occurrence_date,
+        duration=series.duration,
+        value=series.value,
+        notes=series.notes,
+        status='Agendada',
+        parent_appointment_id=series.id,
+        original_date=occurrence_date,
+        is_cancelled=False
+    )
+
+def materialize_occurrence(series, occurrence_date):
+    """
+    Stores an exception row for an occurrence of a rule-based series so it
+    can be moved, paid or cancelled independently. Does not commit.
+    """
+    occurrence = build_occurrence(series, occurrence_date)
+    if occurrence.id is None:
+        db.session.add(occurrence)
+        db.session.flush()
+    return occurrence
+
+def cancel_occurrence(series, occurrence_date):
+    """
+    Cancels a single occurrence of a rule-based series by storing a
+    cancelled exception row in its place.
+    """
+    occurrence = materialize_occurrence(series, occurrence_date)
+    occurrence.is_cancelled = True
+    patient_summary.refresh([series.patient_id])
+    db.session.commit()
+    _invalidate_calendar(occurrence_date, occurrence_date)
+    _invalidate_calendar(occurrence.date, occurrence.date)
 
 def update_appointment(appointment, appointment_data):
     """
@@ -95,9 +205,17 @@ def update_appointment(appointment, appointment_data):
     """
     if appointment.status != 'cancelled':
         old_status = appointment.status
+        old_date = appointment.date
         new_status = appointment_data['status']
 
         appointment.date = datetime.strptime(appointment_data['date'], '%Y-%m-%dT%H:%M')
+        if appointment_data.get('duration'):
+            appointment.duration = _parse_duration(appointment_data['duration'])
+        if appointment.date != old_date or appointment_data.get('duration'):
+            conflict_service.check_conflicts(
+                [(appointment.date, appointment.date + timedelta(minutes=appointment.duration))],
+                exclude_ids=(appointment.id,)
+            )
         appointment.value = float(appointment_data['value'])
         appointment.status = new_status
         appointment.notes = appointment_data['notes']
@@ -126,7 +244,10 @@ def update_appointment(appointment, appointment_data):
             if existing_payment:
                 db.session.delete(existing_payment)
 
+        patient_summary.refresh([appointment.patient_id])
         db.session.commit()
+        _invalidate_calendar(old_date, old_date)
+        _invalidate_calendar(appointment.date, appointment.date)
     else:
         raise ValueError('Não é possível editar uma consulta cancelada.')
 
@@ -136,7 +257,9 @@ def cancel_appointment(appointment):
     """
     if appointment.status == 'scheduled':
         appointment.status = 'cancelled'
+        patient_summary.refresh([appointment.patient_id])
         db.session.commit()
+        _invalidate_calendar(appointment.date, appointment.date)
     else:
         raise ValueError('Só é possível cancelar consultas agendadas.')
 
@@ -144,49 +267,497 @@ def delete_appointment(appointment):
     """
     Deletes an appointment.
     """
+    appointment_date = appointment.date
+    patient_id = appointment.patient_id
     db.session.delete(appointment)
+    patient_summary.refresh([patient_id])
     db.session.commit()
+    _invalidate_calendar(appointment_date, appointment_date)
+
+def get_series_root(appointment):
+    """
+    Returns the first appointment of the series an appointment belongs to,
+    or None when it is a standalone booking.
+    """
+    if appointment.parent_appointment_id:
+        return db.session.get(Appointment, appointment.parent_appointment_id)
+    if appointment.is_recurring and appointment.id is not None:
+        return appointment
+    return None
 
-def get_appointments_for_calendar(start, end):
+def update_appointment_scope(appointment, appointment_data, scope='single'):
     """
-    Retrieves appointments for the calendar view.
+    Updates an appointment and, depending on the scope, the rest of its series.
+
+    'single' edits only the given appointment. 'following' and 'series' move
+    every scheduled session from this one on (or all of them) by the same
+    offset and apply the new value, notes and duration, using a bounded
+    number of set-based statements keyed on parent_appointment_id and date.
+    Sessions already held or paid keep their history, and the status is only
+    changed on single edits.
+    """
+    scope = _parse_scope(scope)
+    root = get_series_root(appointment)
+    if scope == 'single' or root is None:
+        if appointment.id is None:
+            appointment = materialize_occurrence(root, appointment.original_date)
+        return update_appointment(appointment, appointment_data)
+
+    pivot = appointment.original_date or appointment.date
+    if scope == 'following' and pivot <= root.date:
+        scope = 'series'
+
+    new_date = datetime.strptime(appointment_data['date'], '%Y-%m-%dT%H:%M')
+    values = {
+        'value': float(appointment_data['value']),
+        'notes': appointment_data.get('notes', ''),
+        'duration': _parse_duration(appointment_data.get('duration') or appointment.duration)
+    }
+
+    if root.recurrence_mode == recurrence.RULE_MODE:
+        # Rule-based series move relative to the slot of the occurrence
+        offset = new_date - pivot
+        first_date = _update_rule_series(root, appointment, pivot, scope, offset, values)
+    else:
+        offset = new_date - appointment.date
+        first_date = _update_materialized_series(root, pivot, scope, offset, values)
+
+    patient_summary.refresh([root.patient_id])
+    db.session.commit()
+    _invalidate_calendar(min(first_date, first_date + offset), None)
+
+def _update_materialized_series(root, pivot, scope, offset, values):
+    """
+    Moves the scheduled rows of a materialised series with one UPDATE.
+    Returns the earliest date of the scope.
+    """
+    movable = db.and_(
+        _scope_condition(root, pivot, scope),
+        Appointment.status == 'Agendada',
+        Appointment.is_cancelled == False
+    )
+    rows = db.session.execute(db.select(Appointment.id, Appointment.date).where(movable)).all()
+    _check_series_conflicts([row.date + offset for row in rows], values['duration'], [row.id for row in rows])
+
+    _shift_appointments(movable, offset, values, weekday=(root.date + offset).weekday())
+    return root.date if scope == 'series' else pivot
+
+def _update_rule_series(root, appointment, pivot, scope, offset, values):
+    """
+    Moves a rule-based series: the rule itself and its scheduled exception
+    rows. 'following' splits the series at the pivot, which becomes the
+    first appointment of a new rule carrying the later exceptions.
+    Returns the earliest date of the scope.
+    """
+    if scope == 'series':
+        anchor = root
+        children = Appointment.parent_appointment_id == root.id
+    else:
+        anchor = appointment
+        children = db.and_(
+            Appointment.parent_appointment_id == root.id,
+            Appointment.original_date > pivot
+        )
+    if anchor.status != 'Agendada' or anchor.is_cancelled:
+        raise ValueError('Só é possível alterar a série a partir de uma consulta agendada.')
+
+    exceptions = db.session.execute(
+        db.select(Appointment.id, Appointment.original_date, Appointment.date, Appointment.status, Appointment.is_cancelled)
+        .where(children)
+    ).all()
+
+    # New slots of the rule, skipping the ones overridden by an exception
+    new_anchor_date = (root.date if scope == 'series' else pivot) + offset
+    overridden = {row.original_date + offset for row in exceptions}
+    slots = [new_anchor_date] + [
+        slot for slot in recurrence.iter_occurrences(
+            new_anchor_date,
+            root.recurrence_frequency,
+            until=root.recurrence_until,
+            limit=recurrence.MAX_MATERIALIZED_RECURRENCES
+        )
+        if slot not in overridden
+    ]
+    slots.extend(
+        row.date + offset for row in exceptions
+        if row.status == 'Agendada' and not row.is_cancelled
+    )
+    _check_series_conflicts(slots, values['duration'], [root.id] + [row.id for row in exceptions])
+
+    movable = db.and_(children, Appointment.status == 'Agendada', Appointment.is_cancelled == False)
+    seconds = int(offset.total_seconds())
+
+    if scope == 'series':
+        _shift_appointments(Appointment.id == root.id, offset, values, weekday=new_anchor_date.weekday())
+        _shift_appointments(movable, offset, values)
+        # Unique (parent_appointment_id, original_date) is checked row by row, so
+        # exceptions are re-keyed through an off-minute value that cannot collide
+        _execute_update(children, original_date=shift_datetime(Appointment.original_date, seconds + 1))
+        _execute_update(children, original_date=shift_datetime(Appointment.original_date, -1))
+        return root.date
+
+    if appointment.id is None:
+        db.session.add(appointment)
+    appointment.parent_appointment_id = None
+    appointment.original_date = None
+    appointment.date = new_anchor_date
+    appointment.value = values['value']
+    appointment.notes = values['notes']
+    appointment.duration = values['duration']
+    appointment.is_recurring = True
+    appointment.recurrence_frequency = root.recurrence_frequency
+    appointment.recurrence_day = new_anchor_date.weekday()
+    appointment.recurrence_until = root.recurrence_until
+    appointment.recurrence_mode = recurrence.RULE_MODE
+    root.recurrence_until = pivot.date() - timedelta(days=1)
+    db.session.flush()
+
+    _shift_appointments(movable, offset, values)
+    # The new series has no exceptions yet, so re-keying cannot collide
+    _execute_update(
+        children,
+        parent_appointment_id=appointment.id,
+        original_date=shift_datetime(Appointment.original_date, seconds)
+    )
+    return pivot
+
+def delete_appointment_scope(appointment, scope='single'):
+    """
+    Deletes an appointment and, depending on the scope, the rest of its series.
+
+    'following' and 'series' run one DELETE keyed on parent_appointment_id and
+    date; the payments linked to the deleted sessions are kept and detached
+    from them in the same transaction. A 'following' delete ends the series
+    rule the day before the pivot.
+    """
+    scope = _parse_scope(scope)
+    root = get_series_root(appointment)
+    if scope == 'single' or root is None:
+        return _delete_single_appointment(appointment, root)
+
+    pivot = appointment.original_date or appointment.date
+    if scope == 'following' and pivot <= root.date:
+        scope = 'series'
+    first_date = root.date if scope == 'series' else pivot
+
+    _detach_payments(_scope_condition(root, pivot, scope))
+    children = Appointment.parent_appointment_id == root.id
+    if scope == 'following':
+        children = db.and_(children, db.func.coalesce(Appointment.original_date, Appointment.date) >= pivot)
+    db.session.execute(db.delete(Appointment).where(children).execution_options(synchronize_session=False))
+
+    if scope == 'series':
+        db.session.execute(db.delete(Appointment).where(Appointment.id == root.id).execution_options(synchronize_session=False))
+    else:
+        _execute_update(Appointment.id == root.id, recurrence_until=pivot.date() - timedelta(days=1))
+
+    patient_summary.refresh([root.patient_id])
+    db.session.commit()
+    _invalidate_calendar(first_date, None)
+
+def _delete_single_appointment(appointment, root):
     """
-    query = Appointment.query.join(Appointment.patient)
-    
+    Deletes a single appointment. Rows that other rows depend on (the first
+    appointment of a series and the exceptions of rule-based series) are
+    cancelled instead, so the rest of the series is kept.
+    """
+    if appointment.id is None:
+        return cancel_occurrence(root, appointment.original_date)
+
+    is_referenced = appointment.original_date is not None or db.session.scalar(
+        db.select(Appointment.id).where(Appointment.parent_appointment_id == appointment.id).limit(1)
+    ) is not None
+    if is_referenced or appointment.recurrence_mode == recurrence.RULE_MODE:
+        appointment.is_cancelled = True
+        patient_summary.refresh([appointment.patient_id])
+        db.session.commit()
+        _invalidate_calendar(appointment.date, appointment.date)
+        return
+
+    _detach_payments(Appointment.id == appointment.id)
+    delete_appointment(appointment)
+
+def _parse_scope(scope):
+    """
+    Validates the scope of a series operation, defaulting to 'single'.
+    """
+    scope = scope or 'single'
+    if scope not in SERIES_SCOPES:
+        raise ValueError('Escopo inválido. Use "single", "following" ou "series".')
+    return scope
+
+def _scope_condition(root, pivot, scope):
+    """
+    Selects the rows of a series in scope: every row for 'series', and the
+    ones whose slot is at or after the pivot for 'following'.
+    """
+    condition = db.or_(Appointment.id == root.id, Appointment.parent_appointment_id == root.id)
+    if scope == 'following':
+        condition = db.and_(condition, db.func.coalesce(Appointment.original_date, Appointment.date) >= pivot)
+    return condition
+
+def _check_series_conflicts(dates, duration, exclude_ids):
+    """
+    Checks the new dates of a series against the other bookings in one query.
+    """
+    conflict_service.check_conflicts(
+        [(start, start + timedelta(minutes=duration)) for start in dates],
+        exclude_ids=exclude_ids
+    )
+
+def _shift_appointments(condition, offset, values, weekday=None):
+    """
+    Moves the selected appointments by an offset and applies the new value,
+    notes and duration in a single UPDATE. end_date and month_bucket are
+    computed in SQL since bulk statements bypass the mapper events.
+    """
+    seconds = int(offset.total_seconds())
+    changes = dict(
+        values,
+        date=shift_datetime(Appointment.date, seconds),
+        end_date=shift_datetime(Appointment.date, seconds + values['duration'] * 60),
+        month_bucket=month_start(shift_datetime(Appointment.date, seconds))
+    )
+    if weekday is not None:
+        changes['recurrence_day'] = db.case((Appointment.recurrence_day.is_(None), None), else_=weekday)
+    _execute_update(condition, **changes)
+
+def _execute_update(condition, **values):
+    """
+    Runs a bulk UPDATE on appointments without synchronising the session.
+    """
+    db.session.execute(
+        db.update(Appointment).where(condition).values(**values).execution_options(synchronize_session=False)
+    )
+
+def _detach_payments(condition):
+    """
+    Unlinks the payments of the selected appointments with one UPDATE.
+    """
+    db.session.execute(
+        db.update(Payment)
+        .where(Payment.appointment_id.in_(db.select(Appointment.id).where(condition)))
+        .values(appointment_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+def _invalidate_calendar(start=None, end=None):
+    """
+    Evicts the cached calendar responses and day occupancy overlapping the
+    given range, and bumps the financial data version since appointment
+    values and statuses feed the dashboard. Open bounds are represented by None.
+    """
+    get_calendar_cache().invalidate(start, end)
+    get_occupancy_index().invalidate(start, end)
+    bump_financial_version()
+
+def get_appointments_for_calendar(start, end, patient_id=None, status=None):
+    """
+    Retrieves appointments for the calendar view, optionally restricted to
+    one patient and/or one status.
+    """
+    return list(iter_appointments_for_calendar(start, end, patient_id, status))
+
+def iter_appointments_for_calendar(start, end, patient_id=None, status=None):
+    """
+    Yields the calendar events of a range one at a time.
+
+    Only the columns needed to build the events are selected, together with
+    the patient name, so the whole range is loaded in a single statement
+    without materialising ORM objects or lazy-loading patients. Rows are
+    fetched in batches of STREAM_BATCH_SIZE (a server-side cursor on
+    Postgres). Occurrences of rule-based series are expanded inside the
+    requested window.
+
+    The patient and status filters are applied in SQL and served by the
+    (patient_id, date) and (status, date) indexes. Virtual occurrences are
+    always scheduled, so they are skipped when filtering on another status.
+    """
+    start = datetime.fromisoformat(start).replace(tzinfo=None) if start else None
+    end = datetime.fromisoformat(end).replace(tzinfo=None) if end else None
+
+    query = db.select(
+        Appointment.id,
+        Appointment.patient_id,
+        Appointment.date,
+        Appointment.duration,
+        Appointment.status,
+        Appointment.value,
+        Appointment.notes,
+        Appointment.is_recurring,
+        Appointment.recurrence_frequency,
+        Appointment.recurrence_until,
+        Appointment.parent_appointment_id,
+        Patient.name.label('patient_name')
+    ).join(Patient, Appointment.patient_id == Patient.id).where(
+        Appointment.is_cancelled == False
+    )
+
     if start:
-        query = query.filter(Appointment.date >= datetime.fromisoformat(start))
+        query = query.where(Appointment.date >= start)
     if end:
-        query = query.filter(Appointment.date <= datetime.fromisoformat(end))
-        
-    appointments = query.all()
-    events = []
-    
-    for appointment in appointments:
-        event = {
-            'id': appointment.id,
-            'title': f'Consulta - {appointment.patient.name}',
-            'start': appointment.date.isoformat(),
-            'end': (appointment.date + relativedelta(hours=1)).isoformat(),
-            'extendedProps': {
-                'patientId': appointment.patient_id,
-                'value': float(appointment.value),
-                'notes': appointment.notes,
-                'isRecurring': appointment.is_recurring or appointment.parent_appointment_id is not None,
-                'recurrenceFrequency': appointment.recurrence_frequency,
-                'recurrenceUntil': appointment.recurrence_until.isoformat() if appointment.recurrence_until else None
-            }
+        query = query.where(Appointment.date <= end)
+    if patient_id is not None:
+        query = query.where(Appointment.patient_id == patient_id)
+    if status is not None:
+        query = query.where(Appointment.status == status)
+
+    rows = db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    for row in rows:
+        yield _calendar_event(row)
+    if status is None or status == 'Agendada':
+        for series, occurrence in recurrence.iter_virtual_occurrences(start, end, patient_id):
+            yield _occurrence_event(series, occurrence)
+
+def iter_appointments(start_date=None, end_date=None, status=None):
+    """
+    Yields the appointments of the days [start_date, end_date] as plain
+    dicts, oldest first, optionally with one status, fetching rows in batches from a server-side
+    cursor instead of loading the whole period.
+    """
+    query = db.select(
+        Appointment.id,
+        Appointment.patient_id,
+        Patient.name.label('patient_name'),
+        Appointment.date,
+        Appointment.duration,
+        Appointment.status,
+        Appointment.value,
+        Appointment.notes
+    ).join(Patient, Appointment.patient_id == Patient.id).where(
+        Appointment.is_cancelled == False
+    )
+    if start_date:
+        query = query.where(Appointment.date >= datetime.strptime(start_date, '%Y-%m-%d'))
+    if end_date:
+        query = query.where(Appointment.date < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
+    if status:
+        query = query.where(Appointment.status == status)
+    query = query.order_by(Appointment.date, Appointment.id)
+
+    for row in db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+        yield {
+            'id': row.id,
+            'patientId': row.patient_id,
+            'patientName': row.patient_name,
+            'date': row.date.isoformat(),
+            'duration': row.duration,
+            'status': row.status,
+            'value': float(row.value),
+            'notes': row.notes
         }
-        
-        if appointment.status == 'Agendada':
-            event['className'] = 'fc-event-scheduled'
-        elif appointment.status == 'Realizada':
-            event['className'] = 'fc-event-completed'
-        elif appointment.status == 'Paga':
-            event['className'] = 'fc-event-paid'
-        elif appointment.status == 'cancelled':
-            event['className'] = 'fc-event-cancelled'
-            event['title'] = f'[CANCELADO] {event["title"]}'
-        
-        events.append(event)
-    
-    return events
+
+def get_default_list_window(today=None):
+    """
+    Returns the (start, end) dates shown by the appointment list when no
+    period is given: APPOINTMENT_LIST_WINDOW_DAYS around today.
+    """
+    today = today or date.today()
+    window = timedelta(days=APPOINTMENT_LIST_WINDOW_DAYS)
+    return today - window, today + window
+
+def get_appointments_page(start_date, end_date, after=None, before=None, limit=APPOINTMENT_PAGE_SIZE):
+    """
+    Returns one page of the appointments of a period, oldest first.
+
+    Pages are addressed with keyset cursors on (date, id) instead of offsets,
+    so every page is an index range scan of at most `limit + 1` rows no matter
+    how much history precedes it. `after` returns the page following a cursor
+    and `before` the page preceding it. The result carries the rows and the
+    cursors of the neighbouring pages (None when there is no such page).
+    """
+    query = _period_query(
+        db.select(
+            Appointment.id,
+            Appointment.patient_id,
+            Patient.name.label('patient_name'),
+            Appointment.date,
+            Appointment.duration,
+            Appointment.status,
+            Appointment.value,
+            Appointment.notes,
+            Appointment.parent_appointment_id,
+            Appointment.is_recurring
+        ).join(Patient, Appointment.patient_id == Patient.id),
+        start_date,
+        end_date
+    )
+    return fetch_keyset_page(
+        query, Appointment.date, Appointment.id, datetime.fromisoformat,
+        after=after, before=before, limit=limit
+    )
+
+def count_appointments(start_date, end_date):
+    """
+    Counts the appointments of a period with an index-only count on date,
+    without joining patients or loading rows.
+    """
+    query = _period_query(db.select(db.func.count(Appointment.id)), start_date, end_date)
+    return db.session.scalar(query)
+
+def _period_query(query, start_date, end_date):
+    """
+    Restricts a query to the visible appointments of the days [start_date, end_date].
+    """
+    query = query.where(Appointment.is_cancelled == False)
+    if start_date:
+        query = query.where(Appointment.date >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        query = query.where(Appointment.date < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return query
+
+def _calendar_event(row):
+    """
+    Builds a FullCalendar event dict from a projected appointment row.
+    """
+    event = {
+        'id': row.id,
+        'title': f'Consulta - {row.patient_name}',
+        'start': row.date.isoformat(),
+        'end': (row.date + timedelta(minutes=row.duration)).isoformat(),
+        'extendedProps': {
+            'patientId': row.patient_id,
+            'value': float(row.value),
+            'notes': row.notes,
+            'isRecurring': row.is_recurring or row.parent_appointment_id is not None,
+            'recurrenceFrequency': row.recurrence_frequency,
+            'recurrenceUntil': row.recurrence_until.isoformat() if row.recurrence_until else None
+        }
+    }
+
+    if row.status == 'Agendada':
+        event['className'] = 'fc-event-scheduled'
+    elif row.status == 'Realizada':
+        event['className'] = 'fc-event-completed'
+    elif row.status == 'Paga':
+        event['className'] = 'fc-event-paid'
+    elif row.status == 'cancelled':
+        event['className'] = 'fc-event-cancelled'
+        event['title'] = f'[CANCELADO] {event["title"]}'
+
+    return event
+
+def _occurrence_event(series, occurrence_date):
+    """
+    Builds a FullCalendar event dict for a virtual occurrence of a rule-based
+    series. It mirrors the event of a stored child appointment; the id points
+    at the series and the occurrence so it can be materialised on edit.
+    """
+    return {
+        'id': f'{series.id}:{occurrence_date.isoformat()}',
+        'title': f'Consulta - {series.patient_name}',
+        'start': occurrence_date.isoformat(),
+        'end': (occurrence_date + timedelta(minutes=series.duration)).isoformat(),
+        'editable': False,
+        'extendedProps': {
+            'patientId': series.patient_id,
+            'value': float(series.value),
+            'notes': series.notes,
+            'isRecurring': True,
+            'recurrenceFrequency': None,
+            'recurrenceUntil': None,
+            'parentId': series.id,
+            'occurrenceDate': occurrence_date.isoformat()
+        },
+        'className': 'fc-event-scheduled'
+    }
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from flask import current_app
+
+class AutocompleteCache:
+    """
+    In-process LRU cache of patient autocomplete results.
+
+    Entries are keyed on the normalized term and the result limit. Patient
+    writes clear the cache of the worker that made them; entries older than
+    `max_age` seconds are dropped so other workers' writes are eventually
+    picked up.
+    """
+
+    def __init__(self, max_entries=512, max_age=60):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        Returns the cached results for a key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, results = entry
+            if monotonic() - stored_at > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def store(self, key, results):
+        """
+        Stores the results of a key, evicting the least recently used entries.
+        """
+        with self._lock:
+            self._entries[key] = (monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Evicts every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def get_autocomplete_cache():
+    """
+    Returns the patient autocomplete cache of the current application.
+    """
+    return current_app.extensions['autocomplete_cache']
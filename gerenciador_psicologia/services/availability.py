@@ -0,0 +1,167 @@
+from ..app import db
+from ..models import Appointment
+from . import recurrence
+from .conflict_service import MAX_DURATION_MINUTES
+from bisect import bisect_left, insort
+from datetime import datetime, date, time, timedelta
+from threading import Lock
+from flask import current_app
+import time as clock
+
+class OccupancyIndex:
+    """
+    In-process index of the busy intervals of each day.
+
+    Days are loaded on demand: every day missing from a search is filled by a
+    single range query over appointments (plus the expansion of rule-based
+    series), and kept as a sorted list of merged (start, end) intervals.
+    Appointment writes evict the days they touch; entries older than
+    `max_age` seconds are reloaded so other workers' writes are eventually
+    picked up.
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._days = {}
+        self._lock = Lock()
+
+    def busy(self, start_day, end_day):
+        """
+        Returns {day: [(start, end), ...]} for every day in [start_day, end_day],
+        loading the missing or expired days with one query.
+        """
+        days = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+        now = clock.monotonic()
+        with self._lock:
+            missing = [day for day in days if day not in self._days or now - self._days[day][0] > self.max_age]
+        if missing:
+            loaded = _load_busy_intervals(missing[0], missing[-1])
+            with self._lock:
+                for offset in range((missing[-1] - missing[0]).days + 1):
+                    day = missing[0] + timedelta(days=offset)
+                    self._days[day] = (now, loaded.get(day, []))
+        with self._lock:
+            return {day: self._days[day][1] for day in days if day in self._days}
+
+    def invalidate(self, start=None, end=None):
+        """
+        Evicts the days overlapping [start, end]. Open bounds are represented by None.
+        """
+        start = _as_day(start)
+        end = _as_day(end)
+        with self._lock:
+            stale = [
+                day for day in self._days
+                if (start is None or day >= start) and (end is None or day <= end)
+            ]
+            for day in stale:
+                del self._days[day]
+
+    def clear(self):
+        """
+        Evicts every day.
+        """
+        with self._lock:
+            self._days.clear()
+
+    def __len__(self):
+        return len(self._days)
+
+def get_occupancy_index():
+    """
+    Returns the occupancy index of the current application.
+    """
+    return current_app.extensions['occupancy_index']
+
+def find_free_slots(start_day, end_day, duration, now=None):
+    """
+    Returns the (start, end) pairs of the free slots of `duration` minutes in
+    the days [start_day, end_day], inside the configured working hours.
+
+    Candidate starts are aligned to AVAILABILITY_SLOT_MINUTES and checked
+    against the busy intervals of the day with a binary search; slots that
+    already started are skipped.
+    """
+    if not 0 < duration <= MAX_DURATION_MINUTES:
+        raise ValueError(f'A duração deve estar entre 1 e {MAX_DURATION_MINUTES} minutos.')
+    if end_day < start_day:
+        raise ValueError('A data final deve ser posterior à data inicial.')
+
+    config = current_app.config
+    opening = time.fromisoformat(config['WORKING_HOURS_START'])
+    closing = time.fromisoformat(config['WORKING_HOURS_END'])
+    step = timedelta(minutes=config['AVAILABILITY_SLOT_MINUTES'])
+    length = timedelta(minutes=duration)
+    now = now or datetime.now()
+
+    busy_by_day = get_occupancy_index().busy(start_day, end_day)
+    slots = []
+    for day, busy in sorted(busy_by_day.items()):
+        if day.weekday() not in config['WORKING_DAYS']:
+            continue
+        starts = [interval[0] for interval in busy]
+        candidate = datetime.combine(day, opening)
+        day_end = datetime.combine(day, closing)
+        while candidate + length <= day_end:
+            slot_end = candidate + length
+            # Busy intervals are merged and sorted, only the previous one can overlap
+            position = bisect_left(starts, slot_end)
+            if candidate >= now and not (position and busy[position - 1][1] > candidate):
+                slots.append((candidate, slot_end))
+            candidate += step
+    return slots
+
+def _load_busy_intervals(start_day, end_day):
+    """
+    Loads the merged busy intervals of the days [start_day, end_day] with one
+    range query on (date, end_date) and the rule-based series expansion.
+    """
+    range_start = datetime.combine(start_day, time.min)
+    range_end = datetime.combine(end_day + timedelta(days=1), time.min)
+
+    rows = db.session.execute(
+        db.select(Appointment.date, Appointment.end_date).where(
+            Appointment.is_cancelled == False,
+            Appointment.date > range_start - timedelta(minutes=MAX_DURATION_MINUTES),
+            Appointment.date < range_end,
+            Appointment.end_date > range_start
+        )
+    ).all()
+    intervals = [(row.date, row.end_date) for row in rows]
+    intervals.extend(
+        (occurrence, occurrence + timedelta(minutes=series.duration))
+        for series, occurrence in recurrence.iter_virtual_occurrences(range_start, range_end)
+    )
+
+    by_day = {}
+    for start, end in intervals:
+        # Bookings crossing midnight are busy on every day they touch
+        day = max(start.date(), start_day)
+        while day <= end_day and datetime.combine(day, time.min) < end:
+            insort(by_day.setdefault(day, []), (start, end))
+            day += timedelta(days=1)
+    return {day: _merge(day_intervals) for day, day_intervals in by_day.items()}
+
+def _merge(intervals):
+    """
+    Merges sorted, possibly overlapping intervals.
+    """
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _as_day(value):
+    """
+    Normalises a bound (datetime, date, ISO string or None) to a date.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+import time as clock
+from flask import current_app
+
+class CalendarCache:
+    """
+    In-process cache of serialised calendar feed responses.
+
+    Each entry is keyed on the request arguments (start, end and filters) and
+    remembers the date range it covers, so a write only evicts the entries
+    of this worker whose range contains one of the dates it touched. Entries
+    also remember the shared data version they were computed under (see
+    dashboard_cache): every committed write bumps it, which makes the
+    entries of all the other workers stale at once. Entries older than
+    `max_age` seconds are dropped as well.
+    """
+
+    def __init__(self, max_entries=256, max_age=60):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, version=0):
+        """
+        Returns the cached (data, etag) pair for a key, or None when it is
+        missing, expired or was computed under another data version.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['version'] != version or clock.monotonic() - entry['stored_at'] > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry['data'], entry['etag']
+
+    def store(self, key, start, end, data, etag, version=0):
+        """
+        Stores a serialised response covering the [start, end] range,
+        computed under a data version. Open bounds are represented by None.
+        """
+        with self._lock:
+            self._entries[key] = {
+                'start': _as_naive(start),
+                'end': _as_naive(end, upper=True),
+                'data': data,
+                'etag': etag,
+                'version': version,
+                'stored_at': clock.monotonic()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, start=None, end=None):
+        """
+        Evicts every entry whose range overlaps [start, end].
+        Open bounds are represented by None.
+        """
+        start, end = _as_naive(start), _as_naive(end, upper=True)
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if (entry['start'] is None or end is None or entry['start'] <= end)
+                and (entry['end'] is None or start is None or start <= entry['end'])
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Evicts every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def get_calendar_cache():
+    """
+    Returns the calendar cache of the current application.
+    """
+    return current_app.extensions['calendar_cache']
+
+def _as_naive(value, upper=False):
+    """
+    Normalises a bound to a naive datetime (or None) so ranges coming from
+    timezone-aware query strings can be compared with database values.
+    Plain dates are widened to the start or, for upper bounds, the end of the day.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.max.time() if upper else datetime.min.time())
+    return value.replace(tzinfo=None)
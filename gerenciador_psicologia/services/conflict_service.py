@@ -0,0 +1,67 @@
+from ..app import db
+from ..models import Appointment
+from . import recurrence
+from bisect import bisect_left
+from datetime import timedelta
+
+# Longest accepted appointment, in minutes. It bounds the index range scanned
+# on `date` when looking for bookings that started before an interval.
+MAX_DURATION_MINUTES = 8 * 60
+
+def find_conflicts(intervals, exclude_ids=()):
+    """
+    Returns the sorted start dates of the bookings overlapping any of the
+    given (start, end) intervals.
+
+    Stored appointments are checked with a single set-based query: a GiST
+    range overlap on Postgres and an indexed range on (date, end_date)
+    elsewhere. Occurrences of rule-based series in the same span are
+    expanded and checked in memory.
+    """
+    if not intervals:
+        return []
+
+    intervals = sorted(intervals)
+    window_start = intervals[0][0] - timedelta(minutes=MAX_DURATION_MINUTES)
+    window_end = max(end for _, end in intervals)
+    dialect = db.session.get_bind().dialect.name
+
+    query = db.select(Appointment.date).where(
+        Appointment.is_cancelled == False,
+        Appointment.date > window_start,
+        Appointment.date < window_end,
+        db.or_(*[_overlaps(start, end, dialect) for start, end in intervals])
+    )
+    if exclude_ids:
+        query = query.where(Appointment.id.not_in(exclude_ids))
+    conflicts = set(db.session.scalars(query))
+
+    starts = [start for start, _ in intervals]
+    for series, occurrence_date in recurrence.iter_virtual_occurrences(window_start, window_end):
+        if series.id in exclude_ids:
+            continue
+        occurrence_end = occurrence_date + timedelta(minutes=series.duration)
+        # Intervals are sorted and disjoint, only the neighbours can overlap
+        position = bisect_left(starts, occurrence_end)
+        if position and intervals[position - 1][1] > occurrence_date:
+            conflicts.add(occurrence_date)
+
+    return sorted(conflicts)
+
+def check_conflicts(intervals, exclude_ids=()):
+    """
+    Raises ValueError when any of the given intervals overlaps a booking.
+    """
+    conflicts = find_conflicts(intervals, exclude_ids)
+    if conflicts:
+        raise ValueError(
+            f'Já existe uma consulta agendada para este horário ({conflicts[0].strftime("%d/%m/%Y %H:%M")}).'
+        )
+
+def _overlaps(start, end, dialect):
+    """
+    Overlap predicate between stored appointments and [start, end).
+    """
+    if dialect == 'postgresql':
+        return db.func.tsrange(Appointment.date, Appointment.end_date).op('&&')(db.func.tsrange(start, end))
+    return db.and_(Appointment.date < end, Appointment.end_date > start)
@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from flask import current_app
+
+class DashboardCache:
+    """
+    Dashboard context cache shared by every worker of the host.
+
+    Entries and the financial data version live in a SQLite file, so all
+    gunicorn workers read and invalidate the same cache without an external
+    service. Each entry stores the version it was computed under; writes to
+    financial data bump the version, which makes every older entry stale at
+    once. A cache without a path is disabled: every lookup misses and
+    nothing is stored.
+
+    The version also invalidates the calendar feed cache of every worker
+    (see calendar_cache). The file is created on the first dashboard or
+    calendar lookup, not when the app is built, so CLI and migration runs
+    leave no file behind. Until it exists nothing is cached, and bumping
+    the version is a no-op.
+    """
+
+    def __init__(self, path=None, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._created = False
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def version(self):
+        """
+        Returns the current financial data version, creating the file if
+        needed so the bumps of every worker are recorded from then on.
+        """
+        if not self.enabled:
+            return 0
+        with closing(self._connect()) as connection:
+            return connection.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+
+    def bump(self):
+        """
+        Increments the financial data version, making every entry stale.
+        """
+        if not self._exists():
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute('UPDATE data_version SET version = version + 1 WHERE id = 1')
+
+    def get(self, month):
+        """
+        Returns (data, None) for a fresh entry of a month, or (None, version)
+        on a miss, with the version the caller must store its result under.
+        """
+        if not self.enabled:
+            return None, 0
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                'SELECT v.version, e.version, e.data FROM data_version v'
+                ' LEFT JOIN dashboard_entry e ON e.month = ? WHERE v.id = 1',
+                (month,)
+            ).fetchone()
+        current, stored, data = row
+        if data is not None and stored == current:
+            return json.loads(data), None
+        return None, current
+
+    def store(self, month, version, data):
+        """
+        Stores the context of a month computed under `version`. Results
+        computed before a concurrent bump are stored with the old version and
+        therefore never served.
+        """
+        if not self.enabled:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO dashboard_entry (month, version, data) VALUES (?, ?, ?)',
+                (month, version, json.dumps(data))
+            )
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        if not self._exists():
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute('DELETE FROM dashboard_entry')
+
+    def _exists(self):
+        return self.enabled and (self._created or os.path.exists(self.path))
+
+    def _connect(self):
+        if not self._created:
+            self._create()
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _create(self):
+        """
+        Creates the cache file and its tables if needed. Safe to run from
+        several workers at once.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=self.timeout)) as connection, connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)'
+            )
+            connection.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS dashboard_entry (month TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL)'
+            )
+        self._created = True
+
+def get_dashboard_cache():
+    """
+    Returns the dashboard cache of the current application.
+    """
+    return current_app.extensions['dashboard_cache']
+
+def bump_financial_version():
+    """
+    Marks the financial data as changed after a committed write, so every
+    worker recomputes the dashboard and its calendar responses on its next
+    request.
+    """
+    get_dashboard_cache().bump()
@@ -0,0 +1,161 @@
+from ..app import db
+from ..models import Appointment, Patient, MonthlyFinancialRollup
+from . import recurrence, forecast
+from .dashboard_cache import get_dashboard_cache
+from flask import current_app
+from datetime import datetime, time
+from dateutil.relativedelta import relativedelta
+
+# Months shown by the dashboard chart, ending on the selected month
+CHART_MONTHS = 12
+
+# Appointment statuses shown as expected revenue
+EXPECTED_REVENUE_STATUSES = ('Realizada', 'Agendada')
+
+def get_dashboard_data(selected_date):
+    """
+    Computes everything the dashboard shows for a month in one round trip.
+
+    Monthly income and expenses (from the rollup), expected revenue by
+    status, the active patient count and the number of rule-based series in
+    the window are computed by a single SELECT over one-row aggregate
+    subqueries, using conditional aggregation for each month. Only when
+    rule-based series exist are their occurrences expanded, which costs two
+    more queries, and only when recurring series are active after the
+    selected month is the revenue forecast computed, which costs one.
+
+    Returns a dict with 'selected_month_summary' and 'previous_month_summary'
+    (income, expenses and profit), 'active_patients' and 'chart_data': the
+    labels, income, expenses and expected revenue by status of the
+    CHART_MONTHS months ending on the selected one, plus 'forecast_labels'
+    and 'forecast_data' for the FORECAST_MONTHS months after it.
+    """
+    last_month = selected_date.replace(day=1)
+    months = [last_month - relativedelta(months=offset) for offset in reversed(range(CHART_MONTHS))]
+    forecast_start = last_month + relativedelta(months=1)
+    forecast_months = current_app.config['FORECAST_MONTHS']
+    row = db.session.execute(_dashboard_query(months, forecast_start)).one()._mapping
+
+    income_data = [float(row[f'income_{index}']) for index in range(CHART_MONTHS)]
+    expense_data = [float(row[f'expense_{index}']) for index in range(CHART_MONTHS)]
+    expected = {
+        status: [float(row[f'{status}_{index}']) for index in range(CHART_MONTHS)]
+        for status in EXPECTED_REVENUE_STATUSES
+    }
+
+    if row['rule_series']:
+        # Occurrences of rule-based series are not stored, they are expected as 'Agendada'
+        month_index = {month.strftime('%Y-%m'): index for index, month in enumerate(months)}
+        occurrences = recurrence.iter_virtual_occurrences(
+            datetime.combine(months[0], time.min),
+            datetime.combine(months[-1] + relativedelta(months=1), time.min) - relativedelta(microseconds=1)
+        )
+        for series, occurrence_date in occurrences:
+            expected['Agendada'][month_index[occurrence_date.strftime('%Y-%m')]] += float(series.value)
+
+    if row['forecast_series']:
+        forecast_data = forecast.get_revenue_forecast(forecast_start, forecast_months)
+    else:
+        forecast_data = [0.0] * forecast_months
+
+    return {
+        'selected_month_summary': _summary(income_data[-1], expense_data[-1]),
+        'previous_month_summary': _summary(income_data[-2], expense_data[-2]),
+        'active_patients': row['active_patients'],
+        'chart_data': {
+            'labels': [month.strftime('%b/%Y') for month in months],
+            'income_data': income_data,
+            'expense_data': expense_data,
+            'expected_revenue_realizada_data': expected['Realizada'],
+            'expected_revenue_agendada_data': expected['Agendada'],
+            'forecast_labels': [
+                (forecast_start + relativedelta(months=offset)).strftime('%b/%Y') for offset in range(forecast_months)
+            ],
+            'forecast_data': forecast_data
+        }
+    }
+
+def get_cached_dashboard_data(selected_date):
+    """
+    Returns the dashboard data of a month from the shared dashboard cache,
+    computing and storing it when the cached copy is missing or older than
+    the current financial data version.
+    """
+    cache = get_dashboard_cache()
+    month = selected_date.strftime('%Y-%m')
+    data, version = cache.get(month)
+    if data is None:
+        data = get_dashboard_data(selected_date)
+        cache.store(month, version, data)
+    return data
+
+def _summary(income, expenses):
+    """
+    Builds a period summary dict.
+    """
+    return {'income': income, 'expenses': expenses, 'profit': income - expenses}
+
+def _sum_when(column, *conditions):
+    """
+    Conditional aggregate: the sum of `column` over the rows matching all
+    conditions, or zero.
+    """
+    return db.func.coalesce(db.func.sum(db.case((db.and_(*conditions), column))), 0)
+
+def _dashboard_query(months, forecast_start):
+    """
+    Builds the single SELECT behind the dashboard for the given months.
+    """
+    window_start = months[0]
+    window_end = months[-1] + relativedelta(months=1)
+    rollup = MonthlyFinancialRollup.__table__
+
+    payments = db.select(*[
+        _sum_when(rollup.c.total, rollup.c.month == month, rollup.c.payment_type == payment_type)
+        .label(f'{payment_type}_{index}')
+        for index, month in enumerate(months)
+        for payment_type in ('income', 'expense')
+    ]).where(
+        rollup.c.month >= window_start,
+        rollup.c.month < window_end
+    ).subquery('payments')
+
+    appointments = db.select(*[
+        _sum_when(Appointment.value, Appointment.month_bucket == month, Appointment.status == status)
+        .label(f'{status}_{index}')
+        for index, month in enumerate(months)
+        for status in EXPECTED_REVENUE_STATUSES
+    ]).where(
+        Appointment.month_bucket >= window_start,
+        Appointment.month_bucket < window_end,
+        Appointment.status.in_(EXPECTED_REVENUE_STATUSES),
+        Appointment.is_cancelled == False
+    ).subquery('appointments')
+
+    patients = db.select(
+        db.func.count(Patient.id).label('active_patients')
+    ).where(Patient.is_active == True).subquery('patients')
+
+    series = db.select(
+        db.func.count(Appointment.id).label('rule_series')
+    ).where(
+        Appointment.recurrence_mode == recurrence.RULE_MODE,
+        Appointment.date < datetime.combine(window_end, time.min),
+        db.or_(Appointment.recurrence_until.is_(None), Appointment.recurrence_until >= window_start)
+    ).subquery('series')
+
+    # Recurring series still running after the selected month feed the forecast
+    recurring = db.select(
+        db.func.count(Appointment.id).label('forecast_series')
+    ).where(
+        Appointment.is_recurring == True,
+        Appointment.recurrence_frequency.is_not(None),
+        Appointment.parent_appointment_id.is_(None),
+        db.or_(Appointment.recurrence_until.is_(None), Appointment.recurrence_until >= forecast_start)
+    ).subquery('recurring')
+
+    # Every subquery returns exactly one row, so joining them on TRUE yields one row
+    return db.select(payments, appointments, patients, series, recurring).select_from(
+        payments.join(appointments, db.true()).join(patients, db.true())
+        .join(series, db.true()).join(recurring, db.true())
+    )
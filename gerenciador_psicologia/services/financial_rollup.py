@@ -0,0 +1,111 @@
+from ..app import db
+from ..models import Payment, MonthlyFinancialRollup
+from datetime import date
+from decimal import Decimal
+from sqlalchemy.dialects import postgresql, sqlite
+import sqlalchemy as sa
+
+# The rollup is kept in sync by the Payment mapper events at the end of this
+# module, in the same flush (and transaction) as the payment write itself.
+rollup_table = MonthlyFinancialRollup.__table__
+
+def rebuild_rollup():
+    """
+    Recomputes the rollup from the payments table with a single
+    INSERT ... SELECT, replacing its contents in one transaction.
+    Returns the number of (month, payment_type) rows written.
+    """
+    db.session.execute(sa.delete(rollup_table))
+    db.session.execute(
+        sa.insert(rollup_table).from_select(
+            ['month', 'payment_type', 'total', 'payment_count'],
+            sa.select(Payment.month_bucket, Payment.payment_type, sa.func.sum(Payment.value), sa.func.count(Payment.id))
+            .group_by(Payment.month_bucket, Payment.payment_type)
+        )
+    )
+    db.session.commit()
+    return db.session.scalar(sa.select(sa.func.count()).select_from(rollup_table))
+
+def apply_delta(connection, month, payment_type, total, count):
+    """
+    Adds a delta to the rollup row of a month and type, creating it when
+    missing, with one upsert on the flush connection.
+    """
+    values = {
+        'month': month,
+        'payment_type': payment_type,
+        'total': Decimal(str(total)),
+        'payment_count': count
+    }
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(rollup_table).values(**values)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=[rollup_table.c.month, rollup_table.c.payment_type],
+            set_={
+                'total': rollup_table.c.total + insert.excluded.total,
+                'payment_count': rollup_table.c.payment_count + insert.excluded.payment_count
+            }
+        ))
+        return
+
+    result = connection.execute(
+        sa.update(rollup_table).where(
+            rollup_table.c.month == month,
+            rollup_table.c.payment_type == payment_type
+        ).values(
+            total=rollup_table.c.total + values['total'],
+            payment_count=rollup_table.c.payment_count + count
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(sa.insert(rollup_table).values(**values))
+
+def _payment_key(payment_date, payment_type, value):
+    """
+    Returns the rollup key and value of a payment state.
+    """
+    return (payment_date or date.today()).replace(day=1), payment_type or 'income', value or 0
+
+def _committed_value(state, attribute):
+    """
+    Returns the value of an attribute before the current flush.
+    """
+    history = state.attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.dict.get(attribute)
+
+@sa.event.listens_for(Payment, 'after_insert')
+def _payment_inserted(mapper, connection, target):
+    """Adds a new payment to the total of its month."""
+    state = sa.inspect(target)
+    month, payment_type, value = _payment_key(
+        state.dict.get('date'), state.dict.get('payment_type'), state.dict.get('value')
+    )
+    apply_delta(connection, month, payment_type, value, 1)
+
+@sa.event.listens_for(Payment, 'after_delete')
+def _payment_deleted(mapper, connection, target):
+    """Removes a deleted payment from the total of its month."""
+    state = sa.inspect(target)
+    month, payment_type, value = _payment_key(
+        _committed_value(state, 'date'), _committed_value(state, 'payment_type'), _committed_value(state, 'value')
+    )
+    apply_delta(connection, month, payment_type, -Decimal(str(value)), -1)
+
+@sa.event.listens_for(Payment, 'after_update')
+def _payment_updated(mapper, connection, target):
+    """Moves a payment between rollup rows when its date, type or value changes."""
+    state = sa.inspect(target)
+    if not any(state.attrs[attribute].history.has_changes() for attribute in ('date', 'payment_type', 'value')):
+        return
+
+    old_month, old_type, old_value = _payment_key(
+        _committed_value(state, 'date'), _committed_value(state, 'payment_type'), _committed_value(state, 'value')
+    )
+    new_month, new_type, new_value = _payment_key(target.date, target.payment_type, target.value)
+    apply_delta(connection, old_month, old_type, -Decimal(str(old_value)), -1)
+    apply_delta(connection, new_month, new_type, new_value, 1)
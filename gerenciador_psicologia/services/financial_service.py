@@ -1,31 +1,129 @@
 from ..app import db
-from ..models import Payment, Appointment
-from datetime import datetime
-from collections import defaultdict
-from dateutil.relativedelta import relativedelta
+from ..models import Payment, Appointment, Patient
+from ..pagination import fetch_keyset_page
+from ..loading import apply_profile
+from . import patient_summary
+from .dashboard_cache import bump_financial_version
+from datetime import datetime, date, time, timedelta
+
+# Rows fetched per round trip when streaming large result sets
+STREAM_BATCH_SIZE = 500
+
+# Rows per page of the payments list
+PAYMENT_PAGE_SIZE = 50
+
+PAYMENT_TYPES = ('income', 'expense')
+
+# Aging buckets of the receivables report: (key, first day, last day or None)
+AGING_BUCKETS = (
+    ('0_30', 0, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('90_plus', 91, None),
+)
+
+def iter_payments(start_date=None, end_date=None, payment_type=None, oldest_first=False):
+    """
+    Yields the payments of a period as plain dicts, newest first (or oldest
+    first), optionally of one type, fetching rows in batches from a
+    server-side cursor instead of loading the whole period.
+    """
+    query = db.select(
+        Payment.id,
+        Payment.date,
+        Payment.payment_type,
+        Payment.value,
+        Payment.notes,
+        Payment.patient_id,
+        Payment.appointment_id,
+        Patient.name.label('patient_name')
+    ).outerjoin(Patient, Payment.patient_id == Patient.id)
+    if start_date:
+        query = query.where(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d'))
+    if end_date:
+        query = query.where(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d'))
+    if payment_type:
+        query = query.where(Payment.payment_type == payment_type)
+    if oldest_first:
+        query = query.order_by(Payment.date, Payment.id)
+    else:
+        query = query.order_by(Payment.date.desc(), Payment.id.desc())
+
+    for row in db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+        yield {
+            'id': row.id,
+            'date': row.date.isoformat(),
+            'paymentType': row.payment_type,
+            'value': float(row.value),
+            'notes': row.notes,
+            'patientId': row.patient_id,
+            'patientName': row.patient_name,
+            'appointmentId': row.appointment_id
+        }
 
-def get_payments(start_date=None, end_date=None):
+def get_payments_page(start_date=None, end_date=None, after=None, before=None, limit=PAYMENT_PAGE_SIZE):
+    """
+    Returns one page of the payments of a period, newest first, with the
+    running balance of the period up to each row.
+
+    The balance is a window function (SUM ... OVER ordered by date and id)
+    evaluated by the database over the period, and pages are keyset cursors
+    on (date, id), so only the rows of the page reach the application.
+    """
+    signed_value = db.case((Payment.payment_type == 'income', Payment.value), else_=-Payment.value)
+    period = _payment_period_query(
+        db.select(
+            Payment.id,
+            Payment.date,
+            Payment.payment_type,
+            Payment.value,
+            Payment.notes,
+            Payment.patient_id,
+            Payment.appointment_id,
+            db.func.sum(signed_value).over(order_by=(Payment.date, Payment.id)).label('balance')
+        ),
+        start_date,
+        end_date
+    ).subquery('period')
+
+    query = db.select(period, Patient.name.label('patient_name')).outerjoin(
+        Patient, period.c.patient_id == Patient.id
+    )
+    return fetch_keyset_page(
+        query, period.c.date, period.c.id, date.fromisoformat,
+        after=after, before=before, limit=limit, descending=True
+    )
+
+def get_period_totals(start_date=None, end_date=None):
     """
-    Retrieves payments with optional date filters.
+    Returns the income, expenses, net total and number of payments of a
+    period, computed by a single aggregate query.
     """
-    query = Payment.query
-    if start_date:
-        query = query.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d'))
-    if end_date:
-        query = query.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d'))
-    return query.order_by(Payment.date.desc()).all()
+    row = db.session.execute(_payment_period_query(
+        db.select(
+            db.func.coalesce(db.func.sum(db.case((Payment.payment_type == 'income', Payment.value))), 0).label('income'),
+            db.func.coalesce(db.func.sum(db.case((Payment.payment_type == 'expense', Payment.value))), 0).label('expenses'),
+            db.func.count(Payment.id).label('count')
+        ),
+        start_date,
+        end_date
+    )).one()
+    return {
+        'income': row.income,
+        'expenses': row.expenses,
+        'total': row.income - row.expenses,
+        'count': row.count
+    }
 
-def get_total_value(payments):
+def _payment_period_query(query, start_date, end_date):
     """
-    Calculates the total value of a list of payments.
+    Restricts a payment query to the days [start_date, end_date] ('YYYY-MM-DD' strings).
     """
-    total = 0
-    for payment in payments:
-        if payment.payment_type == 'income':
-            total += payment.value
-        else:
-            total -= payment.value
-    return total
+    if start_date:
+        query = query.where(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.where(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    return query
 
 def register_payment(payment_data):
     """
@@ -51,20 +149,25 @@ def register_payment(payment_data):
 
     db.session.add(new_payment)
     db.session.commit()
+    bump_financial_version()
     return new_payment
 
 def delete_payment(payment):
     """
-    Deletes a payment.
+    Deletes a payment. A payment linked to a session reopens its balance.
     """
+    appointment_id = payment.appointment_id
     db.session.delete(payment)
+    if appointment_id:
+        patient_summary.refresh([db.session.get(Appointment, appointment_id).patient_id])
     db.session.commit()
+    bump_financial_version()
 
-def get_payment_by_id(payment_id):
+def get_payment_by_id(payment_id, profile=None):
     """
-    Retrieves a payment by its ID.
+    Retrieves a payment by its ID, applying an optional loading profile.
     """
-    return Payment.query.get_or_404(payment_id)
+    return apply_profile(Payment.query, profile).get_or_404(payment_id)
 
 def get_total_income():
     """
@@ -80,136 +183,51 @@ def get_total_expenses():
     total = db.session.query(db.func.sum(Payment.value)).filter(Payment.payment_type == 'expense').scalar()
     return total or 0
 
-def get_financial_summary_for_period(start_date, end_date):
-    """
-    Calculates financial summary (income, expenses, profit) for a given period.
-    """
-    income = db.session.query(db.func.sum(Payment.value)).filter(
-        Payment.payment_type == 'income',
-        Payment.date >= start_date,
-        Payment.date <= end_date
-    ).scalar() or 0
-
-    expenses = db.session.query(db.func.sum(Payment.value)).filter(
-        Payment.payment_type == 'expense',
-        Payment.date >= start_date,
-        Payment.date <= end_date
-    ).scalar() or 0
-
-    profit = income - expenses
-
-    return {
-        'income': income,
-        'expenses': expenses,
-        'profit': profit
-    }
-
-def get_expected_revenue_by_status_for_chart(start_date, end_date):
-    """
-    Retrieves expected revenue from 'Realizada' and 'Agendada' appointments 
-    for chart visualization, separated by status.
-    """
-    expected_revenue_by_month = db.session.query(
-        db.func.date_trunc('month', Appointment.date).label('month'),
-        Appointment.status,
-        db.func.sum(Appointment.value)
-    ).filter(
-        Appointment.status.in_(['Realizada', 'Agendada']),
-        db.func.cast(Appointment.date, db.Date) >= start_date,
-        db.func.cast(Appointment.date, db.Date) <= end_date
-    ).group_by('month', Appointment.status).all()
-
-    summary = defaultdict(lambda: {'Realizada': 0, 'Agendada': 0})
-    for month_date, status, total in expected_revenue_by_month:
-        month_key = month_date.strftime('%Y-%m')
-        if status in summary[month_key]:
-            summary[month_key][status] = float(total)
-
-    return summary
-
-
-def get_financial_summary_for_chart(selected_date=None):
-    """
-    Retrieves financial data for the last 12 months from the selected_date
-    for chart visualization.
-    """
-    if selected_date is None:
-        selected_date = datetime.utcnow().date()
-
-    # The chart should always end on the last day of the selected month
-    end_date = selected_date.replace(day=1) + relativedelta(months=1) - relativedelta(days=1)
-    
-    # The chart should start 11 months before the selected month
-    start_date = (selected_date.replace(day=1) - relativedelta(months=11))
-
-    # Filter payments within the 12-month window
-    income_by_month = db.session.query(
-        db.func.date_trunc('month', Payment.date).label('month'),
-        db.func.sum(Payment.value)
-    ).filter(
-        Payment.payment_type == 'income',
-        Payment.date >= start_date,
-        Payment.date <= end_date
-    ).group_by('month').all()
-
-    expenses_by_month = db.session.query(
-        db.func.date_trunc('month', Payment.date).label('month'),
-        db.func.sum(Payment.value)
-    ).filter(
-        Payment.payment_type == 'expense',
-        Payment.date >= start_date,
-        Payment.date <= end_date
-    ).group_by('month').all()
-
-    # Usando defaultdict para simplificar a inicialização
-    summary = defaultdict(lambda: {'income': 0, 'expense': 0})
-
-    for month_date, total in income_by_month:
-        month_key = month_date.strftime('%Y-%m')
-        summary[month_key]['income'] = float(total)
-
-    for month_date, total in expenses_by_month:
-        month_key = month_date.strftime('%Y-%m')
-        summary[month_key]['expense'] = float(total)
-
-    # Get expected revenue data by status
-    expected_revenue_summary = get_expected_revenue_by_status_for_chart(start_date, end_date)
-
-    # Generate all months in the range to ensure continuity
-    all_months = []
-    current_month = start_date
-    while current_month <= end_date:
-        all_months.append(current_month.strftime('%Y-%m'))
-        current_month += relativedelta(months=1)
-
-    # Populate summary with data, ensuring all months are present
-    for month_key in all_months:
-        summary[month_key]  # Ensures the key exists with default values
-
-    # Ordenando os meses para garantir a ordem cronológica no gráfico
-    sorted_months = sorted(summary.keys())
-
-    if not sorted_months:
-        return {
-            'labels': [],
-            'income_data': [],
-            'expense_data': [],
-            'expected_revenue_realizada_data': [],
-            'expected_revenue_agendada_data': []
-        }
-
-    # Use the generated list of all months for the labels
-    labels = [datetime.strptime(m, '%Y-%m').strftime('%b/%Y') for m in all_months]
-    income_data = [summary[m]['income'] for m in all_months]
-    expense_data = [summary[m]['expense'] for m in all_months]
-    
-    expected_revenue_realizada_data = [expected_revenue_summary.get(m, {}).get('Realizada', 0) for m in all_months]
-    expected_revenue_agendada_data = [expected_revenue_summary.get(m, {}).get('Agendada', 0) for m in all_months]
-
-    return {
-        'labels': labels,
-        'income_data': income_data,
-        'expense_data': expense_data,
-        'expected_revenue_realizada_data': expected_revenue_realizada_data,
-        'expected_revenue_agendada_data': expected_revenue_agendada_data
-    }
+def get_receivables(as_of=None):
+    """
+    Returns the completed ('Realizada') appointments that have no payment
+    linked to them, grouped by patient, with the amount due in each aging
+    bucket (days since the session, as of `as_of`, default today).
+
+    The report is one query: an anti-join (NOT EXISTS) against the payment
+    index on appointment_id, over the appointments found through the
+    (status, date) index, aggregated per patient with one conditional sum per
+    bucket. Bucket limits are computed here as datetimes, so no date
+    arithmetic runs in SQL.
+
+    Returns a dict with 'patients' (rows with patient_id, patient_name,
+    sessions, total, oldest and one column per bucket, largest debt first)
+    and 'totals' (sessions, total and per bucket sums).
+    """
+    as_of = as_of or date.today()
+    paid = db.select(Payment.id).where(Payment.appointment_id == Appointment.id).exists()
+
+    buckets = []
+    for key, first_day, last_day in AGING_BUCKETS:
+        # Sessions on or before the day as_of - first_day, and on or after as_of - last_day
+        conditions = [Appointment.date < datetime.combine(as_of - timedelta(days=first_day - 1), time.min)] if first_day else []
+        if last_day is not None:
+            conditions.append(Appointment.date >= datetime.combine(as_of - timedelta(days=last_day), time.min))
+        value = db.case((db.and_(*conditions), Appointment.value)) if conditions else Appointment.value
+        buckets.append(db.func.coalesce(db.func.sum(value), 0).label(f'bucket_{key}'))
+
+    total = db.func.sum(Appointment.value)
+    rows = db.session.execute(
+        db.select(
+            Appointment.patient_id,
+            Patient.name.label('patient_name'),
+            db.func.count(Appointment.id).label('sessions'),
+            total.label('total'),
+            db.func.min(Appointment.date).label('oldest'),
+            *buckets
+        ).join(Patient, Appointment.patient_id == Patient.id).where(
+            Appointment.status == 'Realizada',
+            Appointment.is_cancelled == False,
+            ~paid
+        ).group_by(Appointment.patient_id, Patient.name).order_by(total.desc(), Patient.name)
+    ).all()
+
+    totals = {'sessions': sum(row.sessions for row in rows), 'total': sum(row.total for row in rows)}
+    for key, _, _ in AGING_BUCKETS:
+        totals[f'bucket_{key}'] = sum(getattr(row, f'bucket_{key}') for row in rows)
+    return {'patients': rows, 'totals': totals}
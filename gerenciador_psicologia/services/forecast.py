@@ -0,0 +1,193 @@
+from ..app import db
+from ..models import Appointment, Patient
+from . import recurrence
+import numpy as np
+
+# Accepted forecast horizons, in months
+FORECAST_MIN_MONTHS = 3
+FORECAST_MAX_MONTHS = 24
+
+# Days between occurrences of the fixed-length frequencies; anything else is monthly
+FREQUENCY_DAYS = {'weekly': 7, 'biweekly': 14}
+
+def get_revenue_forecast(first_month, months):
+    """
+    Returns the revenue projected from the active recurring series for each
+    of the `months` months starting at the month of `first_month`.
+
+    Every active series definition (first occurrence, frequency, weekday,
+    end date and value) is loaded with one query and projected over the
+    window in batch by project_revenue, so open-ended series contribute to
+    every month of the horizon instead of stopping after the stored
+    occurrences.
+
+    Materialised series are read from their stored occurrences, loaded with
+    a second query: they count with their own date and value, and the rule
+    is projected from the latest one, so edits applied to part of the
+    series ('following' or held sessions left out of a 'series' edit) are
+    taken into account.
+    """
+    if not FORECAST_MIN_MONTHS <= months <= FORECAST_MAX_MONTHS:
+        raise ValueError(
+            f'O horizonte da previsão deve estar entre {FORECAST_MIN_MONTHS} e {FORECAST_MAX_MONTHS} meses.'
+        )
+    window_start = np.datetime64(first_month.replace(day=1), 'M')
+    window_end = (window_start + months).astype('datetime64[D]').item()
+
+    rows = db.session.execute(
+        db.select(
+            Appointment.id,
+            Appointment.date,
+            Appointment.recurrence_mode,
+            Appointment.recurrence_frequency,
+            Appointment.recurrence_day,
+            Appointment.recurrence_until,
+            Appointment.value
+        ).join(Patient, Appointment.patient_id == Patient.id).where(
+            Appointment.is_recurring == True,
+            Appointment.recurrence_frequency.is_not(None),
+            Appointment.parent_appointment_id.is_(None),
+            Appointment.is_cancelled == False,
+            Patient.is_active == True,
+            Appointment.date < window_end,
+            db.or_(Appointment.recurrence_until.is_(None), Appointment.recurrence_until >= first_month.replace(day=1))
+        )
+    ).all()
+
+    occurrences = _stored_occurrences([row.id for row in rows if row.recurrence_mode != recurrence.RULE_MODE])
+    series = []
+    stored = []
+    for row in rows:
+        if row.recurrence_mode == recurrence.RULE_MODE:
+            series.append((row.date, row.recurrence_frequency, row.recurrence_day, row.recurrence_until, row.value))
+            continue
+        *earlier, (latest_date, latest_value) = sorted([(row.date, row.value), *occurrences.get(row.id, ())])
+        series.append((latest_date, row.recurrence_frequency, latest_date.weekday(), row.recurrence_until, latest_value))
+        stored.extend(earlier)
+
+    revenue = project_revenue(
+        np.array([first.date() for first, *_ in series], dtype='datetime64[D]'),
+        np.array([frequency for _, frequency, *_ in series], dtype=object),
+        np.array([-1 if weekday is None else weekday for _, _, weekday, *_ in series], dtype=np.int64),
+        np.array([until or 'NaT' for *_, until, _ in series], dtype='datetime64[D]'),
+        np.array([float(value) for *_, value in series], dtype=np.float64),
+        window_start,
+        months
+    )
+    revenue += _bin_by_month(
+        np.array([occurrence_date.date() for occurrence_date, _ in stored], dtype='datetime64[D]'),
+        np.array([float(value) for _, value in stored], dtype=np.float64),
+        window_start,
+        months
+    )
+    return revenue.tolist()
+
+def _stored_occurrences(series_ids):
+    """
+    Returns {series id: [(date, value), ...]} with the stored, not cancelled
+    occurrences of materialised series after their first one.
+    """
+    if not series_ids:
+        return {}
+    occurrences = {}
+    for row in db.session.execute(
+        db.select(Appointment.parent_appointment_id, Appointment.date, Appointment.value).where(
+            Appointment.parent_appointment_id.in_(series_ids),
+            Appointment.is_cancelled == False
+        )
+    ):
+        occurrences.setdefault(row.parent_appointment_id, []).append((row.date, row.value))
+    return occurrences
+
+def _bin_by_month(dates, value, window_start, months):
+    """
+    Sums the values of the given dates (datetime64[D]) by month of the window.
+    """
+    month_index = (dates.astype('datetime64[M]') - window_start).astype(np.int64)
+    inside = (month_index >= 0) & (month_index < months)
+    return np.bincount(month_index[inside], weights=value[inside], minlength=months)[:months]
+
+def project_revenue(first, frequency, weekday, until, value, window_start, months):
+    """
+    Projects recurring series over `months` months from `window_start`
+    (a datetime64[M]) and returns the revenue of each month as an array.
+
+    Series are given as parallel arrays: first occurrence (datetime64[D]),
+    frequency, recurrence weekday (0 = Monday, -1 for none), last day
+    (NaT for open-ended series) and value per session.
+    """
+    revenue = np.zeros(months)
+    if not len(first):
+        return revenue
+
+    start_day = window_start.astype('datetime64[D]')
+    end_day = (window_start + months).astype('datetime64[D]') - 1
+    last = np.where(np.isnat(until), end_day, np.minimum(until, end_day))
+
+    step = np.array([FREQUENCY_DAYS.get(name, 0) for name in frequency], dtype=np.int64)
+    fixed = step > 0
+    revenue += _project_fixed_steps(first[fixed], step[fixed], weekday[fixed], last[fixed], value[fixed], start_day, window_start, months)
+    revenue += _project_monthly(first[~fixed], last[~fixed], value[~fixed], window_start, months)
+    return revenue
+
+def _project_fixed_steps(first, step, weekday, last, value, start_day, window_start, months):
+    """
+    Weekly and biweekly series: every occurrence inside the window is
+    generated at once and binned by month with a weighted bincount.
+    """
+    if not len(first):
+        return np.zeros(months)
+
+    # Occurrences fall on the recurrence weekday (1970-01-01 was a Thursday)
+    first_weekday = (first.astype(np.int64) + 3) % 7
+    anchor = first + np.where(weekday >= 0, (weekday - first_weekday) % 7, 0)
+
+    # Positions of the first and last occurrences inside the window
+    to_start = (start_day - anchor).astype(np.int64)
+    first_index = np.maximum(0, -(-to_start // step))
+    last_index = (last - anchor).astype(np.int64) // step
+    counts = np.maximum(0, last_index - first_index + 1)
+
+    series = np.repeat(np.arange(len(first)), counts)
+    position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first_index[series]
+    dates = anchor[series] + position * step[series]
+    month_index = (dates.astype('datetime64[M]') - window_start).astype(np.int64)
+    return np.bincount(month_index, weights=value[series], minlength=months)[:months]
+
+def _project_monthly(first, last, value, window_start, months):
+    """
+    Monthly series: one occurrence per month between the first occurrence
+    and the last day, added to each month of the window with a difference
+    array. Monthly steps are cumulative, as in recurrence.iter_occurrences:
+    once a shorter month clamps the day, every later occurrence keeps the
+    clamped day. The occurrence of the last month counts only when that day
+    is not past the last day.
+    """
+    if not len(first):
+        return np.zeros(months)
+
+    first_month = first.astype('datetime64[M]')
+    first_day_of_month = (first - first_month.astype('datetime64[D]')).astype(np.int64) + 1
+    last_month = last.astype('datetime64[M]')
+    last_day_of_month = (last - last_month.astype('datetime64[D]')).astype(np.int64) + 1
+
+    # Shortest month between the first repetition and the last month, by
+    # minimum reductions over [first_month + 1, last_month] ranges of month lengths
+    span_start = first_month.min() + 1
+    span = np.arange(span_start, np.maximum(last_month.max(), span_start) + 2)
+    month_length = ((span + 1).astype('datetime64[D]') - span.astype('datetime64[D]')).astype(np.int64)
+    range_start = (first_month + 1 - span_start).astype(np.int64)
+    range_stop = (last_month - span_start).astype(np.int64) + 1
+    bounds = np.clip(np.column_stack((range_start, range_stop)).ravel(), 0, len(month_length) - 1)
+    shortest = np.minimum.reduceat(month_length, bounds)[0::2]
+    day = np.where(range_stop > range_start, np.minimum(first_day_of_month, shortest), first_day_of_month)
+    last_month = np.where(day <= last_day_of_month, last_month, last_month - 1)
+
+    start = np.maximum((first_month - window_start).astype(np.int64), 0)
+    stop = (last_month - window_start).astype(np.int64) + 1
+    active = stop > start
+
+    difference = np.zeros(months + 1)
+    np.add.at(difference, start[active], value[active])
+    np.add.at(difference, stop[active], -value[active])
+    return np.cumsum(difference)[:months]
@@ -1,6 +1,34 @@
 from ..app import db
-from ..models import Patient, Appointment
-from datetime import datetime, timezone
+from ..models import Patient, Appointment, PatientSummary
+from . import patient_summary, recurrence
+from .calendar_cache import get_calendar_cache
+from .availability import get_occupancy_index
+from .autocomplete_cache import get_autocomplete_cache
+from .dashboard_cache import bump_financial_version
+from ..normalization import normalize_phone, normalize_text
+from ..pagination import fetch_keyset_page
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app
+from decimal import Decimal
+from typing import NamedTuple, Optional
+import re
+import sqlalchemy as sa
+
+# Patients per page of the patient list (and cap of the search results)
+PATIENT_PAGE_SIZE = 50
+
+# Shortest search term the trigram indexes can serve; shorter terms are matched by a scan
+SEARCH_MIN_INDEXED_LENGTH = 3
+
+# FTS5 matches scored with bm25 per search on SQLite; scoring every match of a
+# common term (e.g. a first name shared by 10% of 100k patients) takes ~20 ms
+SEARCH_CANDIDATE_LIMIT = 500
+
+# Largest number of suggestions the autocomplete returns
+AUTOCOMPLETE_MAX_LIMIT = 25
+
+# Terms made only of digits and phone punctuation are also matched against the phone
+PHONE_TERM = re.compile(r'^[\d\s()+.-]+$')
 
 def create_patient(patient_data):
     """
@@ -16,38 +44,64 @@ def create_patient(patient_data):
     )
     db.session.add(new_patient)
     db.session.commit()
+    get_autocomplete_cache().clear()
+    # The dashboard shows the active patient count
+    bump_financial_version()
     return new_patient
 
 def update_patient(patient, patient_data):
     """
     Updates an existing patient.
     """
+    name_changed = patient.name != patient_data['name']
     patient.name = patient_data['name']
     patient.email = patient_data['email']
     patient.phone = patient_data['phone']
     patient.birth_date = datetime.strptime(patient_data['birth_date'], '%Y-%m-%d').date()
     patient.notes = patient_data['notes']
     db.session.commit()
+    get_autocomplete_cache().clear()
+    if name_changed:
+        # The patient name is part of the title of all their calendar events
+        get_calendar_cache().clear()
+        bump_financial_version()
     return patient
 
 def delete_patient(patient):
     """
     Deletes a patient.
     """
+    patient_summary.forget(patient.id)
     db.session.delete(patient)
     db.session.commit()
+    get_autocomplete_cache().clear()
+    get_calendar_cache().clear()
+    get_occupancy_index().clear()
+    bump_financial_version()
 
 def deactivate_patient(patient):
     """
     Deactivates a patient and deletes their future appointments.
+    Rule-based series that started in the past are ended yesterday.
     """
     today = datetime.now(timezone.utc).date()
+    Appointment.query.filter(
+        Appointment.patient_id == patient.id,
+        Appointment.recurrence_mode == recurrence.RULE_MODE,
+        Appointment.date < today,
+        db.or_(Appointment.recurrence_until.is_(None), Appointment.recurrence_until >= today)
+    ).update({Appointment.recurrence_until: today - timedelta(days=1)}, synchronize_session=False)
     Appointment.query.filter(
         Appointment.patient_id == patient.id,
         Appointment.date >= today
     ).delete()
     patient.is_active = False
+    patient_summary.refresh([patient.id])
     db.session.commit()
+    get_autocomplete_cache().clear()
+    get_calendar_cache().invalidate(today, None)
+    get_occupancy_index().invalidate(today, None)
+    bump_financial_version()
 
 def activate_patient(patient):
     """
@@ -55,6 +109,8 @@ def activate_patient(patient):
     """
     patient.is_active = True
     db.session.commit()
+    get_autocomplete_cache().clear()
+    bump_financial_version()
 
 def get_patient_by_id(patient_id):
     """
@@ -62,14 +118,193 @@ def get_patient_by_id(patient_id):
     """
     return Patient.query.get_or_404(patient_id)
 
+class PatientRow(NamedTuple):
+    """
+    Read model of a patient list row: only the displayed columns, without
+    the ORM identity map and change tracking of a Patient instance. The
+    session and balance fields are filled on the list page only.
+    """
+    id: int
+    name: str
+    email: str
+    phone: str
+    birth_date: date
+    is_active: bool
+    last_session: Optional[datetime] = None
+    next_session: Optional[datetime] = None
+    sessions_this_month: int = 0
+    open_balance: Decimal = Decimal('0')
+
+PATIENT_ROW_COLUMNS = (Patient.id, Patient.name, Patient.email, Patient.phone, Patient.birth_date, Patient.is_active)
+
 def get_all_patients():
     """
-    Retrieves all patients.
+    Retrieves all patients as PatientRow tuples ordered by name.
+    """
+    return [
+        PatientRow(*row)
+        for row in db.session.execute(db.select(*PATIENT_ROW_COLUMNS).order_by(Patient.name, Patient.id))
+    ]
+
+def get_patients_page(active=True, search=None, after=None, before=None, limit=PATIENT_PAGE_SIZE):
+    """
+    Returns one page of the active (or inactive) patients as PatientRow tuples,
+    with their last and next sessions, sessions of the month and open balance
+    read from patient_summary with one outer join (patient_summary.list_columns).
+
+    Without a search term pages are keyset cursors on (name, id), served by
+    the (is_active, name, id) index, so every page reads at most `limit + 1`
+    rows. With a search term the `limit` most relevant matches are returned
+    on a single page. Returns a dict with 'items', 'previous' and 'next'
+    like fetch_keyset_page.
+    """
+    query = db.select(
+        *PATIENT_ROW_COLUMNS,
+        *patient_summary.list_columns()
+    ).outerjoin(PatientSummary, PatientSummary.patient_id == Patient.id).where(Patient.is_active == active)
+    if search:
+        rows = db.session.execute(search_patients(query, search, active=active).limit(limit)).all()
+        return {'items': [PatientRow(*row) for row in rows], 'previous': None, 'next': None}
+
+    page = fetch_keyset_page(query, Patient.name, Patient.id, str, after=after, before=before, limit=limit)
+    page['items'] = [PatientRow(*row) for row in page['items']]
+    return page
+
+def get_patient_row(patient_id):
+    """
+    Retrieves a patient as a PatientRow, or None when it does not exist.
+    """
+    row = db.session.execute(db.select(*PATIENT_ROW_COLUMNS).where(Patient.id == patient_id)).first()
+    return PatientRow(*row) if row else None
+
+def autocomplete_patients(term, limit=None):
+    """
+    Returns up to `limit` active patients matching a typed term, as dicts
+    with 'id', 'name' and 'email', for the patient pickers of the forms.
+
+    Patients whose normalized name starts with the term come first, read
+    from the name_normalized index in name order. When they do not fill the
+    limit and the term is long enough for the trigram indexes, the rest is
+    filled with search_patients matches (name, email or phone containing
+    the term). Results are kept in the in-process autocomplete cache.
     """
-    return Patient.query.order_by(Patient.name).all()
+    text = normalize_text(term or '')
+    if not text:
+        return []
+    limit = min(max(limit or current_app.config['PATIENT_AUTOCOMPLETE_LIMIT'], 1), AUTOCOMPLETE_MAX_LIMIT)
+
+    cache = get_autocomplete_cache()
+    key = (text, limit)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    active = db.select(Patient.id, Patient.name, Patient.email).where(Patient.is_active == True)
+    rows = db.session.execute(
+        active.where(_prefix_condition(Patient.name_normalized, text))
+        .order_by(Patient.name_normalized, Patient.id).limit(limit)
+    ).all()
+    if len(rows) < limit and len(text) >= SEARCH_MIN_INDEXED_LENGTH:
+        found = [row.id for row in rows]
+        rows += db.session.execute(
+            search_patients(active.where(Patient.id.not_in(found)), term, active=True).limit(limit - len(rows))
+        ).all()
+
+    results = [{'id': row.id, 'name': row.name, 'email': row.email} for row in rows]
+    cache.store(key, results)
+    return results
 
 def get_active_patients_count():
     """
     Counts the number of active patients.
     """
     return Patient.query.filter_by(is_active=True).count()
+
+def search_patients(query, term, active=None):
+    """
+    Restricts a patient query (ORM query or select) to the patients whose name or email contains
+    `term`, or whose phone contains the digits of a phone-like term, and orders them by relevance.
+    Pass `active` when the query is restricted to active (or inactive) patients.
+
+    The term is normalized like the stored name_normalized, email_normalized
+    and phone_normalized columns (accents removed, lowercased, phone reduced
+    to digits), so "joao" finds "João" and "98765-43" finds "(11) 98765-4321"
+    without calling unaccent() per row.
+
+    On PostgreSQL the LIKE filters are served by the pg_trgm GIN indexes and
+    results are ranked by trigram word similarity. On SQLite the term is
+    matched against the patient_search FTS5 trigram table and ranked with
+    bm25, weighting the name above the email and phone. Only the
+    SEARCH_CANDIDATE_LIMIT best ranked matches with the requested active
+    status are joined to the query, so the status filter and the ranking
+    apply before the cap and no match is dropped for its insertion order.
+    Terms shorter than a trigram fall back to a plain substring filter,
+    ranking name prefixes first.
+    """
+    text = normalize_text(term)
+    digits = normalize_phone(term) if PHONE_TERM.match(term) else ''
+    if len(digits) < SEARCH_MIN_INDEXED_LENGTH:
+        digits = None
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'sqlite' and len(text) >= SEARCH_MIN_INDEXED_LENGTH:
+        expression = '{name_normalized email_normalized} : ' + _fts_phrase(text)
+        if digits:
+            expression += ' OR phone_normalized : ' + _fts_phrase(digits)
+        search_table = sa.table('patient_search', sa.column('rowid'))
+        rank = sa.func.bm25(sa.literal_column('patient_search'), 10.0, 1.0, 1.0)
+        matches = db.select(search_table.c.rowid.label('patient_id'), rank.label('rank')).where(
+            sa.literal_column('patient_search').op('MATCH')(expression)
+        )
+        if active is not None:
+            candidate = db.aliased(Patient)
+            matches = matches.join(candidate, candidate.id == search_table.c.rowid).where(candidate.is_active == active)
+        matches = matches.order_by(rank).limit(SEARCH_CANDIDATE_LIMIT).subquery('matches')
+        return query.join(matches, matches.c.patient_id == Patient.id).order_by(matches.c.rank, Patient.name)
+
+    pattern = '%' + _escape_like(text) + '%'
+    condition = Patient.name_normalized.like(pattern, escape='\\') | Patient.email_normalized.like(pattern, escape='\\')
+    if digits:
+        condition |= Patient.phone_normalized.like('%' + digits + '%')
+    query = query.filter(condition)
+    if dialect == 'postgresql':
+        return query.order_by(
+            sa.func.greatest(
+                sa.func.word_similarity(text, Patient.name_normalized),
+                sa.func.word_similarity(text, Patient.email_normalized)
+            ).desc(),
+            Patient.name
+        )
+    prefix = _escape_like(text) + '%'
+    return query.order_by(sa.case((Patient.name_normalized.like(prefix, escape='\\'), 0), else_=1), Patient.name)
+
+def rebuild_search_index():
+    """
+    Rebuilds the patient_search FTS5 table from the patient table (SQLite
+    only; the PostgreSQL trigram indexes need no maintenance).
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(sa.text("INSERT INTO patient_search (patient_search) VALUES ('rebuild')"))
+        db.session.commit()
+
+def _prefix_condition(column, prefix):
+    """
+    Matches the values of a normalized column starting with `prefix`, in a
+    form its btree index can serve: LIKE 'prefix%' on PostgreSQL (the index
+    uses varchar_pattern_ops) and a range of the binary collation elsewhere.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return column.like(_escape_like(prefix) + '%', escape='\\')
+    return db.and_(column >= prefix, column < prefix + '\U0010ffff')
+
+def _fts_phrase(term):
+    """
+    Quotes a term as an FTS5 phrase.
+    """
+    return '"' + term.replace('"', '""') + '"'
+
+def _escape_like(term):
+    """
+    Escapes the LIKE wildcards of a search term.
+    """
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
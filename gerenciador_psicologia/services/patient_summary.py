@@ -0,0 +1,118 @@
+from ..app import db
+from ..models import Appointment, Patient, Payment, PatientSummary
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+import sqlalchemy as sa
+
+# The summary of a patient is recomputed from their appointments by the
+# service functions that write appointments or payments: they call refresh
+# with the affected patients before committing, so the row changes in the
+# same transaction with one statement. The next session and the sessions of
+# the month also change with the clock: the list hides the values that have
+# gone stale (list_columns) and `flask refresh-patient-summary`, meant to be
+# scheduled, recomputes those rows (refresh_stale_summaries).
+summary_table = PatientSummary.__table__
+
+# Statuses of the sessions that took place
+COMPLETED_STATUSES = ('Realizada', 'Paga')
+
+SUMMARY_COLUMNS = ['patient_id', 'last_session', 'next_session', 'month', 'sessions_this_month', 'open_balance']
+
+def refresh(patient_ids, now=None):
+    """
+    Recomputes the summary rows of the given patients with one upsert
+    (INSERT ... SELECT ... ON CONFLICT on PostgreSQL and SQLite). Pending
+    changes are flushed first. Does not commit.
+    """
+    patient_ids = sorted(set(patient_ids) - {None})
+    if not patient_ids:
+        return
+    db.session.flush()
+    query = _summary_query(Patient.id.in_(patient_ids), now)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(summary_table)
+        insert = insert.from_select(SUMMARY_COLUMNS, query)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=[summary_table.c.patient_id],
+            set_={column: insert.excluded[column] for column in SUMMARY_COLUMNS[1:]}
+        ))
+        return
+    db.session.execute(sa.delete(summary_table).where(summary_table.c.patient_id.in_(patient_ids)))
+    db.session.execute(sa.insert(summary_table).from_select(SUMMARY_COLUMNS, query))
+
+def refresh_stale_summaries(now=None):
+    """
+    Recomputes the summaries the clock has made stale (their next session
+    has started or their month has ended) and commits. Returns the number
+    of refreshed patients.
+    """
+    now = now or datetime.now()
+    stale = db.session.scalars(sa.select(summary_table.c.patient_id).where(
+        sa.or_(summary_table.c.next_session <= now, summary_table.c.month != _month(now))
+    )).all()
+    if stale:
+        refresh(stale, now)
+        db.session.commit()
+    return len(stale)
+
+def rebuild_summaries(now=None):
+    """
+    Recomputes the summary of every patient from the appointments and
+    payments tables, replacing the table contents in one transaction.
+    Returns the number of rows written.
+    """
+    db.session.execute(sa.delete(summary_table))
+    db.session.execute(sa.insert(summary_table).from_select(SUMMARY_COLUMNS, _summary_query(sa.true(), now)))
+    db.session.commit()
+    return db.session.scalar(sa.select(sa.func.count()).select_from(summary_table))
+
+def forget(patient_id):
+    """
+    Deletes the summary row of a patient about to be deleted. Does not commit.
+    """
+    db.session.execute(sa.delete(summary_table).where(summary_table.c.patient_id == patient_id))
+
+def list_columns(now=None):
+    """
+    Returns the summary columns of the patient list, read from
+    patient_summary joined to the patient. A next session that has already
+    started and the count of a past month are returned as NULL until the
+    row is refreshed.
+    """
+    now = now or datetime.now()
+    return (
+        PatientSummary.last_session,
+        sa.case((PatientSummary.next_session > now, PatientSummary.next_session)).label('next_session'),
+        sa.case((PatientSummary.month == _month(now), PatientSummary.sessions_this_month)).label('sessions_this_month'),
+        sa.func.coalesce(PatientSummary.open_balance, 0).label('open_balance')
+    )
+
+def _month(now):
+    return now.date().replace(day=1)
+
+def _summary_query(condition, now=None):
+    """
+    Builds the SELECT computing, for the patients matching `condition`, the
+    last completed session, the next session, the sessions of the current
+    month and the open balance (completed sessions without a linked payment,
+    as in the receivables report), grouped over one outer join. Cancelled
+    appointments are ignored and patients without appointments get an
+    empty row.
+
+    Only stored appointments are counted: the occurrences of rule-based
+    series count through their series row and exception rows.
+    """
+    now = now or datetime.now()
+    month = _month(now)
+    paid = sa.select(Payment.id).where(Payment.appointment_id == Appointment.id).exists()
+    return sa.select(
+        Patient.id,
+        sa.func.max(sa.case((Appointment.status.in_(COMPLETED_STATUSES), Appointment.date))),
+        sa.func.min(sa.case((Appointment.date > now, Appointment.date))),
+        sa.literal(month, sa.Date()),
+        sa.func.count(sa.case((Appointment.month_bucket == month, Appointment.id))),
+        sa.func.coalesce(sa.func.sum(sa.case((sa.and_(Appointment.status == 'Realizada', ~paid), Appointment.value))), 0)
+    ).select_from(Patient).outerjoin(
+        Appointment, sa.and_(Appointment.patient_id == Patient.id, Appointment.is_cancelled == False)
+    ).where(condition).group_by(Patient.id)
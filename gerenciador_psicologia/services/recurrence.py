@@ -0,0 +1,132 @@
+from ..app import db
+from ..models import Appointment, Patient
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+
+RULE_MODE = 'rule'
+MATERIALIZED_MODE = 'materialized'
+
+# Upper bound of occurrences generated for open-ended materialized series
+MAX_MATERIALIZED_RECURRENCES = 52
+
+FREQUENCY_STEPS = {
+    'weekly': relativedelta(weeks=1),
+    'biweekly': relativedelta(weeks=2),
+    'monthly': relativedelta(months=1),
+}
+
+def get_step(frequency):
+    """
+    Returns the interval between occurrences for a recurrence frequency.
+    Unknown frequencies fall back to monthly, as the booking form does.
+    """
+    return FREQUENCY_STEPS.get(frequency, FREQUENCY_STEPS['monthly'])
+
+def iter_occurrences(first_date, frequency, until=None, start=None, end=None, limit=None):
+    """
+    Yields the dates of a series after its first occurrence, in order.
+
+    Occurrences past `until` (a date) are never generated, the ones before
+    `start` are skipped and generation stops after `end`. `limit` caps the
+    position of an occurrence inside the series, counted from the first
+    repetition. Monthly steps are applied cumulatively, exactly like the
+    materialised series always did.
+    """
+    if end is None and until is None and limit is None:
+        raise ValueError('Séries sem data final exigem um limite ou uma janela de datas.')
+
+    step = get_step(frequency)
+    index = 1
+    current = first_date + step
+
+    # Weekly steps have a fixed length, so we can jump straight into the window
+    if start is not None and frequency in ('weekly', 'biweekly') and current < start:
+        step_length = step.weeks * 7 * 86400
+        skipped = int((start - current).total_seconds() // step_length)
+        index += skipped
+        current = first_date + relativedelta(weeks=step.weeks * index)
+
+    while limit is None or index <= limit:
+        if until and current.date() > until:
+            break
+        if end is not None and current > end:
+            break
+        if start is None or current >= start:
+            yield current
+        index += 1
+        current = current + step
+
+def iter_virtual_occurrences(start=None, end=None, patient_id=None):
+    """
+    Yields (series, occurrence_date) pairs for the occurrences of rule-based
+    series inside [start, end] that are not overridden by an exception row,
+    optionally only for the series of one patient.
+
+    `series` is a projected row with the columns of the parent appointment and
+    the patient name. The first occurrence is the parent row itself and is not
+    yielded. Open-ended windows stop at the materialised series limit.
+    """
+    query = db.select(
+        Appointment.id,
+        Appointment.patient_id,
+        Appointment.date,
+        Appointment.duration,
+        Appointment.value,
+        Appointment.notes,
+        Appointment.recurrence_frequency,
+        Appointment.recurrence_until,
+        Patient.name.label('patient_name')
+    ).join(Patient, Appointment.patient_id == Patient.id).where(
+        Appointment.recurrence_mode == RULE_MODE
+    )
+    if end is not None:
+        query = query.where(Appointment.date <= end)
+    if patient_id is not None:
+        query = query.where(Appointment.patient_id == patient_id)
+    if start is not None:
+        query = query.where(db.or_(
+            Appointment.recurrence_until.is_(None),
+            Appointment.recurrence_until >= start.date()
+        ))
+
+    series_rows = db.session.execute(query).all()
+    if not series_rows:
+        return
+
+    exceptions_query = db.select(
+        Appointment.parent_appointment_id,
+        Appointment.original_date
+    ).where(
+        Appointment.parent_appointment_id.in_([series.id for series in series_rows]),
+        Appointment.original_date.is_not(None)
+    )
+    if start is not None:
+        exceptions_query = exceptions_query.where(Appointment.original_date >= start)
+    if end is not None:
+        exceptions_query = exceptions_query.where(Appointment.original_date <= end)
+    overridden = set(db.session.execute(exceptions_query).all())
+
+    limit = MAX_MATERIALIZED_RECURRENCES if end is None else None
+    for series in series_rows:
+        for occurrence in iter_occurrences(series.date, series.recurrence_frequency,
+                                           series.recurrence_until, start, end, limit):
+            if (series.id, occurrence) not in overridden:
+                yield series, occurrence
+
+def is_occurrence(series, occurrence_date):
+    """
+    Checks whether a date is one of the generated occurrences of a series.
+    """
+    if occurrence_date <= series.date:
+        return False
+    return any(
+        occurrence == occurrence_date
+        for occurrence in iter_occurrences(series.date, series.recurrence_frequency,
+                                           series.recurrence_until, occurrence_date, occurrence_date)
+    )
+
+def parse_occurrence_date(value):
+    """
+    Parses the occurrence identifier used in URLs (ISO 8601 datetime).
+    """
+    return datetime.fromisoformat(value).replace(tzinfo=None)
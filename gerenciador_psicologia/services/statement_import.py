@@ -0,0 +1,297 @@
+from ..app import db
+from ..models import Payment
+from . import financial_rollup
+from .dashboard_cache import bump_financial_version
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+import sqlalchemy as sa
+
+STATEMENT_FORMATS = ('csv', 'ofx')
+
+# Statement lines checked against the database and inserted per round trip
+IMPORT_BATCH_SIZE = 1000
+
+# Lines shown by the dry-run preview
+IMPORT_PREVIEW_SIZE = 20
+
+# Accepted CSV headers (accents and case ignored)
+CSV_DATE_HEADERS = ('data', 'date', 'data lancamento', 'data do lancamento', 'data movimento')
+CSV_DESCRIPTION_HEADERS = ('descricao', 'historico', 'description', 'memo', 'lancamento', 'detalhes')
+CSV_AMOUNT_HEADERS = ('valor', 'amount', 'valor (r$)', 'valor r$')
+
+CSV_DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d/%m/%y', '%d-%m-%Y')
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+def detect_format(filename):
+    """
+    Returns the statement format of a file name: 'ofx' for .ofx/.qfx files,
+    'csv' otherwise.
+    """
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+def iter_statement(stream, statement_format):
+    """
+    Yields the lines of a bank statement (a binary file object) as dicts with
+    'date', 'value' (positive), 'payment_type', 'notes' and 'fingerprint',
+    reading the file line by line.
+    """
+    if statement_format not in STATEMENT_FORMATS:
+        raise ValueError(f'Formato de extrato inválido: {statement_format}')
+    lines = _decode_lines(stream)
+    return _iter_ofx(lines) if statement_format == 'ofx' else _iter_csv(lines)
+
+def import_statement(stream, statement_format, dry_run=False):
+    """
+    Imports a bank statement as payments, skipping the lines already
+    imported (same fingerprint) or repeated in the file.
+
+    Lines are processed in batches of IMPORT_BATCH_SIZE: one query finds the
+    fingerprints already stored and the new rows are bulk inserted with COPY
+    on PostgreSQL and executemany elsewhere. Bulk inserts bypass the mapper
+    events, so the monthly rollup is updated with one delta per month and
+    type at the end. With dry_run nothing is written.
+
+    Returns a summary dict with the number of lines, new and duplicate lines,
+    the income and expenses to import and a preview of the first lines.
+    """
+    summary = {
+        'lines': 0,
+        'new': 0,
+        'duplicates': 0,
+        'income': Decimal('0'),
+        'expenses': Decimal('0'),
+        'preview': []
+    }
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    seen = set()
+
+    batch = []
+    try:
+        for entry in iter_statement(stream, statement_format):
+            batch.append(entry)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _import_batch(batch, seen, summary, deltas, dry_run)
+                batch = []
+        if batch:
+            _import_batch(batch, seen, summary, deltas, dry_run)
+    except Exception:
+        # A malformed line discards the batches already inserted
+        db.session.rollback()
+        raise
+
+    if dry_run:
+        return summary
+
+    connection = db.session.connection()
+    for (month, payment_type), (total, count) in deltas.items():
+        financial_rollup.apply_delta(connection, month, payment_type, total, count)
+    db.session.commit()
+    if summary['new']:
+        bump_financial_version()
+    return summary
+
+def _import_batch(batch, seen, summary, deltas, dry_run):
+    """
+    Deduplicates and, unless dry_run, inserts one batch of statement lines.
+    """
+    fingerprints = [entry['fingerprint'] for entry in batch]
+    stored = set(db.session.scalars(
+        sa.select(Payment.import_fingerprint).where(Payment.import_fingerprint.in_(fingerprints))
+    ))
+
+    rows = []
+    for entry in batch:
+        duplicate = entry['fingerprint'] in stored or entry['fingerprint'] in seen
+        summary['lines'] += 1
+        if len(summary['preview']) < IMPORT_PREVIEW_SIZE:
+            summary['preview'].append(dict(entry, duplicate=duplicate))
+        if duplicate:
+            summary['duplicates'] += 1
+            continue
+
+        seen.add(entry['fingerprint'])
+        summary['new'] += 1
+        summary['income' if entry['payment_type'] == 'income' else 'expenses'] += entry['value']
+        month = entry['date'].replace(day=1)
+        deltas[(month, entry['payment_type'])][0] += entry['value']
+        deltas[(month, entry['payment_type'])][1] += 1
+        rows.append({
+            'date': entry['date'],
+            'value': entry['value'],
+            'notes': entry['notes'],
+            'payment_type': entry['payment_type'],
+            'month_bucket': month,
+            'import_fingerprint': entry['fingerprint']
+        })
+
+    if rows and not dry_run:
+        _bulk_insert(rows)
+
+def _bulk_insert(rows):
+    """
+    Inserts payment rows with COPY on PostgreSQL and executemany elsewhere.
+    """
+    connection = db.session.connection()
+    columns = ('date', 'value', 'notes', 'payment_type', 'month_bucket', 'import_fingerprint')
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY payment ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        return
+    connection.execute(sa.insert(Payment.__table__), rows)
+
+def _entry(entry_date, amount, notes, fingerprint_source):
+    """
+    Builds a statement line from a signed amount: credits are income and
+    debits are expenses.
+    """
+    return {
+        'date': entry_date,
+        'value': abs(amount),
+        'payment_type': 'income' if amount > 0 else 'expense',
+        'notes': notes or None,
+        'fingerprint': hashlib.sha256(fingerprint_source.encode('utf-8')).hexdigest()
+    }
+
+def _iter_csv(lines):
+    """
+    Parses a CSV statement with date, description and amount columns,
+    separated by commas or semicolons.
+    """
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    header = [_normalize(column) for column in next(csv.reader([first], delimiter=delimiter))]
+    date_index = _column_index(header, CSV_DATE_HEADERS, 'data')
+    amount_index = _column_index(header, CSV_AMOUNT_HEADERS, 'valor')
+    description_index = _column_index(header, CSV_DESCRIPTION_HEADERS, None)
+
+    # Identical lines in one file are distinct transactions: their position among
+    # the identical lines is part of the fingerprint
+    occurrences = Counter()
+    for number, row in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            entry_date = _parse_date(row[date_index])
+            amount = _parse_amount(row[amount_index])
+        except (IndexError, ValueError):
+            raise ValueError(f'Linha {number} do extrato inválida: {delimiter.join(row)}') from None
+        if not amount:
+            continue
+        description = row[description_index].strip() if description_index is not None else ''
+        key = f'{entry_date.isoformat()}|{amount}|{_normalize(description)}'
+        occurrences[key] += 1
+        yield _entry(entry_date, amount, description, f'csv|{key}|{occurrences[key]}')
+
+def _iter_ofx(lines):
+    """
+    Parses the <STMTTRN> blocks of an OFX statement (SGML or XML flavour),
+    tag by tag, so files with one transaction per line or everything on a
+    single line are both read incrementally.
+    """
+    transaction = None
+    for line in lines:
+        for match in OFX_TAG.finditer(line):
+            closing, tag, value = match.group(1), match.group(2).upper(), match.group(3).strip()
+            if tag == 'STMTTRN':
+                if closing:
+                    entry = _ofx_entry(transaction) if transaction is not None else None
+                    if entry is not None:
+                        yield entry
+                    transaction = None
+                else:
+                    transaction = {}
+            elif transaction is not None and not closing and value:
+                transaction[tag] = value
+
+def _ofx_entry(transaction):
+    """
+    Builds a statement line from the fields of an OFX transaction, or None
+    for zero-amount transactions.
+    """
+    try:
+        entry_date = datetime.strptime(transaction['DTPOSTED'][:8], '%Y%m%d').date()
+        amount = _parse_amount(transaction['TRNAMT'])
+    except (KeyError, ValueError):
+        raise ValueError(f'Transação OFX inválida: {transaction}') from None
+    if not amount:
+        return None
+    notes = transaction.get('MEMO') or transaction.get('NAME')
+    return _entry(entry_date, amount, notes, f"ofx|{transaction.get('FITID', '')}|{entry_date.isoformat()}|{amount}")
+
+def _decode_lines(stream):
+    """
+    Yields the text lines of a binary stream, decoding each line as UTF-8
+    and falling back to Windows-1252, the usual encoding of bank exports.
+    """
+    first = True
+    for raw in stream:
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            line = raw.decode('cp1252', errors='replace')
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        yield line.rstrip('\r\n')
+
+def _column_index(header, names, label):
+    """
+    Returns the position of the first header in `names`. Raises ValueError
+    when a required column (label not None) is missing.
+    """
+    for index, column in enumerate(header):
+        if column in names:
+            return index
+    if label is None:
+        return None
+    raise ValueError(f'Coluna "{label}" não encontrada no extrato.')
+
+def _normalize(text):
+    """
+    Lowercases text and strips accents and surrounding whitespace.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.strip().lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def _parse_date(text):
+    """
+    Parses a statement date in one of CSV_DATE_FORMATS.
+    """
+    text = text.strip()
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Data inválida: {text}')
+
+def _parse_amount(text):
+    """
+    Parses a signed amount written as 1234.56, 1.234,56 or -R$ 1.234,56,
+    rounded to cents.
+    """
+    text = text.strip().replace('R$', '').replace(' ', '')
+    if ',' in text and ('.' not in text or text.rfind(',') > text.rfind('.')):
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    try:
+        return Decimal(text).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'Valor inválido: {text}') from None
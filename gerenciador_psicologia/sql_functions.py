@@ -0,0 +1,47 @@
+"""
+Funções SQL portáveis entre Postgres e SQLite.
+"""
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+class shift_datetime(FunctionElement):
+    """
+    shift_datetime(column, seconds): soma um deslocamento em segundos a uma
+    coluna DateTime, mantendo o formato de armazenamento de cada banco.
+    """
+    type = sa.DateTime()
+    name = 'shift_datetime'
+    inherit_cache = True
+
+@compiles(shift_datetime)
+def _compile_shift_datetime(element, compiler, **kw):
+    column, seconds = list(element.clauses)
+    return compiler.process(column + sa.literal_column("interval '1 second'") * seconds, **kw)
+
+@compiles(shift_datetime, 'sqlite')
+def _compile_shift_datetime_sqlite(element, compiler, **kw):
+    column, seconds = list(element.clauses)
+    # O SQLAlchemy grava DateTime no SQLite como 'YYYY-MM-DD HH:MM:SS.ffffff'
+    return compiler.process(
+        sa.func.strftime('%Y-%m-%d %H:%M:%f000', column, sa.func.printf('%+d seconds', seconds)),
+        **kw
+    )
+
+class month_start(FunctionElement):
+    """
+    month_start(column): primeiro dia do mês de uma coluna Date ou DateTime, como Date.
+    """
+    type = sa.Date()
+    name = 'month_start'
+    inherit_cache = True
+
+@compiles(month_start)
+def _compile_month_start(element, compiler, **kw):
+    column, = list(element.clauses)
+    return compiler.process(sa.cast(sa.func.date_trunc('month', column), sa.Date), **kw)
+
+@compiles(month_start, 'sqlite')
+def _compile_month_start_sqlite(element, compiler, **kw):
+    column, = list(element.clauses)
+    return compiler.process(sa.func.date(column, 'start of month'), **kw)
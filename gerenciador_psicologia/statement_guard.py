@@ -0,0 +1,57 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+from .extensions import db
+
+class StatementLimitExceeded(AssertionError):
+    """Raised when a request issues more SQL statements than allowed."""
+
+def init_statement_guard(app):
+    """
+    Fails every request of a testing app that issues more than
+    SQL_STATEMENT_LIMIT statements, so N+1 query patterns break the tests
+    instead of slipping into production. Statements issued while a streamed
+    response is generated are counted too, and checked once the stream is
+    exhausted. Does nothing when the limit is not configured or the app is
+    not in testing mode.
+    """
+    limit = app.config.get('SQL_STATEMENT_LIMIT')
+    if not app.testing or not limit:
+        return
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    @app.before_request
+    def start_counting():
+        g.sql_statements = []
+
+    @app.after_request
+    def check_statement_count(response):
+        if response.is_streamed:
+            # The body is generated after this hook, with the request context
+            # kept by stream_with_context, so the same list keeps counting
+            response.response = _checked_stream(response.response, g.sql_statements, limit)
+            return response
+        _check_statements(g.pop('sql_statements', []), limit)
+        return response
+
+def _checked_stream(chunks, statements, limit):
+    """
+    Yields the chunks of a streamed body, then checks the statements issued
+    by the whole request.
+    """
+    yield from chunks
+    _check_statements(statements, limit)
+
+def _check_statements(statements, limit):
+    """
+    Raises StatementLimitExceeded when more than `limit` statements were issued.
+    """
+    if len(statements) > limit:
+        raise StatementLimitExceeded(
+            f'{len(statements)} instruções SQL executadas (limite: {limit}):\n' + '\n'.join(statements)
+        )
@@ -35,8 +35,10 @@ document.addEventListener('DOMContentLoaded', function() {
         select: function(info) {
             // Clear form
             document.getElementById('appointmentForm').reset();
+            setPatientAutocomplete('patientId', '', '');
             document.getElementById('appointmentDate').value = info.startStr.slice(0, 16);
             document.getElementById('appointmentId').value = '';
+            document.getElementById('appointmentScope').value = 'single';
             
             // Show modal for new appointment
             document.getElementById('modalTitle').textContent = 'Nova Consulta';
@@ -44,7 +46,13 @@ document.addEventListener('DOMContentLoaded', function() {
             appointmentModal.show();
         },
         eventClick: function(info) {
-            window.location.href = `/appointments/${info.event.id}/edit`;
+            const props = info.event.extendedProps;
+            if (props.occurrenceDate) {
+                // Ocorrência virtual de uma série baseada em regra
+                window.location.href = `/appointments/${props.parentId}/occurrences/${props.occurrenceDate}/edit`;
+            } else {
+                window.location.href = `/appointments/${info.event.id}/edit`;
+            }
         },
         eventDrop: function(info) {
             updateAppointment(info.event);
@@ -140,57 +148,41 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Handle recurrence edit modal buttons
-    document.getElementById('editOccurrenceBtn').addEventListener('click', function() {
-        const appointmentId = document.getElementById('recurrenceEditId').value;
-        const action = document.getElementById('recurrenceEditAction').value;
-        
-        recurrenceEditModal.hide();
+    // Handle recurrence edit modal buttons: apenas esta, esta e as seguintes ou toda a série
+    const scopeTitles = {
+        single: 'Editar Consulta',
+        following: 'Editar Esta e as Seguintes',
+        series: 'Editar Série de Consultas'
+    };
 
-        if (action === 'edit') {
-            const event = calendar.getEventById(appointmentId);
-            // Populate form with event data
-            document.getElementById('appointmentId').value = event.id;
-            document.getElementById('appointmentDate').value = event.start.toISOString().slice(0, 16);
-            document.getElementById('patientId').value = event.extendedProps.patientId;
-            document.getElementById('value').value = event.extendedProps.value;
-            document.getElementById('notes').value = event.extendedProps.notes;
-            
-            // Show modal for editing
-            document.getElementById('modalTitle').textContent = 'Editar Consulta';
-            document.getElementById('deleteButton').style.display = 'block';
-            appointmentModal.show();
-        } else if (action === 'delete') {
-            document.getElementById('deleteConfirmId').value = appointmentId;
-            document.getElementById('deleteConfirmScope').value = 'single';
-            deleteConfirmModal.show();
-        }
-    });
+    document.querySelectorAll('.recurrence-scope-btn').forEach(function(button) {
+        button.addEventListener('click', function() {
+            const scope = this.dataset.scope;
+            const appointmentId = document.getElementById('recurrenceEditId').value;
+            const action = document.getElementById('recurrenceEditAction').value;
 
-    document.getElementById('editSeriesBtn').addEventListener('click', function() {
-        const appointmentId = document.getElementById('recurrenceEditId').value;
-        const action = document.getElementById('recurrenceEditAction').value;
+            recurrenceEditModal.hide();
 
-        recurrenceEditModal.hide();
+            if (action === 'edit') {
+                const event = calendar.getEventById(appointmentId);
+                // Populate form with event data
+                document.getElementById('appointmentId').value = event.id;
+                document.getElementById('appointmentScope').value = scope;
+                document.getElementById('appointmentDate').value = event.start.toISOString().slice(0, 16);
+                setPatientAutocomplete('patientId', event.extendedProps.patientId, event.extendedProps.patientName);
+                document.getElementById('value').value = event.extendedProps.value;
+                document.getElementById('notes').value = event.extendedProps.notes;
 
-        if (action === 'edit') {
-            const event = calendar.getEventById(appointmentId);
-            // Populate form with event data
-            document.getElementById('appointmentId').value = event.id;
-            document.getElementById('appointmentDate').value = event.start.toISOString().slice(0, 16);
-            document.getElementById('patientId').value = event.extendedProps.patientId;
-            document.getElementById('value').value = event.extendedProps.value;
-            document.getElementById('notes').value = event.extendedProps.notes;
-            
-            // Show modal for editing
-            document.getElementById('modalTitle').textContent = 'Editar Série de Consultas';
-            document.getElementById('deleteButton').style.display = 'block';
-            appointmentModal.show();
-        } else if (action === 'delete') {
-            document.getElementById('deleteConfirmId').value = appointmentId;
-            document.getElementById('deleteConfirmScope').value = 'series';
-            deleteConfirmModal.show();
-        }
+                // Show modal for editing
+                document.getElementById('modalTitle').textContent = scopeTitles[scope];
+                document.getElementById('deleteButton').style.display = 'block';
+                appointmentModal.show();
+            } else if (action === 'delete') {
+                document.getElementById('deleteConfirmId').value = appointmentId;
+                document.getElementById('deleteConfirmScope').value = scope;
+                deleteConfirmModal.show();
+            }
+        });
     });
 
     // Helper function to update appointment after drag/resize
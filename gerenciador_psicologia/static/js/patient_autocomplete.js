@@ -0,0 +1,72 @@
+// Campos de paciente com autocompletar: o texto digitado busca sugestões em
+// patients.autocomplete e a sugestão escolhida grava o id no campo oculto.
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-patient-autocomplete]').forEach(initPatientAutocomplete);
+});
+
+function initPatientAutocomplete(input) {
+    const hidden = document.getElementById(input.dataset.target);
+    const datalist = document.getElementById(input.getAttribute('list'));
+    let options = new Map();
+    let timer = null;
+    let controller = null;
+
+    function selectMatch() {
+        const id = options.get(input.value);
+        if (id !== undefined) {
+            hidden.value = id;
+            input.value = input.value.split(' — ')[0];
+        } else if (!input.value) {
+            hidden.value = '';
+        }
+        input.setCustomValidity(input.value && !hidden.value ? 'Selecione um paciente da lista.' : '');
+    }
+
+    function fetchSuggestions() {
+        const term = input.value.trim();
+        if (!term) {
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch(`${input.dataset.patientAutocomplete}?q=${encodeURIComponent(term)}`, { signal: controller.signal })
+            .then(response => response.json())
+            .then(patients => {
+                options = new Map();
+                datalist.innerHTML = '';
+                patients.forEach(patient => {
+                    const label = `${patient.name} — ${patient.email}`;
+                    options.set(label, patient.id);
+                    const option = document.createElement('option');
+                    option.value = label;
+                    datalist.appendChild(option);
+                });
+                selectMatch();
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Error:', error);
+                }
+            });
+    }
+
+    input.addEventListener('input', function() {
+        hidden.value = '';
+        selectMatch();
+        if (hidden.value) {
+            return;
+        }
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, 200);
+    });
+}
+
+// Preenche um campo de paciente com autocompletar (ex: ao editar uma consulta no calendário)
+function setPatientAutocomplete(fieldId, patientId, patientName) {
+    document.getElementById(fieldId).value = patientId || '';
+    const input = document.getElementById(`${fieldId}_search`);
+    input.value = patientName || '';
+    input.setCustomValidity('');
+}
@@ -0,0 +1,125 @@
+import csv
+import io
+import tempfile
+from datetime import datetime
+from flask import current_app, stream_with_context
+
+# Size of the chunks read back from spooled export files
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def check_dates(*values):
+    """
+    Validates optional YYYY-MM-DD query parameters, raising ValueError on
+    the first invalid one. Streamed responses must call it before the
+    response starts: once the headers are sent an error can no longer
+    become a 400.
+    """
+    for value in values:
+        if value:
+            datetime.strptime(value, '%Y-%m-%d')
+
+def iter_json_array(items):
+    """
+    Encodes an iterable as a JSON array, one element at a time, so only the
+    current element is held in memory.
+    """
+    dumps = current_app.json.dumps
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + dumps(item)
+        separator = ','
+    yield ']\n'
+
+def json_stream_response(items):
+    """
+    Returns a chunked response streaming an iterable as a JSON array.
+    The request context stays available while the iterable is consumed.
+    """
+    return current_app.response_class(
+        stream_with_context(iter_json_array(items)),
+        mimetype='application/json'
+    )
+
+def wants_stream(request):
+    """
+    Checks whether the client asked for a streamed response (?stream=true).
+    """
+    return request.args.get('stream', 'false').lower() in ('1', 'true')
+
+def iter_csv(rows, columns):
+    """
+    Encodes an iterable of dicts as CSV, one line at a time. `columns` is a
+    sequence of (header, key) pairs. The output starts with a UTF-8 BOM so
+    spreadsheet programs detect the encoding.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow([header for header, _ in columns])
+    yield '\ufeff' + flush()
+    for row in rows:
+        writer.writerow([row[key] for _, key in columns])
+        yield flush()
+
+def csv_stream_response(rows, columns, filename):
+    """
+    Returns a chunked CSV download of an iterable of dicts. The first bytes
+    are sent before the first row is fetched.
+    """
+    response = current_app.response_class(
+        stream_with_context(iter_csv(rows, columns)),
+        mimetype='text/csv'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+def xlsx_stream_response(rows, columns, filename):
+    """
+    Returns an XLSX download of an iterable of dicts. The workbook is written
+    row by row in write-only mode to a spooled temporary file (XLSX is a zip
+    archive, so it can only be sent once complete) and then streamed in chunks.
+    Requires the optional openpyxl dependency; raises RuntimeError without it.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError('A exportação XLSX requer o pacote openpyxl.') from None
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([header for header, _ in columns])
+    for row in rows:
+        sheet.append([row[key] for _, key in columns])
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=EXPORT_CHUNK_SIZE * 16)
+    workbook.save(spooled)
+    spooled.seek(0)
+
+    def chunks():
+        with spooled:
+            while chunk := spooled.read(EXPORT_CHUNK_SIZE):
+                yield chunk
+
+    response = current_app.response_class(
+        chunks(),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+    return response
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+def export_response(export_format, rows, columns, filename):
+    """
+    Returns the download of an export in one of EXPORT_FORMATS.
+    """
+    if export_format == 'xlsx':
+        return xlsx_stream_response(rows, columns, filename)
+    return csv_stream_response(rows, columns, filename)
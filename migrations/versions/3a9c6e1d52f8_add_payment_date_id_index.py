@@ -0,0 +1,26 @@
+"""Add (date, id) index to payment for the paginated list
+
+Revision ID: 3a9c6e1d52f8
+Revises: d81f6c2b7e45
+Create Date: 2026-10-17 14:02:41.527903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9c6e1d52f8'
+down_revision = 'd81f6c2b7e45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_date_id', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_date_id')
@@ -0,0 +1,48 @@
+"""Add appointment duration, end date and period index
+
+Revision ID: 4b7d2e9c6a13
+Revises: 980f92a27d55
+Create Date: 2026-10-17 10:03:27.904116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e9c6a13'
+down_revision = '980f92a27d55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration', sa.Integer(), server_default='60', nullable=False))
+        batch_op.add_column(sa.Column('end_date', sa.DateTime(), nullable=True))
+
+    # Preenche o término das consultas existentes a partir da duração padrão
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE appointment SET end_date = date + make_interval(mins => duration)")
+    else:
+        op.execute("UPDATE appointment SET end_date = strftime('%Y-%m-%d %H:%M:%f000', date, '+' || duration || ' minutes')")
+
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.alter_column('end_date', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_appointment_date_end_date', ['date', 'end_date'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_appointment_period ON appointment "
+            "USING gist (tsrange(date, end_date)) WHERE is_cancelled = false"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX ix_appointment_period")
+
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_date_end_date')
+        batch_op.drop_column('end_date')
+        batch_op.drop_column('duration')
@@ -0,0 +1,28 @@
+"""Add import fingerprint to payment for bank statement deduplication
+
+Revision ID: 6e2b8f4c1d07
+Revises: 3a9c6e1d52f8
+Create Date: 2026-10-17 15:20:13.604112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2b8f4c1d07'
+down_revision = '3a9c6e1d52f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('import_fingerprint', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_payment_import_fingerprint', ['import_fingerprint'])
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_payment_import_fingerprint', type_='unique')
+        batch_op.drop_column('import_fingerprint')
@@ -0,0 +1,58 @@
+"""Add trigram / FTS5 indexes for the patient search
+
+Revision ID: 9d4a7c2e8b51
+Revises: 6e2b8f4c1d07
+Create Date: 2026-10-17 16:48:30.271945
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a7c2e8b51'
+down_revision = '6e2b8f4c1d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_patient_name_trgm', 'patient', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_patient_email_trgm', 'patient', ['email'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        # Tabela FTS5 de trigramas mantida por triggers, preenchida com os pacientes existentes
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5("
+            "name, email, content='patient', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS patient_search_insert AFTER INSERT ON patient BEGIN "
+            "INSERT INTO patient_search (rowid, name, email) VALUES (new.id, new.name, new.email); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS patient_search_delete AFTER DELETE ON patient BEGIN "
+            "INSERT INTO patient_search (patient_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS patient_search_update AFTER UPDATE OF name, email ON patient BEGIN "
+            "INSERT INTO patient_search (patient_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+            "INSERT INTO patient_search (rowid, name, email) VALUES (new.id, new.name, new.email); END"
+        )
+        op.execute("INSERT INTO patient_search (patient_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_patient_email_trgm', table_name='patient')
+        op.drop_index('ix_patient_name_trgm', table_name='patient')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS patient_search_update')
+        op.execute('DROP TRIGGER IF EXISTS patient_search_delete')
+        op.execute('DROP TRIGGER IF EXISTS patient_search_insert')
+        op.execute('DROP TABLE IF EXISTS patient_search')
@@ -0,0 +1,140 @@
+"""Add normalized name/email/phone columns to patient
+
+Revision ID: b7e3d1a9c4f2
+Revises: 9d4a7c2e8b51
+Create Date: 2026-10-17 18:05:12.604183
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d1a9c4f2'
+down_revision = '9d4a7c2e8b51'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+NORMALIZED_COLUMNS = 'name_normalized, email_normalized, phone_normalized'
+
+# Mesmo formato de gerenciador_psicologia/normalization.py, copiado para que
+# a migração não dependa do código da aplicação
+def _normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+def _normalize_phone(phone):
+    return re.sub(r'\D', '', phone)
+
+
+def _sqlite_search_ddl(columns, values_old, values_new):
+    """Comandos que criam a tabela FTS5 patient_search e seus triggers."""
+    return (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5("
+        f"{columns}, content='patient', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS patient_search_insert AFTER INSERT ON patient BEGIN "
+        f"INSERT INTO patient_search (rowid, {columns}) VALUES (new.id, {values_new}); END",
+        "CREATE TRIGGER IF NOT EXISTS patient_search_delete AFTER DELETE ON patient BEGIN "
+        f"INSERT INTO patient_search (patient_search, rowid, {columns}) VALUES ('delete', old.id, {values_old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS patient_search_update AFTER UPDATE OF {columns} ON patient BEGIN "
+        f"INSERT INTO patient_search (patient_search, rowid, {columns}) VALUES ('delete', old.id, {values_old}); "
+        f"INSERT INTO patient_search (rowid, {columns}) VALUES (new.id, {values_new}); END",
+        "INSERT INTO patient_search (patient_search) VALUES ('rebuild')",
+    )
+
+
+def _drop_sqlite_search():
+    op.execute('DROP TRIGGER IF EXISTS patient_search_update')
+    op.execute('DROP TRIGGER IF EXISTS patient_search_delete')
+    op.execute('DROP TRIGGER IF EXISTS patient_search_insert')
+    op.execute('DROP TABLE IF EXISTS patient_search')
+
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'sqlite':
+        # A recriação da tabela pelo batch_alter_table descartaria os triggers
+        _drop_sqlite_search()
+    elif dialect == 'postgresql':
+        op.drop_index('ix_patient_email_trgm', table_name='patient')
+        op.drop_index('ix_patient_name_trgm', table_name='patient')
+
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_normalized', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('email_normalized', sa.String(length=120), nullable=True))
+        batch_op.add_column(sa.Column('phone_normalized', sa.String(length=20), nullable=True))
+
+    # Preenche as colunas dos pacientes existentes em lotes
+    patient = sa.table(
+        'patient', sa.column('id'), sa.column('name'), sa.column('email'), sa.column('phone'),
+        sa.column('name_normalized'), sa.column('email_normalized'), sa.column('phone_normalized')
+    )
+    update = sa.update(patient).where(patient.c.id == sa.bindparam('patient_id')).values(
+        name_normalized=sa.bindparam('name_value'),
+        email_normalized=sa.bindparam('email_value'),
+        phone_normalized=sa.bindparam('phone_value')
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(patient.c.id, patient.c.name, patient.c.email, patient.c.phone)
+            .where(patient.c.id > last_id).order_by(patient.c.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(update, [{
+            'patient_id': row.id,
+            'name_value': _normalize_text(row.name),
+            'email_value': _normalize_text(row.email),
+            'phone_value': _normalize_phone(row.phone)
+        } for row in rows])
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.alter_column('name_normalized', existing_type=sa.String(length=100), nullable=False)
+        batch_op.alter_column('email_normalized', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('phone_normalized', existing_type=sa.String(length=20), nullable=False)
+        batch_op.create_index('ix_patient_name_normalized', ['name_normalized'], unique=False,
+                              postgresql_ops={'name_normalized': 'varchar_pattern_ops'})
+
+    if dialect == 'postgresql':
+        for column in ('name_normalized', 'email_normalized', 'phone_normalized'):
+            op.create_index(f'ix_patient_{column}_trgm', 'patient', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for statement in _sqlite_search_ddl(
+            NORMALIZED_COLUMNS,
+            'old.name_normalized, old.email_normalized, old.phone_normalized',
+            'new.name_normalized, new.email_normalized, new.phone_normalized'
+        ):
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _drop_sqlite_search()
+    elif dialect == 'postgresql':
+        for column in ('phone_normalized', 'email_normalized', 'name_normalized'):
+            op.drop_index(f'ix_patient_{column}_trgm', table_name='patient')
+
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.drop_index('ix_patient_name_normalized')
+        batch_op.drop_column('phone_normalized')
+        batch_op.drop_column('email_normalized')
+        batch_op.drop_column('name_normalized')
+
+    if dialect == 'postgresql':
+        op.create_index('ix_patient_name_trgm', 'patient', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_patient_email_trgm', 'patient', ['email'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for statement in _sqlite_search_ddl('name, email', 'old.name, old.email', 'new.name, new.email'):
+            op.execute(statement)
@@ -0,0 +1,67 @@
+"""Add patient_summary read model
+
+Revision ID: c2f7a5d3e816
+Revises: e4a8f2c6b913
+Create Date: 2026-10-17 20:31:44.150276
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a5d3e816'
+down_revision = 'e4a8f2c6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    summary = op.create_table('patient_summary',
+        sa.Column('patient_id', sa.Integer(), nullable=False),
+        sa.Column('last_session', sa.DateTime(), nullable=True),
+        sa.Column('next_session', sa.DateTime(), nullable=True),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('sessions_this_month', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('open_balance', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('patient_id')
+    )
+    with op.batch_alter_table('patient_summary', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_patient_summary_next_session'), ['next_session'], unique=False)
+        batch_op.create_index(batch_op.f('ix_patient_summary_month'), ['month'], unique=False)
+
+    # Preenche o resumo dos pacientes existentes (mesma consulta de services/patient_summary.py)
+    patient = sa.table('patient', sa.column('id'))
+    appointment = sa.table(
+        'appointment', sa.column('id'), sa.column('patient_id'), sa.column('date'), sa.column('month_bucket'),
+        sa.column('status'), sa.column('value'), sa.column('is_cancelled')
+    )
+    payment = sa.table('payment', sa.column('id'), sa.column('appointment_id'))
+
+    now = datetime.now()
+    month = now.date().replace(day=1)
+    paid = sa.select(payment.c.id).where(payment.c.appointment_id == appointment.c.id).exists()
+    op.execute(sa.insert(summary).from_select(
+        ['patient_id', 'last_session', 'next_session', 'month', 'sessions_this_month', 'open_balance'],
+        sa.select(
+            patient.c.id,
+            sa.func.max(sa.case((appointment.c.status.in_(('Realizada', 'Paga')), appointment.c.date))),
+            sa.func.min(sa.case((appointment.c.date > now, appointment.c.date))),
+            sa.literal(month, sa.Date()),
+            sa.func.count(sa.case((appointment.c.month_bucket == month, appointment.c.id))),
+            sa.func.coalesce(sa.func.sum(sa.case((sa.and_(appointment.c.status == 'Realizada', ~paid), appointment.c.value))), 0)
+        ).select_from(patient).outerjoin(
+            appointment, sa.and_(appointment.c.patient_id == patient.c.id, appointment.c.is_cancelled == sa.false())
+        ).group_by(patient.c.id)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('patient_summary', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_patient_summary_month'))
+        batch_op.drop_index(batch_op.f('ix_patient_summary_next_session'))
+
+    op.drop_table('patient_summary')
@@ -0,0 +1,50 @@
+"""Add stored month bucket columns to appointment and payment
+
+Revision ID: d81f6c2b7e45
+Revises: b5d93e0f4a17
+Create Date: 2026-10-17 12:31:06.118340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f6c2b7e45'
+down_revision = 'b5d93e0f4a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('month_bucket', sa.Date(), nullable=True))
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('month_bucket', sa.Date(), nullable=True))
+
+    # Preenche o mês das consultas e pagamentos existentes
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE appointment SET month_bucket = CAST(date_trunc('month', date) AS DATE)")
+        op.execute("UPDATE payment SET month_bucket = CAST(date_trunc('month', date) AS DATE)")
+    else:
+        op.execute("UPDATE appointment SET month_bucket = date(date, 'start of month')")
+        op.execute("UPDATE payment SET month_bucket = date(date, 'start of month')")
+
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.alter_column('month_bucket', existing_type=sa.Date(), nullable=False)
+        batch_op.create_index('ix_appointment_status_month_bucket', ['status', 'month_bucket'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.alter_column('month_bucket', existing_type=sa.Date(), nullable=False)
+        batch_op.create_index('ix_payment_month_bucket_payment_type', ['month_bucket', 'payment_type'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_month_bucket_payment_type')
+        batch_op.drop_column('month_bucket')
+
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointment_status_month_bucket')
+        batch_op.drop_column('month_bucket')
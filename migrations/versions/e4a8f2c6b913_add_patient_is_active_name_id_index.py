@@ -0,0 +1,26 @@
+"""Add (is_active, name, id) index to patient for the paginated list
+
+Revision ID: e4a8f2c6b913
+Revises: b7e3d1a9c4f2
+Create Date: 2026-10-17 19:12:07.384410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a8f2c6b913'
+down_revision = 'b7e3d1a9c4f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.create_index('ix_patient_is_active_name_id', ['is_active', 'name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.drop_index('ix_patient_is_active_name_id')
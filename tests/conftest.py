@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from gerenciador_psicologia.app import db
+
+@contextmanager
+def count_queries():
+    """Counts the SQL statements executed inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+def captured_statements(run):
+    """Runs a callable and returns the (statement, parameters) pairs it executed."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+def query_plan(statement, parameters=()):
+    """Returns the plan of a captured statement as text, on SQLite or Postgres."""
+    cursor = db.session.connection().connection.cursor()
+    if db.engine.dialect.name == 'postgresql':
+        # Test tables are tiny, so a sequential scan would always be cheaper
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN {statement}", parameters)
+        return " ".join(row[0] for row in cursor.fetchall())
+    return " ".join(str(row[-1]) for row in cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters))
@@ -1,8 +1,10 @@
 import pytest
 from flask import session
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from gerenciador_psicologia.app import create_app, db
-from gerenciador_psicologia.models import Patient, Appointment
+from gerenciador_psicologia.models import Patient, Appointment, Payment
+from gerenciador_psicologia.services import appointment_service
+from conftest import count_queries, captured_statements, query_plan
 
 @pytest.fixture
 def app():
@@ -10,7 +12,8 @@ def app():
     app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False
+        "WTF_CSRF_ENABLED": False,
+        "SQL_STATEMENT_LIMIT": 12
     })
 
     with app.app_context():
@@ -38,6 +41,62 @@ def test_list_appointments_empty(client):
     assert response.status_code == 200
     assert b'id="calendar"' in response.data
 
+def test_list_appointments_defaults_to_window_around_today(client, new_patient):
+    """Without filters only the appointments around today are listed."""
+    today = datetime.combine(date.today(), datetime.min.time())
+    db.session.add_all([
+        Appointment(patient_id=new_patient.id, date=today + timedelta(hours=10), value=100.0, notes="Dentro"),
+        Appointment(patient_id=new_patient.id, date=today - timedelta(days=400), value=100.0, notes="Antiga")
+    ])
+    db.session.commit()
+
+    response = client.get("/appointments/")
+    assert response.status_code == 200
+    assert (today + timedelta(hours=10)).strftime('%d/%m/%Y %H:%M').encode() in response.data
+    assert (today - timedelta(days=400)).strftime('%d/%m/%Y').encode() not in response.data
+    assert b"1 consulta(s)" in response.data
+
+def test_list_appointments_keyset_pagination(client, new_patient):
+    """Pages follow (date, id) cursors and the page query count does not grow with history."""
+    base = datetime(2025, 8, 1, 8, 0)
+    db.session.add_all([
+        Appointment(patient_id=new_patient.id, date=base + timedelta(hours=index), value=100.0)
+        for index in range(120)
+    ])
+    db.session.commit()
+    period = "start_date=2025-08-01&end_date=2025-08-31"
+
+    first = appointment_service.get_appointments_page(date(2025, 8, 1), date(2025, 8, 31))
+    assert len(first['items']) == appointment_service.APPOINTMENT_PAGE_SIZE
+    assert first['previous'] is None
+
+    second = appointment_service.get_appointments_page(date(2025, 8, 1), date(2025, 8, 31), after=first['next'])
+    assert second['items'][0].date == first['items'][-1].date + timedelta(hours=1)
+    back = appointment_service.get_appointments_page(date(2025, 8, 1), date(2025, 8, 31), before=second['previous'])
+    assert [row.id for row in back['items']] == [row.id for row in first['items']]
+    assert back['previous'] is None
+
+    third = appointment_service.get_appointments_page(date(2025, 8, 1), date(2025, 8, 31), after=second['next'])
+    assert len(third['items']) == 20
+    assert third['next'] is None
+
+    with count_queries() as few:
+        client.get(f"/appointments/?{period}&after={second['next']}")
+    db.session.add_all([
+        Appointment(patient_id=new_patient.id, date=base - timedelta(days=index), value=100.0)
+        for index in range(1, 200)
+    ])
+    db.session.commit()
+    with count_queries() as many:
+        response = client.get(f"/appointments/?{period}&after={second['next']}")
+    assert response.status_code == 200
+    assert b"120 consulta(s)" in response.data
+    assert len(few) == len(many)
+
+def test_list_appointments_rejects_bad_cursor(client):
+    """Malformed cursors are a client error."""
+    assert client.get("/appointments/?after=nope").status_code == 400
+
 def test_create_appointment_get(client, new_patient):
     """Test GET request to create appointment form."""
     response = client.get("/appointments/new")
@@ -78,6 +137,23 @@ def test_create_recurring_appointment_post_success(client, new_patient):
     assert parent_appointment is not None
     assert Appointment.query.filter_by(parent_appointment_id=parent_appointment.id).count() == 3
 
+def test_create_recurring_appointment_bulk_inserts_occurrences(client, new_patient):
+    """All occurrences of a series are written with a single INSERT statement."""
+    with count_queries() as statements:
+        client.post("/appointments/new", data={
+            "patient_id": new_patient.id,
+            "date": "2025-08-01T11:00",
+            "value": "150.00",
+            "is_recurring": "on",
+            "recurrence_frequency": "weekly",
+            "no_end_date": "on"
+        })
+
+    inserts = [statement for statement in statements if statement.startswith("INSERT INTO appointment")]
+    assert len(inserts) == 2  # the parent and one bulk insert for the occurrences
+    assert Appointment.query.count() == 53
+    assert Appointment.query.filter_by(status='Agendada').count() == 53
+
 def test_create_appointment_invalid_date(client, new_patient):
     """Test creating an appointment with an invalid date format."""
     response = client.post("/appointments/new", data={
@@ -202,3 +278,611 @@ def test_delete_appointment_api_success(client, new_patient):
     data = response.get_json()
     assert data['success'] is True
     assert db.session.get(Appointment, appointment_id) is None
+
+def test_get_appointments_api_query_count_is_constant(client, new_patient):
+    """The calendar feed must not issue one query per event."""
+    other_patient = Patient(name="Other Patient", email="other@patient.com", phone="5555", birth_date=date(1980, 3, 3))
+    db.session.add(other_patient)
+    db.session.commit()
+    start = datetime(2025, 9, 1, 8, 0)
+    for i in range(10):
+        patient = new_patient if i % 2 else other_patient
+        db.session.add(Appointment(patient_id=patient.id, date=start + timedelta(days=i), value=100.0 + i))
+    db.session.commit()
+    db.session.expunge_all()
+
+    url = "/appointments/api?start=2025-09-01&end={end}"
+    with count_queries() as few:
+        small = client.get(url.format(end="2025-09-02")).get_json()
+    with count_queries() as many:
+        large = client.get(url.format(end="2025-09-30")).get_json()
+
+    assert len(small) == 1
+    assert len(large) == 10
+    assert len(many) == len(few)
+    assert {event['title'] for event in large} == {'Consulta - Test Patient', 'Consulta - Other Patient'}
+    assert large[0]['extendedProps']['value'] == 100.0
+
+def test_get_appointments_api_conditional_get(client, new_patient):
+    """The calendar feed answers If-None-Match with 304 while the range is unchanged."""
+    appointment = Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 14, 10, 0), value=150.0)
+    db.session.add(appointment)
+    db.session.commit()
+
+    url = "/appointments/api?start=2025-08-11&end=2025-08-18"
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    with count_queries() as statements:
+        second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert statements == []
+
+def test_get_appointments_api_cache_expires(app, client, new_patient, monkeypatch):
+    """Cached calendar responses expire so writes made by other workers are picked up."""
+    from gerenciador_psicologia.services import calendar_cache
+
+    url = "/appointments/api?start=2025-08-11&end=2025-08-18"
+    etag = client.get(url).headers["ETag"]
+
+    # Simula a escrita feita por outro worker: o cache deste processo não é invalidado
+    appointment = Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 14, 10, 0), value=150.0)
+    db.session.add(appointment)
+    db.session.commit()
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    now = calendar_cache.clock.monotonic()
+    monkeypatch.setattr(calendar_cache.clock, "monotonic", lambda: now + app.config['CALENDAR_CACHE_SECONDS'] + 1)
+    refreshed = client.get(url, headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert len(refreshed.get_json()) == 1
+
+def test_get_appointments_api_cache_follows_other_workers(tmp_path):
+    """A write handled by one worker invalidates the calendar responses cached by the others."""
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.sqlite3'}",
+        "DASHBOARD_CACHE_PATH": str(tmp_path / "dashboard.sqlite3")
+    }
+    worker, other_worker = create_app(config), create_app(config)
+    with worker.app_context():
+        db.create_all()
+        patient = Patient(name="Test Patient", email="test@patient.com", phone="123456789", birth_date=date(1990, 1, 1))
+        db.session.add(patient)
+        db.session.flush()
+        appointment = Appointment(patient_id=patient.id, date=datetime(2025, 8, 14, 10, 0), value=150.0)
+        db.session.add(appointment)
+        db.session.commit()
+        appointment_id = appointment.id
+
+    url = "/appointments/api?start=2025-08-11&end=2025-08-18"
+    client = worker.test_client()
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    other_worker.test_client().delete(f"/appointments/api/{appointment_id}")
+
+    refreshed = client.get(url, headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.get_json() == []
+
+def test_get_appointments_api_rejects_invalid_dates(client):
+    """Malformed range bounds are answered with 400 instead of a server error."""
+    assert client.get("/appointments/api?start=2025-13-01&end=2025-08-18").status_code == 400
+    assert client.get("/appointments/api?start=amanha&end=2025-08-18").status_code == 400
+    assert client.get("/appointments/api?start=2025-08-11&end=xx&stream=true").status_code == 400
+
+def test_get_appointments_api_mixed_timezone_bounds(client, new_patient):
+    """An aware and a naive bound are compared without raising TypeError."""
+    appointment = Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 14, 10, 0), value=150.0)
+    db.session.add(appointment)
+    db.session.commit()
+
+    response = client.get("/appointments/api?start=2025-08-11T00:00:00-03:00&end=2025-08-18")
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
+
+def test_get_appointments_api_invalidates_only_touched_ranges(client, new_patient):
+    """Deleting an appointment refreshes its week but keeps other weeks cached."""
+    appointment = Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 14, 10, 0), value=150.0)
+    db.session.add(appointment)
+    db.session.commit()
+
+    touched_url = "/appointments/api?start=2025-08-11&end=2025-08-18"
+    other_url = "/appointments/api?start=2025-09-01&end=2025-09-08"
+    touched_etag = client.get(touched_url).headers["ETag"]
+    other_etag = client.get(other_url).headers["ETag"]
+
+    client.delete(f"/appointments/api/{appointment.id}")
+
+    refreshed = client.get(touched_url, headers={"If-None-Match": touched_etag})
+    assert refreshed.status_code == 200
+    assert refreshed.get_json() == []
+
+    with count_queries() as statements:
+        untouched = client.get(other_url, headers={"If-None-Match": other_etag})
+    assert untouched.status_code == 304
+    assert statements == []
+
+# --- Rule-based recurrence ---
+
+def _comparable_events(events):
+    """Strips the fields that identify stored rows, keeping what the calendar renders."""
+    return sorted(
+        (event['title'], event['start'], event['end'], event['className'], event['extendedProps']['value'])
+        for event in events
+    )
+
+def test_rule_based_series_matches_materialized_calendar(app, client, new_patient):
+    """A rule-based series stores one row and renders the same events as a materialised one."""
+    series_data = {
+        "patient_id": new_patient.id,
+        "date": "2025-08-01T11:00",
+        "value": "150.00",
+        "notes": "Weekly session",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly",
+        "recurrence_until": "2025-10-31"
+    }
+    url = "/appointments/api?start=2025-09-01&end=2025-10-01"
+
+    client.post("/appointments/new", data=series_data)
+    materialized = client.get(url).get_json()
+    assert Appointment.query.count() == 14
+
+    Appointment.query.filter(Appointment.parent_appointment_id.is_not(None)).delete()
+    Appointment.query.delete()
+    db.session.commit()
+    app.extensions['calendar_cache'].clear()
+
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data=series_data)
+    virtual = client.get(url).get_json()
+
+    assert Appointment.query.count() == 1
+    assert len(virtual) == 4
+    assert _comparable_events(virtual) == _comparable_events(materialized)
+
+def test_rule_based_series_is_not_capped(app, client, new_patient):
+    """Open-ended rule-based series keep producing occurrences past 52 repetitions."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id,
+        "date": "2025-08-04T09:00",
+        "value": "120.00",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly",
+        "no_end_date": "on"
+    })
+
+    events = client.get("/appointments/api?start=2028-01-01&end=2028-02-01").get_json()
+    assert [event['start'] for event in events] == [
+        "2028-01-03T09:00:00", "2028-01-10T09:00:00", "2028-01-17T09:00:00",
+        "2028-01-24T09:00:00", "2028-01-31T09:00:00"
+    ]
+
+def test_edit_rule_based_occurrence_stores_exception(app, client, new_patient):
+    """Moving one occurrence stores a single exception row that replaces it."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id,
+        "date": "2025-08-01T11:00",
+        "value": "150.00",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly",
+        "recurrence_until": "2025-08-29"
+    })
+    series = Appointment.query.filter_by(recurrence_mode='rule').one()
+
+    response = client.post(f"/appointments/{series.id}/occurrences/2025-08-15T11:00:00/edit", data={
+        "date": "2025-08-16T14:00",
+        "value": "150.00",
+        "status": "Agendada",
+        "notes": "Moved"
+    }, follow_redirects=True)
+    assert b"Consulta atualizada com sucesso!" in response.data
+
+    exception = Appointment.query.filter_by(parent_appointment_id=series.id).one()
+    assert exception.original_date == datetime(2025, 8, 15, 11, 0)
+    assert exception.date == datetime(2025, 8, 16, 14, 0)
+
+    events = client.get("/appointments/api?start=2025-08-01&end=2025-09-01").get_json()
+    assert sorted(event['start'] for event in events) == [
+        "2025-08-01T11:00:00", "2025-08-08T11:00:00", "2025-08-16T14:00:00",
+        "2025-08-22T11:00:00", "2025-08-29T11:00:00"
+    ]
+
+    client.delete(f"/appointments/api/{series.id}/occurrences/2025-08-22T11:00:00")
+    events = client.get("/appointments/api?start=2025-08-01&end=2025-09-01").get_json()
+    assert "2025-08-22T11:00:00" not in [event['start'] for event in events]
+    assert Appointment.query.count() == 3
+
+def test_edit_rule_based_occurrence_rejects_unknown_date(app, client, new_patient):
+    """Dates that are not part of the series are not editable occurrences."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id,
+        "date": "2025-08-01T11:00",
+        "value": "150.00",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly",
+        "recurrence_until": "2025-08-29"
+    })
+    series = Appointment.query.filter_by(recurrence_mode='rule').one()
+
+    response = client.get(f"/appointments/{series.id}/occurrences/2025-08-16T11:00:00/edit")
+    assert response.status_code == 404
+
+# --- Series-scoped operations ---
+
+def _create_weekly_series(client, patient, **extra):
+    """Creates a weekly series starting on 2025-08-04 09:00."""
+    data = {
+        "patient_id": patient.id,
+        "date": "2025-08-04T09:00",
+        "value": "150.00",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly"
+    }
+    data.update(extra or {"no_end_date": "on"})
+    client.post("/appointments/new", data=data)
+    return Appointment.query.filter_by(parent_appointment_id=None).one()
+
+def test_update_series_moves_every_occurrence_in_bounded_statements(client, new_patient):
+    """Moving a 52-occurrence series runs a fixed number of statements, not one per row."""
+    root = _create_weekly_series(client, new_patient)
+    assert Appointment.query.count() == 53
+    child = Appointment.query.filter_by(parent_appointment_id=root.id).order_by(Appointment.date).first()
+
+    with count_queries() as statements:
+        response = client.put(f"/appointments/api/{child.id}?scope=series", json={
+            "date": "2025-08-12T14:00", "value": "170.00", "notes": "Novo horário"
+        })
+    assert response.get_json()['success'] is True
+    assert len(statements) <= 8
+
+    appointments = Appointment.query.order_by(Appointment.date).all()
+    assert appointments[0].date == datetime(2025, 8, 5, 14, 0)
+    assert appointments[-1].date == datetime(2026, 8, 4, 14, 0)
+    assert all(appointment.date.weekday() == 1 and appointment.date.hour == 14 for appointment in appointments)
+    assert all(appointment.end_date == appointment.date + timedelta(minutes=60) for appointment in appointments)
+    assert {float(appointment.value) for appointment in appointments} == {170.0}
+    assert appointments[0].recurrence_day == 1
+
+def test_update_following_keeps_earlier_and_held_sessions(client, new_patient):
+    """'following' only moves the scheduled sessions from the pivot on."""
+    root = _create_weekly_series(client, new_patient, recurrence_until="2025-09-01")
+    children = Appointment.query.filter_by(parent_appointment_id=root.id).order_by(Appointment.date).all()
+    children[-1].status = 'Realizada'
+    db.session.commit()
+
+    response = client.post(f"/appointments/{children[1].id}/edit", data={
+        "date": "2025-08-18T10:00", "value": "150.00", "status": "Agendada", "notes": "", "scope": "following"
+    }, follow_redirects=True)
+    assert b"Consulta atualizada com sucesso!" in response.data
+
+    dates = [appointment.date for appointment in Appointment.query.order_by(Appointment.id)]
+    assert dates == [
+        datetime(2025, 8, 4, 9, 0), datetime(2025, 8, 11, 9, 0), datetime(2025, 8, 18, 10, 0),
+        datetime(2025, 8, 25, 10, 0), datetime(2025, 9, 1, 9, 0)
+    ]
+
+def test_update_series_rejects_conflicting_slot(client, new_patient):
+    """A series move that overlaps another booking is rejected as a whole."""
+    root = _create_weekly_series(client, new_patient, recurrence_until="2025-09-01")
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-26T14:30", "value": "150.00"
+    })
+
+    response = client.put(f"/appointments/api/{root.id}?scope=series", json={
+        "date": "2025-08-05T14:00", "value": "150.00"
+    })
+    assert response.get_json()['success'] is False
+    assert Appointment.query.filter_by(parent_appointment_id=None, id=root.id).one().date == datetime(2025, 8, 4, 9, 0)
+
+def test_delete_series_detaches_payments(client, new_patient):
+    """Deleting a series removes its rows with set-based statements and keeps their payments."""
+    root = _create_weekly_series(client, new_patient)
+    paid = Appointment.query.filter_by(parent_appointment_id=root.id).order_by(Appointment.date).first()
+    payment = Payment(patient_id=new_patient.id, appointment_id=paid.id, date=date(2025, 8, 11), value=150.0)
+    db.session.add(payment)
+    db.session.commit()
+    payment_id = payment.id
+
+    with count_queries() as statements:
+        response = client.delete(f"/appointments/api/{paid.id}?scope=series")
+    assert response.get_json()['success'] is True
+    assert len(statements) <= 6
+
+    assert Appointment.query.count() == 0
+    assert db.session.get(Payment, payment_id).appointment_id is None
+
+def test_delete_following_ends_series(client, new_patient):
+    """'following' deletes the pivot and later sessions and ends the series the day before."""
+    root = _create_weekly_series(client, new_patient, recurrence_until="2025-09-01")
+    pivot = Appointment.query.filter_by(date=datetime(2025, 8, 18, 9, 0)).one()
+
+    client.delete(f"/appointments/api/{pivot.id}?scope=following")
+
+    assert [appointment.date for appointment in Appointment.query.order_by(Appointment.date)] == [
+        datetime(2025, 8, 4, 9, 0), datetime(2025, 8, 11, 9, 0)
+    ]
+    assert db.session.get(Appointment, root.id).recurrence_until == date(2025, 8, 17)
+
+def test_update_rule_series_following_splits_series(app, client, new_patient):
+    """In rule mode 'following' ends the old rule and starts a new one carrying the later exceptions."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    series = _create_weekly_series(client, new_patient, recurrence_until="2025-09-15")
+    client.put(f"/appointments/api/{series.id}/occurrences/2025-09-01T09:00:00", json={
+        "date": "2025-09-01T11:00", "value": "150.00", "status": "Agendada", "notes": "Exceção"
+    })
+
+    response = client.put(f"/appointments/api/{series.id}/occurrences/2025-08-18T09:00:00?scope=following", json={
+        "date": "2025-08-19T09:00", "value": "160.00"
+    })
+    assert response.get_json()['success'] is True
+
+    new_series = Appointment.query.filter(
+        Appointment.recurrence_mode == 'rule', Appointment.id != series.id
+    ).one()
+    assert new_series.date == datetime(2025, 8, 19, 9, 0)
+    assert db.session.get(Appointment, series.id).recurrence_until == date(2025, 8, 17)
+
+    exception = Appointment.query.filter(Appointment.original_date.is_not(None)).one()
+    assert exception.parent_appointment_id == new_series.id
+    assert exception.original_date == datetime(2025, 9, 2, 9, 0)
+    assert exception.date == datetime(2025, 9, 2, 11, 0)
+
+    events = client.get("/appointments/api?start=2025-08-01&end=2025-09-20").get_json()
+    assert sorted(event['start'] for event in events) == [
+        "2025-08-04T09:00:00", "2025-08-11T09:00:00", "2025-08-19T09:00:00",
+        "2025-08-26T09:00:00", "2025-09-02T11:00:00", "2025-09-09T09:00:00"
+    ]
+
+def test_update_rule_series_rekeys_consecutive_exceptions(app, client, new_patient):
+    """Moving a whole rule series by one period keeps its exceptions unique."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    series = _create_weekly_series(client, new_patient, recurrence_until="2025-09-01")
+    for occurrence in ("2025-08-11T09:00:00", "2025-08-18T09:00:00"):
+        client.put(f"/appointments/api/{series.id}/occurrences/{occurrence}", json={
+            "date": occurrence[:11] + "15:00", "value": "150.00", "status": "Agendada", "notes": ""
+        })
+
+    response = client.put(f"/appointments/api/{series.id}?scope=series", json={
+        "date": "2025-08-11T09:00", "value": "150.00"
+    })
+    assert response.get_json()['success'] is True
+
+    exceptions = Appointment.query.filter(Appointment.original_date.is_not(None)).order_by(Appointment.original_date).all()
+    assert [(e.original_date, e.date) for e in exceptions] == [
+        (datetime(2025, 8, 18, 9, 0), datetime(2025, 8, 18, 15, 0)),
+        (datetime(2025, 8, 25, 9, 0), datetime(2025, 8, 25, 15, 0))
+    ]
+
+# --- Conflict detection ---
+
+def test_create_appointment_rejects_overlapping_booking(client, new_patient):
+    """A booking starting inside another appointment is rejected; adjacent ones are accepted."""
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-01T10:00", "value": "150.00", "duration": "50"
+    })
+
+    response = client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-01T10:30", "value": "150.00"
+    }, follow_redirects=True)
+    assert "Já existe uma consulta agendada para este horário (01/08/2025 10:00).".encode() in response.data
+
+    response = client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-01T10:50", "value": "150.00"
+    }, follow_redirects=True)
+    assert b"Consulta(s) agendada(s) com sucesso!" in response.data
+    assert Appointment.query.count() == 2
+
+def test_create_recurring_appointment_checks_whole_series_in_one_query(client, new_patient):
+    """Every occurrence of a new series is checked against existing bookings with one query."""
+    db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 15, 11, 30), value=100.0))
+    db.session.commit()
+
+    with count_queries() as statements:
+        response = client.post("/appointments/new", data={
+            "patient_id": new_patient.id,
+            "date": "2025-08-01T11:00",
+            "value": "150.00",
+            "is_recurring": "on",
+            "recurrence_frequency": "weekly",
+            "recurrence_until": "2025-10-31"
+        }, follow_redirects=True)
+
+    assert "(15/08/2025 11:30)".encode() in response.data
+    assert Appointment.query.count() == 1
+    conflict_queries = [s for s in statements if "FROM appointment" in s and "end_date >" in s]
+    assert len(conflict_queries) == 1
+
+def test_create_appointment_conflicts_with_rule_based_occurrences(app, client, new_patient):
+    """Virtual occurrences of rule-based series also block their time slots."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id,
+        "date": "2025-08-01T11:00",
+        "value": "150.00",
+        "is_recurring": "on",
+        "recurrence_frequency": "weekly",
+        "no_end_date": "on"
+    })
+
+    response = client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2026-03-06T11:15", "value": "150.00"
+    }, follow_redirects=True)
+    assert "(06/03/2026 11:00)".encode() in response.data
+    assert Appointment.query.count() == 1
+
+def test_conflict_query_uses_period_index(app, new_patient):
+    """On SQLite the overlap query is an index range scan, not a table scan."""
+    from gerenciador_psicologia.services import conflict_service
+    captured = captured_statements(
+        lambda: conflict_service.find_conflicts([(datetime(2025, 8, 1, 10), datetime(2025, 8, 1, 11))])
+    )
+
+    plan = query_plan(*captured[0])
+    if db.engine.dialect.name == 'postgresql':
+        assert "ix_appointment_period" in plan
+    else:
+        assert "SEARCH appointment USING" in plan
+        assert "INDEX ix_appointment_date" in plan
+
+def test_get_appointments_api_filters_by_patient_and_status(client, new_patient):
+    """patientId and status are applied by the query, not in the browser."""
+    other = Patient(name="Other Patient", email="other@patient.com", phone="987654321", birth_date=date(1985, 5, 5))
+    db.session.add(other)
+    db.session.commit()
+    db.session.add_all([
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 4, 9, 0), value=100.0, status='Agendada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 5, 9, 0), value=100.0, status='Realizada'),
+        Appointment(patient_id=other.id, date=datetime(2025, 8, 6, 9, 0), value=100.0, status='Agendada')
+    ])
+    db.session.commit()
+    url = "/appointments/api?start=2025-08-01&end=2025-08-31"
+
+    by_patient = client.get(f"{url}&patientId={new_patient.id}").get_json()
+    assert sorted(event['start'] for event in by_patient) == ["2025-08-04T09:00:00", "2025-08-05T09:00:00"]
+
+    by_status = client.get(f"{url}&status=Agendada").get_json()
+    assert sorted(event['start'] for event in by_status) == ["2025-08-04T09:00:00", "2025-08-06T09:00:00"]
+
+    both = client.get(f"{url}&patientId={other.id}&status=Realizada").get_json()
+    assert both == []
+
+    assert client.get(f"{url}&status=Desconhecido").status_code == 400
+
+def test_rule_based_occurrences_follow_calendar_filters(app, client, new_patient):
+    """Virtual occurrences are filtered by patient and only shown as scheduled."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-04T09:00", "value": "150.00",
+        "is_recurring": "on", "recurrence_frequency": "weekly", "recurrence_until": "2025-08-25"
+    })
+    url = "/appointments/api?start=2025-08-01&end=2025-08-31"
+
+    assert len(client.get(f"{url}&patientId={new_patient.id}").get_json()) == 4
+    assert client.get(f"{url}&patientId={new_patient.id + 1}").get_json() == []
+    assert client.get(f"{url}&status=Realizada").get_json() == []
+
+@pytest.mark.parametrize("filters, index", [
+    ({"patient_id": 1}, "ix_appointment_patient_id_date"),
+    ({"status": "Realizada"}, "ix_appointment_status_date"),
+])
+def test_calendar_filters_use_composite_indexes(app, new_patient, filters, index):
+    """The filtered calendar query is served by the matching composite index."""
+    captured = captured_statements(
+        lambda: appointment_service.get_appointments_for_calendar("2025-08-01", "2025-08-31", **filters)
+    )
+
+    statement, parameters = next(item for item in captured if "FROM appointment" in item[0])
+    assert index in query_plan(statement, parameters)
+
+# --- Free slots ---
+
+def test_free_slots_skip_bookings_and_closed_hours(app, client, new_patient):
+    """Free slots stay inside working hours and around existing bookings."""
+    app.config.update(WORKING_HOURS_START="09:00", WORKING_HOURS_END="13:00", AVAILABILITY_SLOT_MINUTES=30)
+    db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2030, 8, 5, 10, 0), duration=50, value=100.0))
+    db.session.commit()
+
+    response = client.get("/appointments/api/free-slots?from=2030-08-05&to=2030-08-05&duration=60")
+    assert response.status_code == 200
+    assert [slot['start'] for slot in response.get_json()] == [
+        "2030-08-05T09:00:00", "2030-08-05T11:00:00", "2030-08-05T11:30:00", "2030-08-05T12:00:00"
+    ]
+
+    # 2030-08-10 is a Saturday
+    assert client.get("/appointments/api/free-slots?from=2030-08-10&to=2030-08-11").get_json() == []
+
+def test_free_slots_month_search_uses_one_query_and_is_invalidated(app, client, new_patient):
+    """A month of availability is built from one range query, reused, and refreshed on writes."""
+    url = "/appointments/api/free-slots?from=2030-09-01&to=2030-09-30&duration=60"
+
+    with count_queries() as statements:
+        slots = client.get(url).get_json()
+    assert len([statement for statement in statements if "FROM appointment" in statement]) == 2  # stored rows + rule series
+    assert "2030-09-02T10:00:00" in [slot['start'] for slot in slots]
+
+    with count_queries() as statements:
+        client.get(url)
+    assert statements == []
+
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2030-09-02T10:00", "value": "150.00"
+    })
+    slots = client.get(url).get_json()
+    assert "2030-09-02T10:00:00" not in [slot['start'] for slot in slots]
+    assert "2030-09-03T10:00:00" in [slot['start'] for slot in slots]
+
+def test_free_slots_rejects_invalid_parameters(client):
+    """Bad durations and oversized ranges are client errors."""
+    assert client.get("/appointments/api/free-slots?from=2030-09-01&to=2030-09-02&duration=0").status_code == 400
+    assert client.get("/appointments/api/free-slots?from=2030-01-01&to=2030-12-31").status_code == 400
+
+# --- Streaming ---
+
+def test_get_appointments_api_streams_wide_ranges(client, new_patient):
+    """Wide ranges are streamed as a JSON array with the same events."""
+    for month in range(1, 13):
+        db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2025, month, 10, 9, 0), value=100.0))
+    db.session.commit()
+
+    buffered = client.get("/appointments/api?start=2025-03-01&end=2025-03-31")
+    assert "Content-Length" in buffered.headers
+
+    streamed = client.get("/appointments/api?start=2025-01-01&end=2026-01-01")
+    assert "Content-Length" not in streamed.headers
+    assert "ETag" not in streamed.headers
+    events = streamed.get_json()
+    assert len(events) == 12
+    assert events[2] == buffered.get_json()[0]
+
+    forced = client.get("/appointments/api?start=2025-03-01&end=2025-03-31&stream=true")
+    assert "Content-Length" not in forced.headers
+    assert forced.get_json() == buffered.get_json()
+
+def test_list_appointments_json_stream(client, new_patient):
+    """The appointment list can be streamed as JSON."""
+    db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 2, 9, 0), value=90.0))
+    db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 1, 9, 0), value=80.0))
+    db.session.add(Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 31, 18, 0), value=70.0))
+    db.session.commit()
+
+    response = client.get("/appointments/?format=json&start_date=2025-08-01&end_date=2025-08-31")
+    assert "Content-Length" not in response.headers
+    data = response.get_json()
+    assert [row['date'] for row in data] == ["2025-08-01T09:00:00", "2025-08-02T09:00:00", "2025-08-31T18:00:00"]
+    assert data[0]['patientName'] == new_patient.name
+    assert data[0]['value'] == 80.0
+
+    # Invalid dates are rejected before the stream starts
+    response = client.get("/appointments/?format=json&start_date=bad")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+def test_export_appointments_csv(client, new_patient):
+    """Appointments are exported as CSV, filtered by date and status."""
+    db.session.add_all([
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 4, 9, 0), value=150.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 5, 9, 0), value=150.0, status='Agendada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 31, 10, 0), value=150.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 9, 5, 9, 0), value=150.0, status='Realizada')
+    ])
+    db.session.commit()
+
+    response = client.get("/appointments/export?start_date=2025-08-01&end_date=2025-08-31&status=Realizada")
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).lstrip('\ufeff').splitlines()
+    # The sessions of the end day are included
+    assert len(lines) == 3
+    assert lines[1].startswith(f"{Appointment.query.filter_by(status='Realizada').order_by(Appointment.date).first().id},2025-08-04T09:00:00")
+    assert ",2025-08-31T10:00:00," in lines[2]
+    assert new_patient.name in lines[1]
+
+    assert client.get("/appointments/export?status=Desconhecido").status_code == 400
@@ -1,7 +1,9 @@
 import pytest
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from gerenciador_psicologia.app import create_app, db
-from gerenciador_psicologia.models import Patient, Payment
+from gerenciador_psicologia.models import Patient, Payment, Appointment, MonthlyFinancialRollup
+from gerenciador_psicologia.services import appointment_service, financial_service, dashboard_service
+from conftest import count_queries, captured_statements, query_plan
 
 @pytest.fixture
 def app():
@@ -9,7 +11,8 @@ def app():
     app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False
+        "WTF_CSRF_ENABLED": False,
+        "SQL_STATEMENT_LIMIT": 12
     })
 
     with app.app_context():
@@ -121,3 +124,639 @@ def test_delete_payment_not_found(client):
     """Test deleting a payment that does not exist."""
     response = client.post("/financial/payments/delete/999", follow_redirects=True)
     assert response.status_code == 404
+
+def test_list_payments_json_stream(client, new_patient):
+    """The payment list can be streamed as JSON."""
+    db.session.add(Payment(patient_id=new_patient.id, date=date(2025, 8, 1), value=100.0, payment_type='income'))
+    db.session.add(Payment(date=date(2025, 8, 5), value=40.0, payment_type='expense', notes="Rent"))
+    db.session.commit()
+
+    response = client.get("/financial/payments?format=json")
+    assert "Content-Length" not in response.headers
+    data = response.get_json()
+    assert [row['paymentType'] for row in data] == ['expense', 'income']
+    assert data[0]['patientName'] is None
+    assert data[1]['patientName'] == new_patient.name
+    assert data[1]['value'] == 100.0
+
+    response = client.get("/financial/payments?format=json&end_date=2025-13-01")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+# --- Monthly rollup ---
+
+def _rollup():
+    """Returns the rollup as {(month, payment_type): (total, count)}, skipping empty rows."""
+    return {
+        (row.month, row.payment_type): (float(row.total), row.payment_count)
+        for row in MonthlyFinancialRollup.query.all()
+        if row.payment_count
+    }
+
+def test_rollup_follows_payment_writes(client, new_patient):
+    """Inserts, updates and deletes of payments are reflected in the monthly rollup."""
+    income = Payment(patient_id=new_patient.id, date=date(2025, 8, 1), value=100.0, payment_type='income')
+    expense = Payment(date=date(2025, 8, 5), value=40.0, payment_type='expense')
+    db.session.add_all([income, expense, Payment(date=date(2025, 8, 20), value=60.0, payment_type='income')])
+    db.session.commit()
+    assert _rollup() == {
+        (date(2025, 8, 1), 'income'): (160.0, 2),
+        (date(2025, 8, 1), 'expense'): (40.0, 1)
+    }
+
+    income.date = date(2025, 9, 3)
+    income.value = 120.0
+    db.session.commit()
+    db.session.delete(expense)
+    db.session.commit()
+    assert _rollup() == {
+        (date(2025, 8, 1), 'income'): (60.0, 1),
+        (date(2025, 9, 1), 'income'): (120.0, 1)
+    }
+
+def test_rollup_follows_appointment_payments(client, new_patient):
+    """Payments created and removed by appointment status changes update the rollup."""
+    appointment = Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 4, 9, 0), value=150.0, status='Agendada')
+    db.session.add(appointment)
+    db.session.commit()
+
+    appointment_service.update_appointment(appointment, {
+        "date": "2025-08-04T09:00", "value": "150.00", "status": "Paga", "notes": "", "payment_date": "2025-08-06"
+    })
+    assert _rollup() == {(date(2025, 8, 1), 'income'): (150.0, 1)}
+
+    appointment_service.update_appointment(appointment, {
+        "date": "2025-08-04T09:00", "value": "150.00", "status": "Realizada", "notes": ""
+    })
+    assert _rollup() == {}
+
+def test_rebuild_financial_rollup_command(app, new_patient):
+    """The rebuild command recomputes the rollup from the payments table."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 7, 10), value=100.0, payment_type='income'),
+        Payment(date=date(2025, 8, 5), value=40.0, payment_type='expense')
+    ])
+    db.session.commit()
+    MonthlyFinancialRollup.query.delete()
+    db.session.add(MonthlyFinancialRollup(month=date(2020, 1, 1), payment_type='income', total=999, payment_count=9))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-financial-rollup"])
+    assert "2 linha(s)" in result.output
+    assert _rollup() == {
+        (date(2025, 7, 1), 'income'): (100.0, 1),
+        (date(2025, 8, 1), 'expense'): (40.0, 1)
+    }
+
+def test_dashboard_month_summary_reads_rollup(app, new_patient):
+    """Month summaries come from the rollup in a single query, regardless of payment volume."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 8, day), value=10.0, payment_type='income')
+        for day in range(1, 29)
+    ] + [Payment(date=date(2025, 8, 31), value=30.0, payment_type='expense')])
+    db.session.commit()
+
+    with count_queries() as statements:
+        summary = dashboard_service.get_dashboard_data(date(2025, 8, 15))['selected_month_summary']
+
+    assert len(statements) == 1
+    assert "monthly_financial_rollup" in statements[0]
+    assert summary == {'income': 280.0, 'expenses': 30.0, 'profit': 250.0}
+
+# --- Dashboard ---
+
+def test_dashboard_data_in_one_query(app, new_patient):
+    """The dashboard is aggregated in a single statement with the same shapes as before."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 8, 10), value=200.0, payment_type='income'),
+        Payment(date=date(2025, 8, 12), value=50.0, payment_type='expense'),
+        Payment(patient_id=new_patient.id, date=date(2025, 7, 3), value=120.0, payment_type='income'),
+        Payment(patient_id=new_patient.id, date=date(2024, 8, 3), value=999.0, payment_type='income'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 4, 9, 0), value=150.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 28, 9, 0), value=150.0, status='Agendada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 3, 3, 9, 0), value=100.0, status='Agendada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 5, 9, 0), value=150.0, status='Paga')
+    ])
+    db.session.commit()
+
+    with count_queries() as statements:
+        data = dashboard_service.get_dashboard_data(date(2025, 8, 15))
+
+    assert len(statements) == 1
+    assert data['selected_month_summary'] == {'income': 200.0, 'expenses': 50.0, 'profit': 150.0}
+    assert data['previous_month_summary'] == {'income': 120.0, 'expenses': 0.0, 'profit': 120.0}
+    assert data['active_patients'] == 1
+
+    chart = data['chart_data']
+    assert len(chart['labels']) == 12
+    assert chart['labels'][-1] == date(2025, 8, 1).strftime('%b/%Y')
+    assert chart['income_data'][-2:] == [120.0, 200.0]
+    assert chart['expense_data'][-1] == 50.0
+    assert chart['expected_revenue_realizada_data'][-1] == 150.0
+    assert chart['expected_revenue_agendada_data'][-1] == 150.0
+    assert chart['expected_revenue_agendada_data'][6] == 100.0
+
+def test_dashboard_includes_rule_based_occurrences(app, client, new_patient):
+    """Virtual occurrences of rule-based series count as expected revenue."""
+    app.config['APPOINTMENT_RECURRENCE_MODE'] = 'rule'
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-04T09:00", "value": "100.00",
+        "is_recurring": "on", "recurrence_frequency": "weekly", "recurrence_until": "2025-09-01"
+    })
+
+    chart = dashboard_service.get_dashboard_data(date(2025, 9, 1))['chart_data']
+    assert chart['expected_revenue_agendada_data'][-2:] == [400.0, 100.0]
+
+def test_dashboard_page_renders(client, new_patient):
+    """The dashboard page renders from the aggregated data."""
+    db.session.add(Payment(patient_id=new_patient.id, date=date(2025, 8, 10), value=200.0, payment_type='income'))
+    db.session.commit()
+
+    response = client.get("/dashboard?month=2025-08")
+    assert response.status_code == 200
+    assert b"R$ 200.00" in response.data
+
+# --- Month buckets ---
+
+def test_month_bucket_follows_writes(client, new_patient):
+    """month_bucket is kept in sync on ORM writes, bulk series inserts and series moves."""
+    payment = Payment(patient_id=new_patient.id, date=date(2025, 8, 31), value=10.0, payment_type='income')
+    db.session.add(payment)
+    db.session.commit()
+    assert payment.month_bucket == date(2025, 8, 1)
+    payment.date = date(2025, 9, 1)
+    db.session.commit()
+    assert payment.month_bucket == date(2025, 9, 1)
+
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-25T09:00", "value": "150.00",
+        "is_recurring": "on", "recurrence_frequency": "weekly", "recurrence_until": "2025-09-08"
+    })
+    assert [(a.date.date(), a.month_bucket) for a in Appointment.query.order_by(Appointment.date)] == [
+        (date(2025, 8, 25), date(2025, 8, 1)), (date(2025, 9, 1), date(2025, 9, 1)), (date(2025, 9, 8), date(2025, 9, 1))
+    ]
+
+    root = Appointment.query.filter_by(parent_appointment_id=None).one()
+    client.put(f"/appointments/api/{root.id}?scope=series", json={"date": "2025-08-31T09:00", "value": "150.00"})
+    assert [(a.date.date(), a.month_bucket) for a in Appointment.query.order_by(Appointment.date)] == [
+        (date(2025, 8, 31), date(2025, 8, 1)), (date(2025, 9, 7), date(2025, 9, 1)), (date(2025, 9, 14), date(2025, 9, 1))
+    ]
+
+def test_chart_runs_on_month_buckets(app, new_patient):
+    """The dashboard chart groups on the stored month bucket and runs on SQLite."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 8, 10), value=200.0, payment_type='income'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 7, 31, 23, 0), value=150.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 1, 8, 0), value=120.0, status='Agendada')
+    ])
+    db.session.commit()
+
+    chart = dashboard_service.get_dashboard_data(date(2025, 8, 15))['chart_data']
+    assert chart['income_data'][-1] == 200.0
+    assert chart['expected_revenue_realizada_data'][-2:] == [150.0, 0.0]
+    assert chart['expected_revenue_agendada_data'][-1] == 120.0
+
+def test_expected_revenue_query_uses_month_bucket_index(app, new_patient):
+    """Expected revenue is an index range scan on (status, month_bucket)."""
+    captured = captured_statements(
+        lambda: dashboard_service.get_dashboard_data(date(2025, 12, 15))
+    )
+
+    assert "ix_appointment_status_month_bucket" in query_plan(*captured[0])
+
+# --- Payments page ---
+
+def test_payments_page_running_balance(app, new_patient):
+    """Pages hold the running balance of the period up to each row, newest first."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 8, day), value=100.0, payment_type='income')
+        for day in range(1, 6)
+    ] + [Payment(date=date(2025, 8, 3), value=30.0, payment_type='expense', notes="Rent")])
+    db.session.commit()
+
+    first = financial_service.get_payments_page('2025-08-02', '2025-08-31', limit=3)
+    assert [float(row.balance) for row in first['items']] == [370.0, 270.0, 170.0]
+    assert first['items'][0].patient_name == new_patient.name
+    assert first['previous'] is None
+
+    second = financial_service.get_payments_page('2025-08-02', '2025-08-31', after=first['next'], limit=3)
+    assert [(row.date, float(row.balance)) for row in second['items']] == [
+        (date(2025, 8, 3), 200.0), (date(2025, 8, 2), 100.0)
+    ]
+    assert first['items'][2].patient_name is None
+    assert second['next'] is None
+
+    back = financial_service.get_payments_page('2025-08-02', '2025-08-31', before=second['previous'], limit=3)
+    assert [row.id for row in back['items']] == [row.id for row in first['items']]
+
+    totals = financial_service.get_period_totals('2025-08-02', '2025-08-31')
+    assert float(totals['income']) == 400.0
+    assert float(totals['expenses']) == 30.0
+    assert float(totals['total']) == 370.0
+    assert totals['count'] == 5
+
+def test_list_payments_page(client, new_patient):
+    """The list renders one page, the period total and a link to the next page in few queries."""
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 1, 1) + timedelta(days=day),
+                value=10.0, payment_type='income')
+        for day in range(financial_service.PAYMENT_PAGE_SIZE + 5)
+    ])
+    db.session.commit()
+
+    with count_queries() as statements:
+        response = client.get("/financial/payments?start_date=2025-01-01&end_date=2025-12-31")
+
+    assert response.status_code == 200
+    assert len(statements) <= 3
+    html = response.get_data(as_text=True)
+    assert "R$ 550.00" in html
+    assert "Saldo" in html
+    assert "after=" in html
+
+    assert client.get("/financial/payments?after=garbage").status_code == 400
+
+# --- Loading profiles and statement guard ---
+
+def test_payments_list_and_export_statements_do_not_grow_with_patients(client):
+    """The payments list and its export issue the same statements for 1 or 10 paying patients."""
+
+    def statements_for(url):
+        with count_queries() as statements:
+            response = client.get(url)
+            response.get_data()
+        assert response.status_code == 200
+        return len(statements)
+
+    def add_payments(first, count):
+        for index in range(first, first + count):
+            patient = Patient(name=f"Patient {index}", email=f"p{index}@x.com", phone="1", birth_date=date(1990, 1, 1))
+            db.session.add(Payment(patient=patient, date=date(2025, 8, index + 1), value=10.0, payment_type='income'))
+        db.session.commit()
+
+    add_payments(0, 1)
+    few = (statements_for("/financial/payments"), statements_for("/financial/payments/export"))
+    add_payments(1, 9)
+    many = (statements_for("/financial/payments"), statements_for("/financial/payments/export"))
+    assert many == few
+
+    html = client.get("/financial/payments").get_data(as_text=True)
+    assert all(f"Patient {index}" in html for index in range(10))
+
+def test_unknown_loading_profile(app):
+    """Unknown profile names are rejected."""
+    with pytest.raises(ValueError):
+        financial_service.get_payment_by_id(1, profile='nope')
+
+def test_statement_guard_fails_chatty_requests():
+    """In testing mode, a request issuing more statements than the limit fails."""
+    from gerenciador_psicologia.statement_guard import StatementLimitExceeded
+    guarded = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQL_STATEMENT_LIMIT": 1
+    })
+    with guarded.app_context():
+        db.create_all()
+        with pytest.raises(StatementLimitExceeded):
+            guarded.test_client().get("/financial/payments")
+        db.drop_all()
+
+def test_statement_guard_counts_streamed_responses():
+    """Statements issued while a streamed body is generated count towards the limit."""
+    from gerenciador_psicologia.statement_guard import StatementLimitExceeded
+    guarded = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQL_STATEMENT_LIMIT": 1
+    })
+    with guarded.app_context():
+        db.create_all()
+        client = guarded.test_client()
+        assert client.get("/financial/payments/export").get_data().startswith("\ufeff".encode())
+        response = client.get("/appointments/api?stream=true")
+        with pytest.raises(StatementLimitExceeded):
+            response.get_data()
+        db.drop_all()
+
+# --- Dashboard cache ---
+
+def test_dashboard_cache_is_versioned_by_financial_writes(tmp_path):
+    """The dashboard is served from the shared cache until a financial write bumps the version."""
+    from gerenciador_psicologia.services.dashboard_cache import DashboardCache
+    cached = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "DASHBOARD_CACHE_PATH": str(tmp_path / "dashboard.sqlite3")
+    })
+    with cached.app_context():
+        db.create_all()
+        client = cached.test_client()
+        client.post("/financial/payments/new", data={
+            "date": "2025-08-10", "value": "200.00", "notes": "", "payment_type": "income"
+        })
+        assert b"R$ 200.00" in client.get("/dashboard?month=2025-08").data
+
+        with count_queries() as statements:
+            assert b"R$ 200.00" in client.get("/dashboard?month=2025-08").data
+        assert statements == []
+
+        # Another worker sharing the file sees the bump
+        other_worker = DashboardCache(cached.config["DASHBOARD_CACHE_PATH"])
+        version = other_worker.version()
+        client.post("/financial/payments/new", data={
+            "date": "2025-08-11", "value": "50.00", "notes": "", "payment_type": "income"
+        })
+        assert other_worker.version() == version + 1
+        assert b"R$ 250.00" in client.get("/dashboard?month=2025-08").data
+
+        payment = Payment.query.filter_by(value=50.0).one()
+        client.post(f"/financial/payments/delete/{payment.id}")
+        assert b"R$ 200.00" in client.get("/dashboard?month=2025-08").data
+        db.drop_all()
+
+def test_dashboard_cache_ignores_results_computed_before_a_bump(tmp_path):
+    """A result computed under an old version is stored but never served."""
+    from gerenciador_psicologia.services.dashboard_cache import DashboardCache
+    cache = DashboardCache(str(tmp_path / "dashboard.sqlite3"))
+    data, version = cache.get("2025-08")
+    assert data is None
+    cache.bump()
+    cache.store("2025-08", version, {"active_patients": 1})
+    assert cache.get("2025-08") == (None, version + 1)
+    cache.store("2025-08", version + 1, {"active_patients": 2})
+    assert cache.get("2025-08") == ({"active_patients": 2}, None)
+
+def test_dashboard_cache_file_is_created_on_first_lookup(tmp_path):
+    """Building the app and writing financial data leave no cache file until the dashboard is read."""
+    path = tmp_path / "instance" / "dashboard.sqlite3"
+    cached = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "DASHBOARD_CACHE_PATH": str(path)
+    })
+    with cached.app_context():
+        db.create_all()
+        client = cached.test_client()
+        client.post("/financial/payments/new", data={
+            "date": "2025-08-10", "value": "200.00", "notes": "", "payment_type": "income"
+        })
+        assert not path.exists()
+        assert b"R$ 200.00" in client.get("/dashboard?month=2025-08").data
+        assert path.exists()
+        db.drop_all()
+
+# --- Exports ---
+
+def test_export_payments_csv(client, new_patient):
+    """Payments are exported as CSV, oldest first, filtered by date and type."""
+    import csv
+    db.session.add_all([
+        Payment(patient_id=new_patient.id, date=date(2025, 8, 1), value=100.0, payment_type='income'),
+        Payment(date=date(2025, 8, 5), value=40.0, payment_type='expense', notes="Aluguel, sala"),
+        Payment(patient_id=new_patient.id, date=date(2025, 8, 3), value=60.0, payment_type='income'),
+        Payment(patient_id=new_patient.id, date=date(2024, 1, 3), value=10.0, payment_type='income')
+    ])
+    db.session.commit()
+
+    response = client.get("/financial/payments/export?start_date=2025-01-01")
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.reader(response.get_data(as_text=True).lstrip('\ufeff').splitlines()))
+    assert rows[0][:4] == ['ID', 'Data', 'Tipo', 'Valor']
+    assert [row[1] for row in rows[1:]] == ['2025-08-01', '2025-08-03', '2025-08-05']
+    assert rows[3][6] == "Aluguel, sala"
+    assert rows[1][4] == new_patient.name
+
+    response = client.get("/financial/payments/export?start_date=2025-01-01&payment_type=income")
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+
+    assert client.get("/financial/payments/export?payment_type=gift").status_code == 400
+    assert client.get("/financial/payments/export?start_date=08/2025").status_code == 400
+    assert client.get("/financial/payments/export?format=pdf").status_code == 400
+
+# --- Bank statement import ---
+
+STATEMENT_CSV = (
+    "Data;Descrição;Valor\n"
+    "01/08/2025;Sessão Fulano;150,00\n"
+    "02/08/2025;Aluguel sala;-1.200,50\n"
+    "02/08/2025;Tarifa;-9,90\n"
+    "02/08/2025;Tarifa;-9,90\n"
+    "03/09/2025;Sessão Beltrano;R$ 200,00\n"
+)
+
+def _import(text, statement_format='csv', dry_run=False):
+    import io
+    from gerenciador_psicologia.services import statement_import
+    return statement_import.import_statement(io.BytesIO(text.encode('utf-8')), statement_format, dry_run=dry_run)
+
+def test_import_csv_statement_deduplicates(app):
+    """CSV lines become payments with their type, and re-importing skips them."""
+    preview = _import(STATEMENT_CSV, dry_run=True)
+    assert (preview['lines'], preview['new'], preview['duplicates']) == (5, 5, 0)
+    assert float(preview['income']) == 350.0
+    assert float(preview['expenses']) == 1220.3
+    assert Payment.query.count() == 0
+
+    summary = _import(STATEMENT_CSV)
+    assert summary['new'] == 5
+    # The repeated fee is two transactions, not a duplicate
+    assert Payment.query.filter_by(notes="Tarifa", payment_type='expense').count() == 2
+    rent = Payment.query.filter_by(notes="Aluguel sala").one()
+    assert (rent.date, float(rent.value), rent.month_bucket) == (date(2025, 8, 2), 1200.5, date(2025, 8, 1))
+    assert _rollup() == {
+        (date(2025, 8, 1), 'income'): (150.0, 1),
+        (date(2025, 8, 1), 'expense'): (1220.3, 3),
+        (date(2025, 9, 1), 'income'): (200.0, 1)
+    }
+
+    again = _import(STATEMENT_CSV + "04/09/2025;Sessão Ciclano;180,00\n")
+    assert (again['new'], again['duplicates']) == (1, 5)
+    assert Payment.query.count() == 6
+
+def test_import_ofx_statement(app):
+    """OFX transactions are read tag by tag and deduplicated by FITID."""
+    ofx = (
+        "OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250805120000[-3:BRT]<TRNAMT>150.00<FITID>A1<MEMO>PIX recebido</STMTTRN>\n"
+        "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20250806\n<TRNAMT>-45.10\n<FITID>A2\n<NAME>Papelaria\n</STMTTRN>\n"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+    )
+    summary = _import(ofx, 'ofx')
+    assert summary['new'] == 2
+    assert [(p.date, p.payment_type, float(p.value), p.notes) for p in Payment.query.order_by(Payment.date)] == [
+        (date(2025, 8, 5), 'income', 150.0, "PIX recebido"),
+        (date(2025, 8, 6), 'expense', 45.1, "Papelaria")
+    ]
+    assert _import(ofx, 'ofx')['duplicates'] == 2
+
+def test_import_statement_rejects_malformed_lines(app):
+    """A malformed line aborts the whole import."""
+    with pytest.raises(ValueError):
+        _import(STATEMENT_CSV + "31/02/2025;Inválida;10,00\n")
+    assert Payment.query.count() == 0
+    with pytest.raises(ValueError):
+        _import("Quando;Quanto\n01/08/2025;10\n")
+
+def test_import_statement_route(client):
+    """The import page previews a statement and then imports it."""
+    import io
+    response = client.post("/financial/payments/import", data={
+        "statement": (io.BytesIO(STATEMENT_CSV.encode('utf-8')), "extrato.csv"), "action": "preview"
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+    assert "5 nova(s)" in response.get_data(as_text=True)
+    assert Payment.query.count() == 0
+
+    response = client.post("/financial/payments/import", data={
+        "statement": (io.BytesIO(STATEMENT_CSV.encode('utf-8')), "extrato.csv"), "action": "import"
+    }, content_type="multipart/form-data", follow_redirects=True)
+    assert "Extrato importado: 5 registro(s) novo(s)" in response.get_data(as_text=True)
+    assert Payment.query.count() == 5
+
+def test_import_large_statement_in_batches(app):
+    """A 10k-line statement is imported with a query and an insert per batch."""
+    lines = ["Data,Descrição,Valor"] + [
+        f"{date(2024, 1, 1) + timedelta(days=index % 365):%d/%m/%Y},Lançamento {index},{'-' if index % 3 else ''}{index % 500 + 1}.25"
+        for index in range(10000)
+    ]
+    with count_queries() as statements:
+        summary = _import("\n".join(lines) + "\n")
+
+    assert summary['new'] == 10000
+    assert Payment.query.count() == 10000
+    assert len(statements) < 100
+
+# --- Receivables ---
+
+def test_receivables_report_ages_unpaid_sessions(client, new_patient):
+    """Completed sessions without a linked payment are grouped per patient and aging bucket."""
+    other = Patient(name="Another Patient", email="another@patient.com", phone="1", birth_date=date(1990, 1, 1))
+    db.session.add(other)
+    db.session.flush()
+    sessions = [
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 30, 9, 0), value=100.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 8, 1, 9, 0), value=110.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 7, 31, 9, 0), value=120.0, status='Realizada'),
+        Appointment(patient_id=new_patient.id, date=datetime(2025, 5, 1, 9, 0), value=130.0, status='Realizada'),
+        Appointment(patient_id=other.id, date=datetime(2025, 8, 20, 9, 0), value=500.0, status='Realizada'),
+        # Paid, scheduled or cancelled sessions are not receivables
+        Appointment(patient_id=other.id, date=datetime(2025, 8, 21, 9, 0), value=90.0, status='Realizada'),
+        Appointment(patient_id=other.id, date=datetime(2025, 8, 22, 9, 0), value=90.0, status='Agendada'),
+        Appointment(patient_id=other.id, date=datetime(2025, 8, 23, 9, 0), value=90.0, status='Realizada', is_cancelled=True)
+    ]
+    db.session.add_all(sessions)
+    db.session.flush()
+    db.session.add(Payment(patient_id=other.id, appointment_id=sessions[5].id, date=date(2025, 8, 21), value=90.0, payment_type='income'))
+    db.session.commit()
+
+    report = financial_service.get_receivables(date(2025, 8, 31))
+    assert [row.patient_name for row in report['patients']] == ["Another Patient", new_patient.name]
+    row = report['patients'][1]
+    assert row.sessions == 4
+    assert float(row.total) == 460.0
+    # 1 day, 30 days, 31 days and 122 days old
+    assert [float(getattr(row, f'bucket_{key}')) for key in ('0_30', '31_60', '61_90', '90_plus')] == [210.0, 120.0, 0, 130.0]
+    assert report['totals']['sessions'] == 5
+    assert float(report['totals']['total']) == 960.0
+    assert float(report['totals']['bucket_0_30']) == 710.0
+
+    response = client.get("/financial/receivables?as_of=2025-08-31")
+    assert response.status_code == 200
+    assert "R$ 960.00" in response.get_data(as_text=True)
+    assert client.get("/financial/receivables?as_of=ontem").status_code == 400
+
+def test_receivables_query_is_an_indexed_anti_join(app):
+    """The report probes the payment index on appointment_id instead of scanning payments."""
+    captured = captured_statements(
+        lambda: financial_service.get_receivables(date(2025, 8, 31))
+    )
+
+    assert len(captured) == 1
+    statement, parameters = captured[0]
+    assert "NOT (EXISTS" in statement
+    if db.engine.dialect.name != 'postgresql':
+        plan = query_plan(statement, parameters)
+        assert "ix_payment_appointment_id" in plan
+        assert "ix_appointment_status" in plan
+
+# --- Revenue forecast ---
+
+def test_revenue_forecast_projects_open_ended_series(app, client, new_patient):
+    """Open-ended series keep contributing after their stored occurrences run out."""
+    from gerenciador_psicologia.services import forecast
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-01-06T09:00", "value": "100.00",
+        "is_recurring": "on", "recurrence_frequency": "weekly", "no_end_date": "on"
+    })
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-01-31T10:00", "value": "300.00",
+        "is_recurring": "on", "recurrence_frequency": "monthly", "recurrence_until": "2026-04-15"
+    })
+    # The 52 stored weekly occurrences end in January 2026
+    assert Appointment.query.filter(Appointment.value == 100, Appointment.date >= datetime(2026, 2, 1)).count() == 0
+
+    # Mondays: 5 in March, 4 in April and May, 5 in June 2026; the monthly series ends in March
+    projected = forecast.get_revenue_forecast(date(2026, 3, 1), 4)
+    assert projected == [800.0, 400.0, 400.0, 500.0]
+
+    with pytest.raises(ValueError):
+        forecast.get_revenue_forecast(date(2026, 3, 1), 25)
+
+    new_patient.is_active = False
+    db.session.commit()
+    assert forecast.get_revenue_forecast(date(2026, 3, 1), 3) == [0.0, 0.0, 0.0]
+
+def test_revenue_forecast_follows_series_edits(app, client, new_patient):
+    """A 'following' edit of a materialised series changes the forecast from the edited session on."""
+    from gerenciador_psicologia.services import forecast
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2026-01-05T09:00", "value": "100.00",
+        "is_recurring": "on", "recurrence_frequency": "weekly", "no_end_date": "on"
+    })
+    pivot = Appointment.query.filter_by(date=datetime(2026, 3, 2, 9, 0)).one()
+    appointment_service.update_appointment_scope(pivot, {
+        "date": "2026-03-03T10:00", "value": "200.00", "notes": ""
+    }, scope='following')
+
+    # Mondays of February at 100, then Tuesdays from 3 March at 200: 5 in March, 4 in April and May
+    assert forecast.get_revenue_forecast(date(2026, 2, 1), 4) == [400.0, 1000.0, 800.0, 800.0]
+    # After the stored occurrences (the last one on 5 Jan 2027) the rule keeps the new day and value
+    assert forecast.get_revenue_forecast(date(2027, 1, 1), 3) == [800.0, 800.0, 1000.0]
+
+def test_monthly_forecast_matches_occurrences_for_month_end_starts(app):
+    """Month-end series keep the clamped day after a short month, exactly like iter_occurrences."""
+    import numpy as np
+    from gerenciador_psicologia.services import forecast, recurrence
+    window_start = np.datetime64('2025-06', 'M')
+    for day in (29, 30, 31):
+        first = date(2024, 8, day)
+        until = date(2025, 6, 28)
+        projected = forecast.project_revenue(
+            np.array([first], dtype='datetime64[D]'), np.array(['monthly'], dtype=object),
+            np.array([-1]), np.array([until], dtype='datetime64[D]'), np.array([100.0]),
+            window_start, 3
+        ).tolist()
+        occurrences = recurrence.iter_occurrences(datetime.combine(first, datetime.min.time()), 'monthly', until=until)
+        june = [occurrence for occurrence in occurrences if occurrence.month == 6 and occurrence.year == 2025]
+        # February clamps the day to 28, so June's occurrence falls on the 28th
+        assert june == [datetime(2025, 6, 28)]
+        assert projected == [100.0, 0.0, 0.0]
+
+def test_dashboard_includes_forecast_series(app, client, new_patient):
+    """The dashboard chart carries a forecast for the months after the selected one."""
+    app.config['FORECAST_MONTHS'] = 3
+    client.post("/appointments/new", data={
+        "patient_id": new_patient.id, "date": "2025-08-04T09:00", "value": "100.00",
+        "is_recurring": "on", "recurrence_frequency": "biweekly", "no_end_date": "on"
+    })
+
+    chart = dashboard_service.get_dashboard_data(date(2025, 8, 15))['chart_data']
+    assert chart['forecast_labels'] == [date(2025, month, 1).strftime('%b/%Y') for month in (9, 10, 11)]
+    # Every other Monday from 4 Aug: 1 and 15 and 29 Sep, 13 and 27 Oct, 10 and 24 Nov
+    assert chart['forecast_data'] == [300.0, 200.0, 200.0]
+
+    response = client.get("/dashboard?month=2025-08")
+    assert "Previsão" in response.get_data(as_text=True)
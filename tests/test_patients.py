@@ -2,6 +2,7 @@ import pytest
 from datetime import date
 from gerenciador_psicologia.app import create_app, db
 from gerenciador_psicologia.models import Patient
+from conftest import count_queries, captured_statements, query_plan
 
 @pytest.fixture
 def app():
@@ -9,7 +10,8 @@ def app():
     app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False  # Disable CSRF for testing
+        "WTF_CSRF_ENABLED": False,  # Disable CSRF for testing
+        "SQL_STATEMENT_LIMIT": 12
     })
 
     with app.app_context():
@@ -130,3 +132,403 @@ def test_activate_patient_success(client):
     assert response.status_code == 200
     assert b"Paciente ativado com sucesso!" in response.data
     assert db.session.get(Patient, patient.id).is_active
+
+def _add_patients(*people):
+    for name, email in people:
+        db.session.add(Patient(name=name, email=email, phone="1", birth_date=date(1990, 1, 1)))
+    db.session.commit()
+
+def test_search_patients_ranked(client):
+    """The search matches substrings of the name or email and ranks name matches first."""
+    _add_patients(("Ana Maria", "ana@example.com"), ("Mariana Souza", "ms@example.com"),
+                  ("João Silva", "joao@maria.com"), ("Pedro", "pedro@example.com"))
+
+    response = client.get("/?search=Maria")
+    html = response.get_data(as_text=True)
+    assert "Pedro" not in html
+    assert html.index("Ana Maria") < html.index("João Silva")
+    assert html.index("Mariana Souza") < html.index("João Silva")
+
+    # Terms shorter than a trigram fall back to a scan, name prefixes first
+    response = client.get("/?search=ma")
+    html = response.get_data(as_text=True)
+    assert html.index("Mariana Souza") < html.index("Ana Maria")
+
+def test_search_index_follows_patient_writes(client):
+    """The FTS5 shadow table is kept in sync by triggers."""
+    from gerenciador_psicologia.services import patient_service
+    _add_patients(("Ana Maria", "ana@example.com"), ("Carla", "carla@example.com"))
+
+    def search(term):
+        return [patient.name for patient in patient_service.search_patients(Patient.query, term)]
+
+    carla = Patient.query.filter_by(name="Carla").one()
+    carla.name = "Carla Mariano"
+    db.session.commit()
+    assert search("mari") == ["Ana Maria", "Carla Mariano"]
+
+    db.session.delete(Patient.query.filter_by(name="Ana Maria").one())
+    db.session.commit()
+    assert search("mari") == ["Carla Mariano"]
+    assert search("100%") == []
+
+    patient_service.rebuild_search_index()
+    assert search("carla@") == ["Carla Mariano"]
+
+def test_search_ignores_accents_case_and_phone_format(client):
+    """The search runs against the stored normalized name, email and phone."""
+    from gerenciador_psicologia.services import patient_service
+    db.session.add(Patient(name="João da Conceição", email="Joao.C@Example.com",
+                           phone="(11) 98765-4321", birth_date=date(1990, 1, 1)))
+    db.session.add(Patient(name="Pedro", email="pedro@example.com", phone="2233", birth_date=date(1990, 1, 1)))
+    db.session.commit()
+
+    joao = Patient.query.filter_by(name="João da Conceição").one()
+    assert (joao.name_normalized, joao.email_normalized, joao.phone_normalized) == \
+        ("joao da conceicao", "joao.c@example.com", "11987654321")
+
+    def search(term):
+        return [patient.name for patient in patient_service.search_patients(Patient.query, term)]
+
+    assert search("joao") == ["João da Conceição"]
+    assert search("CONCEICAO") == ["João da Conceição"]
+    assert search("conceição") == ["João da Conceição"]
+    assert search("98765-43") == ["João da Conceição"]
+    assert search("jo") == ["João da Conceição"]
+    assert search("pedro 98765") == []
+
+    # The normalized columns follow edits made through the ORM
+    joao.name = "Conceição Álvares"
+    db.session.commit()
+    assert search("alvares") == ["Conceição Álvares"]
+    assert search("joao") == ["Conceição Álvares"]  # still matches the email
+
+    response = client.get("/?search=alvares")
+    assert "Conceição Álvares" in response.get_data(as_text=True)
+
+def test_search_uses_fts_index(app):
+    """On SQLite the search is answered by the FTS5 table instead of scanning patient."""
+    from gerenciador_psicologia.services import patient_service
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip("FTS5 is the SQLite search index")
+    captured = captured_statements(
+        lambda: patient_service.search_patients(Patient.query, "maria").all()
+    )
+
+    plan = query_plan(*captured[0])
+    assert "VIRTUAL TABLE INDEX" in plan
+    assert "SEARCH patient USING INTEGER PRIMARY KEY" in plan
+
+def test_search_scores_a_bounded_number_of_candidates(app, monkeypatch):
+    """Only the SEARCH_CANDIDATE_LIMIT best ranked FTS matches are joined on SQLite."""
+    from gerenciador_psicologia.services import patient_service
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip("FTS5 is the SQLite search index")
+    _add_patients(("Mariana Souza", "ms@example.com"), ("Ana Maria", "ana@example.com"),
+                  ("Maria", "maria@example.com"))
+    monkeypatch.setattr(patient_service, "SEARCH_CANDIDATE_LIMIT", 2)
+
+    names = [patient.name for patient in patient_service.search_patients(Patient.query, "maria")]
+    assert names == ["Maria", "Ana Maria"]
+
+def test_search_filters_status_before_the_candidate_cap(client, monkeypatch):
+    """Inactive matches beyond the cap do not hide the active ones."""
+    from gerenciador_psicologia.services import patient_service
+    monkeypatch.setattr(patient_service, "SEARCH_CANDIDATE_LIMIT", 5)
+    for index in range(8):
+        db.session.add(Patient(name=f"Maria {index}", email=f"m{index}@example.com", phone="1",
+                               birth_date=date(1990, 1, 1), is_active=False))
+    db.session.add(Patient(name="Maria Ativa", email="ativa@example.com", phone="1", birth_date=date(1990, 1, 1)))
+    db.session.commit()
+
+    assert "Maria Ativa" in client.get("/?search=maria").get_data(as_text=True)
+    assert [patient["name"] for patient in client.get("/patient/autocomplete?q=ari").get_json()] == ["Maria Ativa"]
+    inactive = patient_service.get_patients_page(active=False, search="maria")["items"]
+    assert len(inactive) == 5
+
+def test_patient_list_keyset_pages(client):
+    """The list is paginated by (name, id) and returns compact read-model rows."""
+    from gerenciador_psicologia.services import patient_service
+    _add_patients(*[(f"Paciente {index:02d}", f"p{index}@example.com") for index in range(7)])
+    db.session.add(Patient(name="Paciente 03", email="dup@example.com", phone="1",
+                           birth_date=date(1990, 1, 1), notes="x" * 10000))
+    db.session.add(Patient(name="Inativo", email="i@example.com", phone="1",
+                           birth_date=date(1990, 1, 1), is_active=False))
+    db.session.commit()
+
+    first = patient_service.get_patients_page(limit=3)
+    assert all(isinstance(row, patient_service.PatientRow) for row in first['items'])
+    assert not hasattr(first['items'][0], 'notes')
+    assert [row.name for row in first['items']] == ["Paciente 00", "Paciente 01", "Paciente 02"]
+    assert first['previous'] is None
+
+    second = patient_service.get_patients_page(after=first['next'], limit=3)
+    # Duplicated names are ordered by id and not skipped between pages
+    assert [row.email for row in second['items']] == ["p3@example.com", "dup@example.com", "p4@example.com"]
+
+    third = patient_service.get_patients_page(after=second['next'], limit=3)
+    assert [row.name for row in third['items']] == ["Paciente 05", "Paciente 06"]
+    assert third['next'] is None
+
+    back = patient_service.get_patients_page(before=third['previous'], limit=3)
+    assert back['items'] == second['items']
+
+    inactive = patient_service.get_patients_page(active=False)
+    assert [row.name for row in inactive['items']] == ["Inativo"]
+
+def test_patient_list_route_pages(client):
+    """The index renders one page and links to the next one."""
+    from gerenciador_psicologia.services import patient_service
+    _add_patients(*[(f"Paciente {index:03d}", f"p{index}@example.com")
+                    for index in range(patient_service.PATIENT_PAGE_SIZE + 5)])
+
+    response = client.get("/")
+    html = response.get_data(as_text=True)
+    assert "Paciente 049" in html
+    assert "Paciente 050" not in html
+    assert "Próximos" in html
+
+    response = client.get("/?after=" + patient_service.get_patients_page()['next'])
+    html = response.get_data(as_text=True)
+    assert "Paciente 050" in html and "Paciente 054" in html
+    assert "Paciente 049" not in html
+
+    assert client.get("/?after=invalido").status_code == 400
+
+def test_patient_list_loads_only_displayed_columns(app):
+    """The list query selects the displayed columns, never notes."""
+    from gerenciador_psicologia.services import patient_service
+    with count_queries() as statements:
+        patient_service.get_patients_page()
+        patient_service.get_all_patients()
+
+    # List page and all patients
+    assert len(statements) == 2
+    assert all("notes" not in statement for statement in statements)
+
+def test_patient_autocomplete(client):
+    """The autocomplete returns active patients, name prefixes first, capped at the limit."""
+    db.session.add(Patient(name="João Conceição", email="jc@example.com", phone="(11) 98765-4321",
+                           birth_date=date(1990, 1, 1)))
+    db.session.add(Patient(name="Ana Joana", email="ana@example.com", phone="1", birth_date=date(1990, 1, 1)))
+    db.session.add(Patient(name="Joaquim", email="jq@example.com", phone="1", birth_date=date(1990, 1, 1),
+                           is_active=False))
+    db.session.commit()
+
+    response = client.get("/patient/autocomplete?q=JOA")
+    assert response.status_code == 200
+    assert [patient["name"] for patient in response.get_json()] == ["João Conceição", "Ana Joana"]
+    assert set(response.get_json()[0]) == {"id", "name", "email"}
+
+    assert [p["name"] for p in client.get("/patient/autocomplete?q=conceicao").get_json()] == ["João Conceição"]
+    assert [p["name"] for p in client.get("/patient/autocomplete?q=98765").get_json()] == ["João Conceição"]
+    assert [p["name"] for p in client.get("/patient/autocomplete?q=joa&limit=1").get_json()] == ["João Conceição"]
+    assert client.get("/patient/autocomplete?q=").get_json() == []
+
+def test_patient_autocomplete_cache(app):
+    """Repeated terms are served from the LRU cache until a patient is written."""
+    from gerenciador_psicologia.services import patient_service
+    _add_patients(("Mariana", "m@example.com"))
+
+    with count_queries() as statements:
+        assert [p["name"] for p in patient_service.autocomplete_patients("mar")] == ["Mariana"]
+        executed = len(statements)
+        assert [p["name"] for p in patient_service.autocomplete_patients("Már")] == ["Mariana"]
+        assert len(statements) == executed
+
+    patient_service.create_patient({"name": "Marta", "email": "marta@example.com", "phone": "1",
+                                    "birth_date": "1990-01-01", "notes": ""})
+    assert [p["name"] for p in patient_service.autocomplete_patients("mar")] == ["Mariana", "Marta"]
+
+def test_patient_autocomplete_prefix_uses_index(app):
+    """The prefix lookup is a range scan of the name_normalized index."""
+    from gerenciador_psicologia.services import patient_service
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip("checks the SQLite query plan")
+    query = db.select(Patient.id).where(patient_service._prefix_condition(Patient.name_normalized, "jo"))
+    compiled = query.compile(db.engine, compile_kwargs={"literal_binds": True})
+    plan = query_plan(str(compiled))
+    assert "ix_patient_name_normalized" in plan
+
+def test_forms_do_not_list_patients(client):
+    """The forms render the autocomplete field instead of an option per patient."""
+    _add_patients(("Paciente Listado", "listado@example.com"))
+    for url in ("/appointments/new", "/financial/payments/new"):
+        html = client.get(url).get_data(as_text=True)
+        assert "data-patient-autocomplete" in html
+        assert "Paciente Listado" not in html
+
+def _summary(patient_id):
+    from gerenciador_psicologia.models import PatientSummary
+    db.session.expire_all()
+    return db.session.get(PatientSummary, patient_id)
+
+def _list_row(patient_id):
+    from gerenciador_psicologia.services import patient_service
+    patient = db.session.get(Patient, patient_id)
+    rows = patient_service.get_patients_page(active=patient.is_active)['items']
+    return next(row for row in rows if row.id == patient_id)
+
+def _appointment_form(when, status='Agendada', value='120.00', **fields):
+    return {"date": when.strftime('%Y-%m-%dT%H:%M'), "value": value, "status": status, "notes": "", **fields}
+
+def test_patient_summary_follows_writes(app):
+    """The appointment and payment services refresh the summary of their patient before committing."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment
+    from gerenciador_psicologia.services import appointment_service, patient_service
+    _add_patients(("Ana", "ana@example.com"))
+    patient = Patient.query.one()
+    patient_id = patient.id
+    now = datetime.now().replace(second=0, microsecond=0)
+    past_date, future_date = now - timedelta(hours=2), now + timedelta(hours=2)
+
+    assert _summary(patient_id) is None
+
+    for when in (past_date, future_date):
+        appointment_service.create_appointment(dict(_appointment_form(when), patient_id=patient_id))
+    past, future = Appointment.query.order_by(Appointment.date)
+    assert _summary(patient_id).next_session == future_date
+
+    appointment_service.update_appointment(past, _appointment_form(past_date, 'Realizada'))
+    row = _list_row(patient_id)
+    assert (row.last_session, row.next_session, row.open_balance) == (past_date, future_date, 120)
+
+    appointment_service.update_appointment(past, _appointment_form(past_date, 'Paga', payment_date=now.date().isoformat()))
+    assert _summary(patient_id).open_balance == 0
+    # Going back to completed deletes the payment and reopens the balance
+    appointment_service.update_appointment(past, _appointment_form(past_date, 'Realizada'))
+    assert _summary(patient_id).open_balance == 120
+
+    appointment_service.delete_appointment(future)
+    assert _list_row(patient_id).next_session is None
+
+    patient_service.delete_patient(patient)
+    assert _summary(patient_id) is None
+
+def test_patient_summary_matches_rebuild(app):
+    """Series-wide edits and deletes leave the same summaries as a full rebuild."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment, PatientSummary
+    from gerenciador_psicologia.services import appointment_service, patient_summary
+    _add_patients(("Ana", "ana@example.com"), ("Bruno", "bruno@example.com"))
+    ana, bruno = Patient.query.order_by(Patient.name)
+    start = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    for patient, hour in ((ana, 9), (bruno, 11)):
+        appointment_service.create_appointment(dict(
+            _appointment_form(start.replace(hour=hour), value='100.00'),
+            patient_id=patient.id,
+            is_recurring="on",
+            recurrence_frequency="weekly",
+            recurrence_until=(start + timedelta(days=60)).date().isoformat()
+        ))
+
+    def sessions(patient):
+        return Appointment.query.filter_by(patient_id=patient.id).order_by(Appointment.date).all()
+
+    first = sessions(ana)[0]
+    appointment_service.update_appointment(first, _appointment_form(first.date, 'Realizada', value='100.00'))
+    pivot = sessions(ana)[2]
+    appointment_service.update_appointment_scope(pivot, _appointment_form(pivot.date, value='130.00'), scope='following')
+    appointment_service.delete_appointment_scope(sessions(bruno)[3], scope='following')
+
+    def summaries():
+        db.session.expire_all()
+        return {
+            row.patient_id: (row.last_session, row.next_session, row.month, row.sessions_this_month, row.open_balance)
+            for row in PatientSummary.query
+        }
+
+    kept = summaries()
+    assert kept[ana.id][-1] == 100
+    patient_summary.rebuild_summaries()
+    assert summaries() == kept
+
+def test_patient_summary_refreshes_stale_rows(app):
+    """Values the clock made stale are hidden by the list and recomputed by the scheduled refresh."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment
+    from gerenciador_psicologia.services import patient_summary
+    _add_patients(("Ana", "ana@example.com"))
+    patient = Patient.query.one()
+    now = datetime.now().replace(second=0, microsecond=0)
+    dates = [now - timedelta(minutes=30), now + timedelta(days=40)]
+    db.session.add_all(Appointment(patient_id=patient.id, date=when, value=100) for when in dates)
+    db.session.commit()
+
+    # Computed 45 days ago: the next session has started since and the month is over
+    patient_summary.refresh([patient.id], now=now - timedelta(days=45))
+    db.session.commit()
+    row = _list_row(patient.id)
+    assert (row.next_session, row.sessions_this_month) == (None, None)
+
+    assert patient_summary.refresh_stale_summaries() == 1
+    row = _list_row(patient.id)
+    assert row.next_session == dates[1]
+    assert row.sessions_this_month == sum((when.year, when.month) == (now.year, now.month) for when in dates)
+    assert patient_summary.refresh_stale_summaries() == 0
+
+def test_patient_list_does_not_write(client):
+    """Reading the list only selects."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment
+    from gerenciador_psicologia.services import patient_summary
+    _add_patients(("Ana", "ana@example.com"))
+    patient = Patient.query.one()
+    yesterday = datetime.now().replace(second=0, microsecond=0) - timedelta(days=1)
+    db.session.add_all([
+        Appointment(patient_id=patient.id, date=yesterday, value=100, status='Realizada'),
+        Appointment(patient_id=patient.id, date=yesterday + timedelta(hours=2), value=100, status='Agendada'),
+        Appointment(patient_id=patient.id, date=yesterday + timedelta(hours=4), value=100, status='Realizada',
+                    is_cancelled=True),
+    ])
+    patient_summary.refresh([patient.id])
+    db.session.commit()
+
+    with count_queries() as statements:
+        assert client.get("/").status_code == 200
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+
+    # Neither the cancelled nor the session that did not take place is the last one
+    assert _list_row(patient.id).last_session == yesterday
+
+def test_patient_list_shows_summary(client):
+    """The list reads the summaries with one join, without subqueries, whatever the number of patients."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment
+    from gerenciador_psicologia.services import patient_summary
+    _add_patients(*[(f"Paciente {index}", f"p{index}@example.com") for index in range(5)])
+    next_week = (datetime.now() + timedelta(days=7)).replace(hour=10, minute=0, second=0, microsecond=0)
+    last_week = next_week - timedelta(days=14)
+    for patient in Patient.query:
+        db.session.add(Appointment(patient_id=patient.id, date=next_week, value=150))
+        db.session.add(Appointment(patient_id=patient.id, date=last_week, value=150, status='Realizada'))
+    patient_summary.refresh([patient.id for patient in Patient.query])
+    db.session.commit()
+
+    with count_queries() as statements:
+        html = client.get("/").get_data(as_text=True)
+
+    assert html.count(next_week.strftime('%d/%m/%Y %H:%M')) == 5
+    assert html.count("R$ 150.00") == 5
+    [statement] = [statement for statement in statements if "patient_summary" in statement]
+    assert statement.upper().count("SELECT") == 1
+
+    # The rebuild command recomputes the same rows
+    assert patient_summary.rebuild_summaries() == 5
+
+def test_patient_summary_after_deactivation(client):
+    """Deactivating a patient deletes their future sessions, which leave the list."""
+    from datetime import datetime, timedelta
+    from gerenciador_psicologia.models import Appointment
+    from gerenciador_psicologia.services import patient_summary
+    _add_patients(("Ana", "ana@example.com"))
+    patient = Patient.query.one()
+    db.session.add(Appointment(patient_id=patient.id, date=datetime.now() + timedelta(days=3), value=100))
+    patient_summary.refresh([patient.id])
+    db.session.commit()
+    assert _list_row(patient.id).next_session is not None
+
+    client.post(f"/patient/{patient.id}/deactivate")
+    db.session.expire_all()
+    assert _list_row(patient.id).next_session is None